@@ -0,0 +1,26 @@
+"""Add rendition checkpoints
+
+Revision ID: 3c1f2a9d4e57
+Revises: 7b7b708a7b1b
+Create Date: 2026-10-19 10:12:04.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3c1f2a9d4e57'
+down_revision = '7b7b708a7b1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('renditions', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('images', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('images', 'idempotency_key')
+    op.drop_column('images', 'renditions')
@@ -0,0 +1,28 @@
+"""Add queue lanes
+
+Revision ID: 4a6f2e9c0d15
+Revises: e7c3a95d1b28
+Create Date: 2026-10-19 21:14:52.307419
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4a6f2e9c0d15'
+down_revision = 'e7c3a95d1b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'queue_lanes',
+        sa.Column('queue', sa.String(length=255), nullable=False),
+        sa.Column('declared_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('queue'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('queue_lanes')
@@ -0,0 +1,98 @@
+"""Partition images by created_at
+
+Revision ID: 5d8a0c7e2f14
+Revises: 9e4b6d2c81a3
+Create Date: 2026-10-19 17:05:22.630419
+
+Rebuilds ``images`` as a table range-partitioned by month on
+``created_at``. The primary key becomes (id, created_at), as PostgreSQL
+requires the partition key in unique constraints. Existing ids are recorded
+in ``image_partition_hints`` so lookups by id can still be pruned to one
+partition. Rows are copied, so run it in a maintenance window.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d8a0c7e2f14'
+down_revision = '9e4b6d2c81a3'
+branch_labels = None
+depends_on = None
+
+BANDS = 4
+MONTHS_AHEAD = 3
+
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_images_partition(month date) RETURNS text AS $$
+DECLARE
+    start date := date_trunc('month', month);
+    name text := 'images_p' || to_char(start, 'YYYYMM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF images FOR VALUES FROM (%L) TO (%L)',
+        name, start, start + interval '1 month'
+    );
+    RETURN name;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _band_indexes(table: str, create: bool) -> None:
+    for index in range(BANDS):
+        name = op.f(f'ix_{table}_phash_band{index}')
+        if create:
+            op.create_index(name, table, [f'phash_band{index}'], unique=False)
+        else:
+            op.drop_index(name, table_name=table)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE images RENAME TO images_unpartitioned")
+    op.execute("ALTER TABLE images_unpartitioned RENAME CONSTRAINT images_pkey TO images_unpartitioned_pkey")
+    _band_indexes('images', create=False)
+
+    op.execute("""
+        CREATE TABLE images (LIKE images_unpartitioned INCLUDING DEFAULTS)
+        PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER TABLE images ADD PRIMARY KEY (id, created_at)")
+    _band_indexes('images', create=True)
+    op.execute(CREATE_PARTITION_FUNCTION)
+    # Catches rows outside every monthly partition, so inserts never fail
+    # if the maintenance job falls behind.
+    op.execute("CREATE TABLE images_default PARTITION OF images DEFAULT")
+    op.execute(f"""
+        SELECT create_images_partition(month::date)
+        FROM generate_series(
+            date_trunc('month', LEAST(
+                (SELECT min(created_at) FROM images_unpartitioned), now()::timestamp
+            )),
+            date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+            interval '1 month'
+        ) AS month
+    """)
+    op.execute("INSERT INTO images SELECT * FROM images_unpartitioned")
+
+    op.create_table(
+        'image_partition_hints',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute("INSERT INTO image_partition_hints (id, created_at) SELECT id, created_at FROM images_unpartitioned")
+    op.drop_table('images_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE images RENAME TO images_partitioned")
+    op.execute("ALTER TABLE images_partitioned RENAME CONSTRAINT images_pkey TO images_partitioned_pkey")
+    _band_indexes('images', create=False)
+    op.execute("CREATE TABLE images (LIKE images_partitioned INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO images SELECT * FROM images_partitioned")
+    op.execute("ALTER TABLE images ADD PRIMARY KEY (id)")
+    _band_indexes('images', create=True)
+    op.execute("DROP TABLE images_partitioned CASCADE")
+    op.execute("DROP FUNCTION create_images_partition(date)")
+    op.drop_table('image_partition_hints')
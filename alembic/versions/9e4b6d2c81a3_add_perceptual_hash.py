@@ -0,0 +1,31 @@
+"""Add perceptual hash
+
+Revision ID: 9e4b6d2c81a3
+Revises: 3c1f2a9d4e57
+Create Date: 2026-10-19 14:37:51.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9e4b6d2c81a3'
+down_revision = '3c1f2a9d4e57'
+branch_labels = None
+depends_on = None
+
+BANDS = 4
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('phash', sa.BigInteger(), nullable=True))
+    for index in range(BANDS):
+        op.add_column('images', sa.Column(f'phash_band{index}', sa.Integer(), nullable=True))
+        op.create_index(op.f(f'ix_images_phash_band{index}'), 'images', [f'phash_band{index}'], unique=False)
+
+
+def downgrade() -> None:
+    for index in reversed(range(BANDS)):
+        op.drop_index(op.f(f'ix_images_phash_band{index}'), table_name='images')
+        op.drop_column('images', f'phash_band{index}')
+    op.drop_column('images', 'phash')
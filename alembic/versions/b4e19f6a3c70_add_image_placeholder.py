@@ -0,0 +1,23 @@
+"""Add image placeholder
+
+Revision ID: b4e19f6a3c70
+Revises: 5d8a0c7e2f14
+Create Date: 2026-10-19 18:12:40.215836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b4e19f6a3c70'
+down_revision = '5d8a0c7e2f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('placeholder', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('images', 'placeholder')
@@ -0,0 +1,23 @@
+"""Add image tenant
+
+Revision ID: e7c3a95d1b28
+Revises: b4e19f6a3c70
+Create Date: 2026-10-19 19:03:11.584207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3a95d1b28'
+down_revision = 'b4e19f6a3c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('tenant', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('images', 'tenant')
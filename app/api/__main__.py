@@ -1,12 +1,4 @@
-import uvicorn
-
-from app.config import settings
+from app.api.server import run
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.api.main:app",
-        host=settings.api_host,
-        port=settings.api_port,
-        reload=True,
-        log_level=settings.log_level.lower()
-    )
+    run()
@@ -0,0 +1,204 @@
+"""Admission control for uploads.
+
+An upload is turned away before its body is read when the processing queue
+is already too deep, or would take too long to drain, to finish it in
+reasonable time (503), and when its client exceeds its own upload rate
+(429). Both answers carry ``Retry-After``. Shedding at the door keeps the
+latency of admitted uploads bounded and keeps originals that could not be
+processed soon off the disk.
+
+Queue depth comes from a passive queue declare, refreshed at most every
+``admission_refresh_interval`` seconds rather than per request. Throughput
+is estimated from how fast the queue shrinks relative to what this process
+published; with several API processes each sees only its own publishes, so
+the estimate errs low and shedding errs on the safe side.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from app.config import settings
+from app.services.rabbitmq import RabbitMQService, rabbitmq_service
+from app.utils.metrics import QUEUE_DEPTH, UPLOAD_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+Clock = Callable[[], float]
+
+
+@dataclass
+class Rejection:
+    status_code: int
+    reason: str
+    retry_after: float
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+    @property
+    def detail(self) -> str:
+        if self.status_code == 429:
+            return "Too many uploads, retry later"
+        return "Service is overloaded, retry later"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token; return 0 on success, else seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientRateLimiter:
+    """Token bucket per client, for the most recently seen ``max_clients``."""
+
+    def __init__(self, max_clients: int = 10000, clock: Clock = time.monotonic) -> None:
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, client: str) -> float:
+        rate = settings.upload_rate_limit
+        if rate <= 0:
+            return 0.0
+        now = self.clock()
+        bucket = self._buckets.get(client)
+        if bucket is None or bucket.rate != rate:
+            bucket = TokenBucket(rate, max(1, settings.upload_rate_burst), now)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(now)
+
+
+class AdmissionController:
+    def __init__(
+        self, rabbitmq: RabbitMQService, clock: Clock = time.monotonic
+    ) -> None:
+        self.rabbitmq = rabbitmq
+        self.clock = clock
+        self.limiter = ClientRateLimiter(clock=clock)
+        self.queue_depth: Optional[int] = None
+        self.throughput = 0.0
+        self._published = 0
+        self._sampled_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            settings.admission_max_queue_depth > 0
+            or settings.admission_max_queue_wait > 0
+        )
+
+    def record_publish(self) -> None:
+        self._published += 1
+
+    @property
+    def estimated_wait(self) -> Optional[float]:
+        """Seconds until the current backlog is drained, if throughput is known."""
+        if self.queue_depth is None or self.throughput <= 0:
+            return None
+        return self.queue_depth / self.throughput
+
+    def _sample(self, depth: int, now: float) -> None:
+        if self._sampled_at is not None and self.queue_depth is not None:
+            elapsed = now - self._sampled_at
+            if elapsed > 0:
+                consumed = max(0, self.queue_depth + self._published - depth)
+                rate = consumed / elapsed
+                self.throughput = (
+                    rate if not self.throughput else 0.3 * rate + 0.7 * self.throughput
+                )
+        self.queue_depth = depth
+        self._published = 0
+        self._sampled_at = now
+        QUEUE_DEPTH.set(depth)
+
+    async def refresh(self) -> None:
+        now = self.clock()
+        if (
+            self._sampled_at is not None
+            and now - self._sampled_at < settings.admission_refresh_interval
+        ):
+            return
+        async with self._refresh_lock:
+            # Another request may have refreshed while this one waited.
+            if (
+                self._sampled_at is not None
+                and self.clock() - self._sampled_at
+                < settings.admission_refresh_interval
+            ):
+                return
+            try:
+                depth, _ = await self.rabbitmq.get_queue_stats()
+            except Exception as e:
+                # Fail open: if the broker is down the publish fails anyway,
+                # with a clearer error than a made-up backlog.
+                logger.warning(
+                    "Could not read queue depth for admission control: %s", e
+                )
+                self._sampled_at = self.clock()
+                return
+            self._sample(depth, self.clock())
+
+    def _check_backlog(self) -> Optional[Rejection]:
+        depth = self.queue_depth
+        if depth is None:
+            return None
+        interval = settings.admission_refresh_interval
+        max_depth = settings.admission_max_queue_depth
+        if max_depth > 0 and depth >= max_depth:
+            excess = depth - max_depth + 1
+            retry = (
+                excess / self.throughput
+                if self.throughput > 0
+                else settings.admission_retry_after
+            )
+            return Rejection(503, "queue_depth", max(retry, interval))
+        max_wait = settings.admission_max_queue_wait
+        wait = self.estimated_wait
+        if max_wait > 0 and wait is not None and wait > max_wait:
+            return Rejection(503, "queue_wait", max(wait - max_wait, interval))
+        return None
+
+    async def admit(self, client: str) -> Optional[Rejection]:
+        """None if the upload may proceed, otherwise why and for how long it may not."""
+        rejection = None
+        if self.enabled:
+            await self.refresh()
+            rejection = self._check_backlog()
+        if rejection is None:
+            retry = self.limiter.check(client)
+            if retry > 0:
+                rejection = Rejection(429, "rate_limit", retry)
+        if rejection is not None:
+            UPLOAD_REJECTIONS.inc(reason=rejection.reason)
+            logger.info(
+                "Rejected upload from %s (%s), retry after %ss",
+                client,
+                rejection.reason,
+                rejection.retry_after_header,
+            )
+        return rejection
+
+
+admission_controller = AdmissionController(rabbitmq_service)
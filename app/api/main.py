@@ -1,35 +1,106 @@
+import asyncio
 import logging
+import signal
 from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Awaitable, Callable
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from app.api.admission import admission_controller
 from app.api.routes import router
-from app.config import settings
+from app.config import reload_settings, settings
+from app.models.database import create_tables, dispose_engine, is_sqlite
+from app.services.health import health_monitor
 from app.services.rabbitmq import rabbitmq_service
+from app.services.tenancy import record_lanes
 from app.utils.logging import setup_logging
+from app.utils.metrics import CONTENT_TYPE, IN_FLIGHT, REGISTRY
+from app.utils.tracing import configure_tracing, extract, tracer
 
 
-setup_logging()
 logger = logging.getLogger(__name__)
 
+UPLOAD_PATH = "/api/v1/images"
+
+
+def _reload() -> None:
+    if reload_settings():
+        setup_logging()
+
+
+def _install_reload_handler() -> None:
+    """Reload settings on SIGHUP.
+
+    With several uvicorn workers the supervisor itself handles SIGHUP by
+    restarting the workers, which reads the settings afresh as well.
+    """
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Not on the main thread (e.g. an in-process test client).
+        pass
+
+
+async def _snapshot_metrics(directory: Path) -> None:
+    """Keep this process's snapshot fresh for the merged ``/metrics``."""
+    while True:
+        try:
+            await asyncio.to_thread(REGISTRY.write_snapshot, directory)
+        except OSError as e:
+            logger.warning("Failed to write metrics snapshot: %s", e)
+        await asyncio.sleep(settings.metrics_snapshot_interval)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Configured here rather than at import, so importing the app (tests,
+    # tooling, the server's parent process) stays cheap and side-effect free.
+    setup_logging()
     logger.info("Starting up application")
+    _install_reload_handler()
+    configure_tracing("api")
+    if is_sqlite():
+        await create_tables()
     
     try:
         await rabbitmq_service.connect()
         logger.info("Connected to RabbitMQ")
     except Exception as e:
-        logger.error(f"Failed to connect to RabbitMQ: {e}")
+        logger.error("Failed to connect to RabbitMQ: %s", e)
         raise
+    await health_monitor.start()
+    snapshots = None
+    if settings.metrics_dir:
+        Path(settings.metrics_dir).mkdir(parents=True, exist_ok=True)
+        snapshots = asyncio.create_task(_snapshot_metrics(Path(settings.metrics_dir)))
+    worker = None
+    if settings.embedded_worker:
+        from app.worker.embedded import EmbeddedWorker
+
+        worker = EmbeddedWorker(rabbitmq_service)
+        await worker.start()
+    else:
+        # So the worker knows about the lanes this process publishes to.
+        await record_lanes()
     
     yield
     
     logger.info("Shutting down application")
+    if worker is not None:
+        await worker.stop(settings.worker_shutdown_timeout)
+    await health_monitor.stop()
+    if snapshots is not None:
+        snapshots.cancel()
+        REGISTRY.remove_snapshot(Path(settings.metrics_dir))
     await rabbitmq_service.disconnect()
+    await dispose_engine()
+    tracer.shutdown()
 
 
 app = FastAPI(
@@ -47,6 +118,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def admit_uploads(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    # Checked before the body is read, so a rejected upload is never
+    # buffered or written to disk. Registered before instrument_request,
+    # so it runs inside it and rejections are still traced and counted.
+    if request.method == "POST" and request.url.path == UPLOAD_PATH:
+        client = request.client.host if request.client else "unknown"
+        rejection = await admission_controller.admit(client)
+        if rejection is not None:
+            return JSONResponse(
+                {"detail": rejection.detail},
+                status_code=rejection.status_code,
+                headers={"Retry-After": rejection.retry_after_header},
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def instrument_request(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    with IN_FLIGHT.track_in_progress(component="api_requests"), tracer.start_as_current_span(
+        f"HTTP {request.method}",
+        {"http.method": request.method, "http.target": request.url.path},
+        parent=extract(request.headers),
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"HTTP {request.method} {route.path}"
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.status_code", response.status_code)
+        return response
+
+
 app.include_router(router, prefix="/api/v1")
 
 app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
@@ -61,13 +170,32 @@ async def root():
     }
 
 
-if __name__ == "__main__":
-    import uvicorn
-    
-    uvicorn.run(
-        "app.api.main:app",
-        host=settings.api_host,
-        port=settings.api_port,
-        reload=True,
-        log_level=settings.log_level.lower()
+# Probes read the health monitor's cached results and touch no dependency.
+@app.get("/livez", include_in_schema=False)
+async def livez() -> JSONResponse:
+    live = health_monitor.live()
+    return JSONResponse({"status": "ok" if live else "stalled"}, status_code=200 if live else 503)
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz() -> JSONResponse:
+    return JSONResponse(health_monitor.report(), status_code=200 if health_monitor.ready() else 503)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    if not settings.metrics_dir:
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+    # Every API process's metrics, not just this one's.
+    body = await asyncio.to_thread(
+        REGISTRY.render_merged,
+        Path(settings.metrics_dir),
+        3 * settings.metrics_snapshot_interval,
     )
+    return Response(body, media_type=CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    from app.api.server import run
+
+    run()
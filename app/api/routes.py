@@ -1,18 +1,29 @@
+import json
 import logging
 from typing import List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.admission import admission_controller
 from app.api.schemas import (
+    DuplicateResponse,
+    DuplicatesResponse,
     HealthResponse,
     ImageResponse,
     ImageUploadResponse,
 )
+from app.config import settings
 from app.models.database import get_db
 from app.models.image import Image, ImageStatus
+from app.models.partitioning import image_filter, image_lookup, image_sql
+from app.services.health import health_monitor
 from app.services.rabbitmq import rabbitmq_service
+from app.services.similarity import MAX_SEARCH_DISTANCE, find_similar, from_signed
+from app.services.tenancy import request_tenant
+from app.utils.metrics import UPLOAD_SIZE_BYTES
 
 logger = logging.getLogger(__name__)
 
@@ -21,30 +32,42 @@ router = APIRouter()
 
 @router.post("/images", response_model=ImageUploadResponse)
 async def upload_image(
+    request: Request,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
 ) -> ImageUploadResponse:
     """Upload image for processing."""
-    logger.info(f"Received image upload: {file.filename}")
+    logger.info("Received image upload: %s", file.filename)
     
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
     
+    try:
+        tenant = request_tenant(request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     file_extension = file.filename.split(".")[-1].lower()
-    if file_extension not in ["jpg", "jpeg", "png", "gif", "bmp", "webp"]:
+    if file_extension not in settings.allowed_extensions_set:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type. Allowed: jpg, jpeg, png, gif, bmp, webp"
+            detail=f"Unsupported file type. Allowed: {', '.join(settings.allowed_extensions_list)}"
         )
     
     file_content = await file.read()
-    if len(file_content) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
+    UPLOAD_SIZE_BYTES.observe(len(file_content))
+    if len(file_content) > settings.max_file_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File size exceeds {settings.max_file_size // (1024 * 1024)}MB limit"
+        )
     
+    original_path = None
     try:
         image = Image(
             original_filename=file.filename,
             original_path="",
+            tenant=tenant,
             status=ImageStatus.NEW
         )
         db.add(image)
@@ -53,24 +76,26 @@ async def upload_image(
         
         from app.services.image_processing import image_processing_service
         original_path = await image_processing_service.save_original_image(
-            file_content, file.filename
+            file_content, file.filename, stem=str(image.id)
         )
         
         image.original_path = original_path
+        # Marked before publishing: an in-process worker (EMBEDDED_WORKER) can
+        # finish the job before this request gets to commit again.
+        image.status = ImageStatus.PROCESSING
         await db.commit()
         
         message = {
             "image_id": str(image.id),
             "original_path": original_path,
-            "original_filename": file.filename
+            "original_filename": file.filename,
+            "tenant": tenant,
         }
         
-        await rabbitmq_service.publish_message("image_processing", message)
+        await rabbitmq_service.publish_job(message)
+        admission_controller.record_publish()
         
-        image.status = ImageStatus.PROCESSING
-        await db.commit()
-        
-        logger.info(f"Image uploaded successfully: {image.id}")
+        logger.info("Image uploaded successfully: %s", image.id)
         
         return ImageUploadResponse(
             task_id=image.id,
@@ -79,10 +104,12 @@ async def upload_image(
         )
         
     except Exception as e:
-        logger.error(f"Failed to upload image: {e}")
+        logger.error("Failed to upload image: %s", e)
         if 'image' in locals():
             await db.delete(image)
             await db.commit()
+        if original_path:
+            await image_processing_service.cleanup_file(original_path)
         raise HTTPException(status_code=500, detail="Failed to upload image")
 
 
@@ -91,13 +118,10 @@ async def get_image(
     image_id: UUID,
     db: AsyncSession = Depends(get_db),
 ) -> ImageResponse:
-    logger.info(f"Getting image details: {image_id}")
+    logger.debug("Getting image details: %s", image_id)
     
-    from sqlalchemy import text
-    result = await db.execute(
-        text("SELECT * FROM images WHERE id = :image_id"),
-        {"image_id": image_id}
-    )
+    where, params = await image_lookup(db, image_id)
+    result = await db.execute(image_sql(f"SELECT * FROM images WHERE {where}"), params)
     image_data = result.fetchone()
     
     if not image_data:
@@ -112,6 +136,9 @@ async def get_image(
     thumbnails = {}
     if image_dict.get("thumbnails"):
         thumbnails = image_dict["thumbnails"]
+        if isinstance(thumbnails, str):
+            # Raw SQL returns JSON columns as text on SQLite.
+            thumbnails = json.loads(thumbnails)
         thumbnails = {
             size: f"/uploads/{path}" 
             for size, path in thumbnails.items()
@@ -121,33 +148,42 @@ async def get_image(
         id=image_dict["id"],
         status=image_dict["status"],
         original_url=original_url,
-        thumbnails=thumbnails
+        thumbnails=thumbnails,
+        placeholder=image_dict.get("placeholder"),
+    )
+
+
+@router.get("/images/{image_id}/duplicates", response_model=DuplicatesResponse)
+async def get_duplicates(
+    image_id: UUID,
+    max_distance: int = Query(6, ge=0, le=MAX_SEARCH_DISTANCE),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+) -> DuplicatesResponse:
+    """Images that look the same (re-encoded, resized), closest first."""
+    result = await db.execute(select(Image).where(await image_filter(db, image_id)))
+    image = result.scalar_one_or_none()
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.phash is None:
+        raise HTTPException(status_code=409, detail="Image has not been processed yet")
+    
+    matches = await find_similar(db, from_signed(image.phash), max_distance, limit, exclude=image.id)
+    return DuplicatesResponse(
+        id=image.id,
+        duplicates=[
+            DuplicateResponse(id=row.id, distance=distance, original_url=row.original_url)
+            for row, distance in matches
+        ],
     )
 
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check() -> HealthResponse:
-    logger.info("Health check requested")
-    
-    database_status = "healthy"
-    try:
-        from app.models.database import engine
-        from sqlalchemy import text
-        async with engine.begin() as conn:
-            await conn.execute(text("SELECT 1"))
-    except Exception as e:
-        logger.error(f"Database health check failed: {e}")
-        database_status = "unhealthy"
-    
-    rabbitmq_status = "healthy"
-    try:
-        if not rabbitmq_service.connection or rabbitmq_service.connection.is_closed:
-            rabbitmq_status = "unhealthy"
-    except Exception as e:
-        logger.error(f"RabbitMQ health check failed: {e}")
-        rabbitmq_status = "unhealthy"
-    
-    service_status = "healthy" if database_status == "healthy" and rabbitmq_status == "healthy" else "unhealthy"
+    # Served from the background monitor's results (see app.services.health).
+    database_status = health_monitor.status("database")
+    rabbitmq_status = health_monitor.status("rabbitmq")
+    service_status = "healthy" if health_monitor.ready() else "unhealthy"
     
     return HealthResponse(
         status=service_status,
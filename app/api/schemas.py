@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -19,6 +19,19 @@ class ImageResponse(BaseModel):
     status: str
     original_url: Optional[str] = None
     thumbnails: Dict[str, str] = {}
+    # data: URI of a blurred preview, shown until a thumbnail loads.
+    placeholder: Optional[str] = None
+
+
+class DuplicateResponse(BaseModel):
+    id: UUID
+    distance: int
+    original_url: Optional[str] = None
+
+
+class DuplicatesResponse(BaseModel):
+    id: UUID
+    duplicates: List[DuplicateResponse] = []
 
 
 class HealthResponse(BaseModel):
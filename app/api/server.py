@@ -0,0 +1,78 @@
+import atexit
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Dict
+
+import uvicorn
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+APP_PATH = "app.api.main:app"
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def resolve_worker_count() -> int:
+    """``API_WORKERS=0`` means one process per CPU available to the container."""
+    if settings.api_workers > 0:
+        return settings.api_workers
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def resolve_implementation(requested: str, preferred: str, fallback: str) -> str:
+    """Pick the event loop / HTTP parser, falling back when it is not installed."""
+    if requested == "auto":
+        return preferred if _available(preferred) else fallback
+    if requested == preferred and not _available(preferred):
+        logger.warning("%s is not installed, falling back to %s", preferred, fallback)
+        return fallback
+    return requested
+
+
+def build_config() -> Dict[str, Any]:
+    reload = settings.api_reload
+    return {
+        "host": settings.api_host,
+        "port": settings.api_port,
+        # Reload runs a single process; it is meant for development only.
+        "workers": 1 if reload else resolve_worker_count(),
+        "reload": reload,
+        "loop": resolve_implementation(settings.api_loop, "uvloop", "asyncio"),
+        "http": resolve_implementation(settings.api_http, "httptools", "h11"),
+        "log_level": settings.log_level.lower(),
+        "proxy_headers": True,
+        "timeout_graceful_shutdown": settings.api_graceful_timeout,
+        "backlog": settings.api_backlog,
+    }
+
+
+def run() -> None:
+    """Start the API server.
+
+    With more than one worker uvicorn spawns fresh interpreter processes, so
+    every process runs the application lifespan and opens its own database
+    pool and RabbitMQ connection.
+    """
+    config = build_config()
+    if config["workers"] > 1 and not settings.metrics_dir:
+        # Each process keeps its own metrics; /metrics merges them from
+        # snapshots in a shared directory (see app.utils.metrics).
+        metrics_dir = tempfile.mkdtemp(prefix="image-api-metrics-")
+        os.environ["METRICS_DIR"] = metrics_dir
+        atexit.register(shutil.rmtree, metrics_dir, ignore_errors=True)
+    logger.info(
+        "Starting API server with %s worker(s), loop=%s, http=%s",
+        config["workers"],
+        config["loop"],
+        config["http"],
+    )
+    uvicorn.run(APP_PATH, **config)
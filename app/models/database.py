@@ -1,23 +1,125 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import os
+import time
+from typing import Any, Callable, Optional
+
+from sqlalchemy import event, make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import DeclarativeBase
 
 from app.config import settings
+from app.utils.metrics import DB_POOL_CONNECTIONS, DB_QUERY_SECONDS
+from app.utils.tracing import tracer
+
+_engine: Optional[AsyncEngine] = None
+
+
+def get_engine() -> AsyncEngine:
+    """Create the engine on first use.
+
+    Creating it loads the database driver, which importing this module (and
+    with it the models) should not pay for.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            settings.database_url,
+            echo=False, 
+            future=True,
+        )
+        _instrument(_engine.sync_engine)
+    return _engine
+
+
+async def dispose_engine() -> None:
+    if _engine is not None:
+        await _engine.dispose()
+
+
+def __getattr__(name: str) -> Any:
+    # ``from app.models.database import engine`` keeps working, creating
+    # the engine at that point.
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    span = tracer.start_span(f"db.{operation.lower()}", {"db.statement": statement[:500]})
+    conn.info.setdefault("query_started_at", []).append((time.perf_counter(), operation, span))
+
+
+def _after_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+    started_at, operation, span = conn.info["query_started_at"].pop()
+    DB_QUERY_SECONDS.observe(time.perf_counter() - started_at, operation=operation)
+    span.end()
+
+
+def _handle_error(context: Any) -> None:
+    started = context.connection.info.get("query_started_at") if context.connection else None
+    if started:
+        _, _, span = started.pop()
+        span.record_exception(context.original_exception)
+        span.end()
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=False, 
-    future=True,
-)
 
+def _instrument(sync_engine: Any) -> None:
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
 
-AsyncSessionLocal = sessionmaker(
-    engine,
+
+def _dispose_pool_after_fork() -> None:
+    # Connections opened before a fork belong to the parent process; the
+    # child starts with an empty pool instead of sharing the sockets.
+    if _engine is not None:
+        _engine.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_pool_after_fork)
+
+
+def _pool_stat(stat: Callable[[Any], int]) -> Callable[[], float]:
+    return lambda: stat(_engine.pool) if _engine is not None else 0
+
+
+DB_POOL_CONNECTIONS.set_function(_pool_stat(lambda pool: pool.checkedout()), state="checked_out")
+DB_POOL_CONNECTIONS.set_function(_pool_stat(lambda pool: pool.checkedin()), state="idle")
+DB_POOL_CONNECTIONS.set_function(_pool_stat(lambda pool: max(0, pool.overflow())), state="overflow")
+DB_POOL_CONNECTIONS.set_function(_pool_stat(lambda pool: pool.size()), state="size")
+
+
+_session_factory = async_sessionmaker(
     class_=AsyncSession,
     expire_on_commit=False,
 )
 
 
-Base = declarative_base()
+def AsyncSessionLocal() -> AsyncSession:
+    """Open a session bound to the (lazily created) engine."""
+    return _session_factory(bind=get_engine())
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+def is_sqlite() -> bool:
+    return make_url(settings.database_url).get_backend_name() == "sqlite"
+
+
+async def create_tables() -> None:
+    """Create missing tables, for SQLite; the Postgres schema comes from migrations."""
+    from app.models import image  # noqa: F401  registers the models
+
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
 
 async def get_db() -> AsyncSession:
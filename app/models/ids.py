@@ -0,0 +1,24 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+
+
+def uuid7(now: Optional[float] = None) -> UUID:
+    """Time-ordered UUID (RFC 9562 version 7)."""
+    milliseconds = int((time.time() if now is None else now) * 1000) & ((1 << 48) - 1)
+    value = milliseconds << 80 | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | 0x7 << 76  # version
+    value = (value & ~(0x3 << 62)) | 0x2 << 62  # variant
+    return UUID(int=value)
+
+
+def uuid7_time(value: UUID) -> Optional[datetime]:
+    """Creation time (naive UTC, like ``created_at``) of a UUIDv7, else None."""
+    if value.version != 7:
+        return None
+    milliseconds = value.int >> 80
+    return datetime.fromtimestamp(milliseconds / 1000, timezone.utc).replace(
+        tzinfo=None
+    )
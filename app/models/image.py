@@ -1,12 +1,14 @@
 import enum
+import uuid
 from datetime import datetime
-from typing import Dict, Optional
-from uuid import uuid4
+from typing import Any, Dict, Optional
 
-from sqlalchemy import Column, DateTime, Enum, String, Text
+from sqlalchemy import BigInteger, DateTime, Enum, Integer, String, Text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
 
 from .database import Base
+from .ids import uuid7
 
 
 class ImageStatus(str, enum.Enum):
@@ -19,15 +21,36 @@ class ImageStatus(str, enum.Enum):
 class Image(Base):
     __tablename__ = "images"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    status = Column(Enum(ImageStatus), default=ImageStatus.NEW, nullable=False)
-    original_filename = Column(String(255), nullable=False)
-    original_path = Column(String(500), nullable=False)
-    original_url = Column(String(500), nullable=True)
-    thumbnails = Column(JSONB, nullable=True)
-    error_message = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Time-ordered, so the partition holding the row can be found from the id
+    # (see app.models.partitioning).
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    status: Mapped[ImageStatus] = mapped_column(Enum(ImageStatus), default=ImageStatus.NEW, nullable=False)
+    original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    # Owner of the upload; decides the queue lane (see app.services.tenancy).
+    tenant: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    original_path: Mapped[str] = mapped_column(String(500), nullable=False)
+    original_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    thumbnails: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
+    # Per-rendition metadata ({"100x100": {"path": ..., "key": ...}}), written
+    # when processing completes; "key" identifies the settings it was built with.
+    renditions: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONB, nullable=True)
+    # Identifies the job (image + rendition settings) that produced the row's
+    # current outputs, so a redelivered message for it can be skipped.
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # 64-bit perceptual hash (signed) and its four 16-bit bands, indexed for
+    # near-duplicate lookups (see app.services.similarity).
+    phash: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    phash_band0: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    phash_band1: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    phash_band2: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    phash_band3: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    # Tiny WebP as a data: URI, returned inline so clients can show something
+    # before fetching a thumbnail (see app.services.placeholders).
+    placeholder: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Partition key on PostgreSQL, where the primary key is (id, created_at).
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     def __repr__(self) -> str:
         return f"<Image(id={self.id}, status={self.status}, filename={self.original_filename})>"
@@ -38,6 +61,25 @@ class Image(Base):
             "status": self.status.value,
             "original_url": self.original_url,
             "thumbnails": self.thumbnails or {},
+            "placeholder": self.placeholder,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
+
+
+class ImagePartitionHint(Base):
+    """``created_at`` of images whose id predates UUIDv7 ids."""
+
+    __tablename__ = "image_partition_hints"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class QueueLane(Base):
+    """A lane queue some process declared (see app.services.tenancy)."""
+
+    __tablename__ = "queue_lanes"
+
+    queue: Mapped[str] = mapped_column(String(255), primary_key=True)
+    declared_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
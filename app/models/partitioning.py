@@ -0,0 +1,101 @@
+"""Locating an image's partition from its id.
+
+On PostgreSQL ``images`` is range-partitioned by month on ``created_at``
+(see the ``partition images by created_at`` migration). A lookup by id alone
+has to probe the primary key index of every partition, so lookups add a
+``created_at`` range that lets the planner prune to one partition:
+
+- new ids are UUIDv7, whose first 48 bits are the creation time in
+  milliseconds, so the range is derived from the id itself;
+- ids created before partitioning (UUIDv4) are looked up in the
+  ``image_partition_hints`` table, filled by the migration.
+
+Without a hint the lookup still works, it just scans every partition.
+
+Statements using the lookup are built with ``image_sql``, which types its
+parameters so they bind on SQLite too (embedded mode and tests).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import (
+    ColumnElement,
+    DateTime,
+    TextClause,
+    and_,
+    bindparam,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .ids import uuid7_time
+from .image import Image, ImagePartitionHint
+
+# id and created_at are set together when the row is flushed; the window
+# only has to cover the gap between the two.
+HINT_WINDOW = timedelta(hours=1)
+
+_LOOKUP_TYPES = {
+    "image_id": Image.__table__.c.id.type,
+    "created_from": DateTime(),
+    "created_to": DateTime(),
+    "now": DateTime(),
+}
+
+
+async def created_at_range(
+    db: AsyncSession, image_id: UUID
+) -> Optional[Tuple[datetime, datetime]]:
+    created = uuid7_time(image_id)
+    if created is not None:
+        return created - HINT_WINDOW, created + HINT_WINDOW
+    result = await db.execute(
+        select(ImagePartitionHint.created_at).where(ImagePartitionHint.id == image_id)
+    )
+    created = result.scalar_one_or_none()
+    if created is not None:
+        return created, created + timedelta(seconds=1)
+    return None
+
+
+async def image_lookup(db: AsyncSession, image_id: UUID) -> Tuple[str, Dict[str, Any]]:
+    """``WHERE`` clause and parameters selecting the image by id in raw SQL."""
+    params: Dict[str, Any] = {"image_id": image_id}
+    bounds = await created_at_range(db, image_id)
+    if bounds is None:
+        return "id = :image_id", params
+    params["created_from"], params["created_to"] = bounds
+    return (
+        "id = :image_id AND created_at >= :created_from AND created_at < :created_to",
+        params,
+    )
+
+
+async def image_filter(db: AsyncSession, image_id: UUID) -> ColumnElement[bool]:
+    """``image_lookup`` for ORM statements: ``Image.id == image_id``, pruned."""
+    bounds = await created_at_range(db, image_id)
+    if bounds is None:
+        return Image.id == image_id
+    return and_(
+        Image.id == image_id,
+        Image.created_at >= bounds[0],
+        Image.created_at < bounds[1],
+    )
+
+
+def image_sql(sql: str) -> TextClause:
+    """``text(sql)`` with the lookup parameters (and ``:now``) typed.
+
+    Untyped, a UUID only binds on PostgreSQL drivers; typed, it is stored
+    and compared the way the ORM does on every dialect.
+    """
+    return text(sql).bindparams(
+        *(
+            bindparam(name, type_=type_)
+            for name, type_ in _LOOKUP_TYPES.items()
+            if f":{name}" in sql
+        )
+    )
@@ -0,0 +1,56 @@
+"""Frame-by-frame handling of animated GIF and WebP sources.
+
+Frames are decoded one at a time by seeking, so only the current source
+frame plus the (small) output frames are held in memory, and decoding stops
+as soon as the frame or duration cap is reached.
+"""
+
+import io
+from typing import Iterator, List, Tuple
+
+from PIL import Image
+
+# Browsers play GIF frames shorter than this at 100 ms; do the same.
+MIN_FRAME_MS = 20
+DEFAULT_FRAME_MS = 100
+
+
+def is_animated(img: Image.Image) -> bool:
+    return bool(getattr(img, "is_animated", False)) and getattr(img, "n_frames", 1) > 1
+
+
+def iter_frames(
+    img: Image.Image, max_frames: int, max_duration_ms: int
+) -> Iterator[Tuple[Image.Image, int]]:
+    """Yield ``(RGBA frame, duration ms)`` until a cap is reached.
+
+    Frame 0 is always yielded, so even an over-long first frame produces a
+    valid (single-frame) animation.
+    """
+    elapsed = 0
+    for index in range(min(getattr(img, "n_frames", 1), max(1, max_frames))):
+        img.seek(index)
+        duration = int(img.info.get("duration") or DEFAULT_FRAME_MS)
+        if duration < MIN_FRAME_MS:
+            duration = DEFAULT_FRAME_MS
+        if index and elapsed + duration > max_duration_ms:
+            break
+        elapsed += duration
+        yield img.convert("RGBA"), duration
+
+
+def encode_animated_webp(
+    frames: List[Image.Image], durations: List[int], quality: int, loop: int = 0
+) -> bytes:
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer,
+        "WEBP",
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=loop,
+        quality=quality,
+        method=4,
+    )
+    return buffer.getvalue()
@@ -0,0 +1,464 @@
+"""Resize engines behind ``ImageProcessingService``.
+
+An engine renders still renditions, compresses originals and decodes a
+small preview for image analysis. ``IMAGE_ENGINE`` selects one:
+
+- ``pillow`` (default) decodes the source into memory, at reduced scale
+  where the format allows it (JPEG draft mode); a large PNG or WebP is
+  decoded at full size.
+- ``vips`` uses libvips through pyvips (optional, needs libvips 8.15+).
+  It shrinks on load (JPEG, WebP) and otherwise streams the source through
+  the resize in strips, so memory follows the output size rather than the
+  input size.
+
+Animated renditions and formats libvips does not load natively (e.g. BMP)
+always use Pillow; ``USE_EXIF_THUMBNAIL`` applies to Pillow only, libvips'
+shrink-on-load makes it unnecessary. When pyvips cannot be imported the
+service falls back to Pillow with a warning.
+"""
+
+import io
+import logging
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from app.config import QualityTarget, RenditionSpec, settings
+from app.services.image_processing import processing_stage, write_atomic
+from app.services.quality import (
+    SAMPLE_SIDE,
+    choose_quality,
+    encode_adaptive,
+    sample_box,
+)
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from app.services.metadata import ImageMetadata
+
+logger = logging.getLogger(__name__)
+
+Size = Tuple[int, int]
+Missing = List[Tuple[RenditionSpec, Path]]
+Renditions = Dict[str, Dict[str, Any]]
+
+
+def _encode(
+    img: "Image.Image", image_format: str, quality: int, **options: Any
+) -> bytes:
+    # ``options`` carries metadata (icc_profile, exif) allowed by the policy;
+    # Pillow writes none of it unless asked to.
+    buffer = io.BytesIO()
+    if image_format == "png":
+        img.save(buffer, "PNG", optimize=True, **options)
+    elif image_format == "webp":
+        img.save(buffer, "WEBP", quality=quality, method=4, **options)
+    else:
+        img.save(buffer, "JPEG", quality=quality, optimize=True, **options)
+    return buffer.getvalue()
+
+
+def _keeps_alpha(image_format: str) -> bool:
+    return image_format in ("png", "webp")
+
+
+class ResizeEngine(ABC):
+    name = ""
+
+    def supports(self, img: "Image.Image") -> bool:
+        return True
+
+    @abstractmethod
+    def render_stills(
+        self, img: "Image.Image", source: Path, missing: Missing, renditions: Renditions
+    ) -> "Image.Image":
+        """Write the ``missing`` renditions and add their sizes to ``renditions``.
+
+        ``img`` is the source opened by Pillow (header parsed, nothing
+        decoded yet). Returns the smallest intermediate (upright, uncropped)
+        as a Pillow image, for analysis.
+        """
+
+    @abstractmethod
+    def preview(self, img: "Image.Image", source: Path, size: int) -> "Image.Image":
+        """The upright image decoded at roughly ``size`` px or more, cheaply."""
+
+    @abstractmethod
+    def compress(
+        self, img: "Image.Image", source: Path, destination: Path, quality: int
+    ) -> None:
+        """Write the upright still image as JPEG to ``destination``."""
+
+
+class PillowEngine(ResizeEngine):
+    name = "pillow"
+
+    def render_stills(
+        self, img: "Image.Image", source: Path, missing: Missing, renditions: Renditions
+    ) -> "Image.Image":
+        """Render from a single decoded frame (frame 0 for animations)."""
+        from app.services.metadata import ImageMetadata, oriented_size
+        from app.services.renditions import intermediate_size
+
+        meta = ImageMetadata.read(img)
+        # Sizes are computed for the upright image; the source stays in its
+        # stored orientation until after the resize.
+        original_size = oriented_size(img.size, meta.transpose)
+        sizes = {spec: intermediate_size(original_size, spec) for spec, _ in missing}
+        # Largest first: each smaller rendition is scaled down from the
+        # previous intermediate when that still covers it, instead of
+        # from the full-size original.
+        missing.sort(
+            key=lambda item: sizes[item[0]][0] * sizes[item[0]][1], reverse=True
+        )
+
+        # The preview can only cover the smallest sizes, which come last.
+        smallest = None
+        preview = self._exif_preview(img, meta)
+        if preview is not None:
+            upright_preview = oriented_size(preview.size, meta.transpose)
+            from_preview = [
+                item
+                for item in missing
+                if upright_preview[0] >= sizes[item[0]][0]
+                and upright_preview[1] >= sizes[item[0]][1]
+            ]
+            if from_preview:
+                missing = [item for item in missing if item not in from_preview]
+                logger.debug(
+                    "Rendering %s sizes from the EXIF thumbnail", len(from_preview)
+                )
+                smallest = self._render_from(
+                    preview, original_size, meta, from_preview, sizes, renditions
+                )
+                if not missing:
+                    return smallest
+
+        with processing_stage("decode"):
+            # JPEG can decode at 1/2..1/8 scale directly, never below
+            # the largest intermediate we need.
+            needed = (
+                max(w for w, _ in sizes.values()),
+                max(h for _, h in sizes.values()),
+            )
+            img.draft(None, oriented_size(needed, meta.transpose))
+            img.load()
+            # Alpha stays for PNG and WebP renditions; JPEG ones drop it
+            # after the resize.
+            if img.mode in ("RGBA", "LA", "P", "PA"):
+                img = img.convert("RGBA" if img.has_transparency_data else "RGB")
+        rendered = self._render_from(
+            img, original_size, meta, missing, sizes, renditions
+        )
+        return rendered if smallest is None else smallest
+
+    @staticmethod
+    def _exif_preview(
+        img: "Image.Image", meta: "ImageMetadata"
+    ) -> Optional["Image.Image"]:
+        """The embedded EXIF thumbnail, if enabled and it shows the same frame.
+
+        Cameras store a preview of the full frame; one with a different
+        aspect ratio (letterboxed, or of an edited image) is not used.
+        """
+        if not settings.use_exif_thumbnail:
+            return None
+        preview = meta.embedded_thumbnail()
+        if preview is None:
+            return None
+        if (
+            abs(preview.width / preview.height - img.width / img.height)
+            > 0.02 * img.width / img.height
+        ):
+            return None
+        return preview
+
+    def _render_from(
+        self,
+        source: "Image.Image",
+        original_size: Size,
+        meta: "ImageMetadata",
+        missing: Missing,
+        sizes: Dict[RenditionSpec, Size],
+        renditions: Renditions,
+    ) -> "Image.Image":
+        from app.services.renditions import covers, render
+
+        policy = settings.metadata_policy
+        save_options = meta.save_options(policy)
+        decoded = current = source
+        for spec, thumbnail_path in missing:
+            size_label = spec.label
+            with processing_stage("resize", size_label):
+                if current is decoded or not covers(current, sizes[spec]):
+                    current, thumbnail = render(
+                        decoded, original_size, spec, meta.transpose
+                    )
+                else:
+                    current, thumbnail = render(current, original_size, spec)
+                if thumbnail.mode == "RGBA" and not _keeps_alpha(spec.format):
+                    thumbnail = thumbnail.convert("RGB")
+                thumbnail = meta.prepare(thumbnail, policy)
+
+            with processing_stage("encode", size_label):
+                data, quality = encode_adaptive(
+                    thumbnail,
+                    lambda image, q: _encode(image, spec.format, q, **save_options),
+                    spec.quality,
+                    spec.target,
+                    spec.format,
+                )
+            with processing_stage("write", size_label):
+                write_atomic(thumbnail_path, data)
+
+            renditions[size_label].update(
+                width=thumbnail.width, height=thumbnail.height
+            )
+            if spec.target is not None:
+                renditions[size_label]["quality"] = quality
+
+            logger.debug("Created thumbnail: %s", thumbnail_path)
+        return current
+
+    def preview(self, img: "Image.Image", source: Path, size: int) -> "Image.Image":
+        from app.services.metadata import ImageMetadata
+
+        transpose = ImageMetadata.read(img).transpose
+        img.seek(0)
+        img.draft(None, (size, size))
+        return img if transpose is None else img.transpose(transpose)
+
+    def compress(
+        self, img: "Image.Image", source: Path, destination: Path, quality: int
+    ) -> None:
+        from app.services.metadata import ImageMetadata
+
+        meta = ImageMetadata.read(img)
+        with processing_stage("decode", "original"):
+            # Still poster: load() decodes only the current (first) frame.
+            img.load()
+            if img.mode in ("RGBA", "P"):
+                img = img.convert("RGB")
+            # The original is deleted once this copy exists, so the
+            # orientation has to be baked into the pixels here.
+            if meta.transpose is not None:
+                img = img.transpose(meta.transpose)
+            img = meta.prepare(img, settings.metadata_policy)
+
+        options = meta.save_options(settings.metadata_policy)
+        with processing_stage("encode", "original"):
+            data, _ = encode_adaptive(
+                img,
+                lambda image, q: _encode(image, "jpeg", q, **options),
+                quality,
+                settings.quality_target,
+                "jpeg",
+            )
+        with processing_stage("write", "original"):
+            write_atomic(destination, data)
+
+
+# EXIF orientations that swap width and height.
+_SWAPPED_ORIENTATIONS = (5, 6, 7, 8)
+# Bands to Pillow mode, for handing intermediates over to analysis.
+_PIL_MODES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+
+class VipsEngine(ResizeEngine):
+    name = "vips"
+    # Formats libvips loads itself; GIF only as a still (frame 0).
+    FORMATS = frozenset({"JPEG", "PNG", "WEBP", "TIFF", "GIF"})
+
+    def __init__(self) -> None:
+        import pyvips
+
+        self.pyvips = pyvips
+        keep = pyvips.enums.ForeignKeep
+        self.keep = {"strip": keep.NONE, "icc": keep.ICC, "keep": keep.ICC | keep.EXIF}
+        # Operations are not reused across jobs; caching them only holds
+        # on to decoded pixels.
+        pyvips.cache_set_max(0)
+
+    def supports(self, img: "Image.Image") -> bool:
+        return img.format in self.FORMATS
+
+    def _upright_size(self, source: Path) -> Size:
+        # Opening reads the header only.
+        header = self.pyvips.Image.new_from_file(str(source), access="sequential")
+        orientation = (
+            header.get("orientation") if header.get_typeof("orientation") else 1
+        )
+        if orientation in _SWAPPED_ORIENTATIONS:
+            return header.height, header.width
+        return header.width, header.height
+
+    def _prepare(self, image: Any, image_format: str) -> Any:
+        # Same output as the Pillow engine: colours in sRGB unless the policy
+        # keeps the profile, alpha kept only where the format stores it.
+        if settings.metadata_policy == "strip" and image.get_typeof("icc-profile-data"):
+            image = image.icc_transform("srgb")
+        if image.hasalpha() and not _keeps_alpha(image_format):
+            image = image.flatten()
+        return image
+
+    def _save(self, image: Any, image_format: str, quality: int) -> bytes:
+        keep = self.keep[settings.metadata_policy]
+        if image_format == "png":
+            data = image.write_to_buffer(".png", compression=9, keep=keep)
+        elif image_format == "webp":
+            data = image.write_to_buffer(".webp", Q=quality, effort=4, keep=keep)
+        else:
+            data = image.write_to_buffer(
+                ".jpg", Q=quality, optimize_coding=True, keep=keep
+            )
+        return bytes(data)
+
+    def _choose_quality(
+        self,
+        image: Any,
+        image_format: str,
+        quality: int,
+        target: Optional[QualityTarget],
+    ) -> Tuple[int, Optional[bytes]]:
+        """See ``app.services.quality``; the encoding is returned when it covers all of ``image``."""
+        if target is None:
+            return quality, None
+        sample = image
+        if image.width > SAMPLE_SIDE or image.height > SAMPLE_SIDE:
+            sample = image.crop(*sample_box(image.width, image.height))
+        chosen, data = choose_quality(
+            self._to_pil(sample),
+            lambda q: self._save(sample, image_format, q),
+            target,
+            quality,
+            image_format,
+        )
+        return chosen, data if sample is image else None
+
+    @staticmethod
+    def _apply_mode(image: Any, spec: RenditionSpec) -> Any:
+        if spec.mode == "fill":
+            interesting = "entropy" if spec.crop == "entropy" else "centre"
+            return image.smartcrop(spec.width, spec.height, interesting=interesting)
+        if spec.mode == "pad":
+            if image.bands < 3:
+                image = image.colourspace("srgb")
+            # Opaque padding; an alpha band needs a value of its own.
+            background = [int(spec.background[i : i + 2], 16) for i in (0, 2, 4)] + [
+                255
+            ] * (image.bands - 3)
+            left = (spec.width - image.width) // 2
+            top = (spec.height - image.height) // 2
+            return image.embed(
+                left,
+                top,
+                spec.width,
+                spec.height,
+                extend="background",
+                background=background,
+            )
+        return image
+
+    def _to_pil(self, image: Any) -> "Image.Image":
+        from PIL import Image
+
+        if image.format != "uchar" or image.interpretation not in ("srgb", "b-w"):
+            image = image.colourspace("srgb" if image.bands >= 3 else "b-w").cast(
+                "uchar"
+            )
+        return Image.frombytes(
+            _PIL_MODES[image.bands],
+            (image.width, image.height),
+            image.write_to_memory(),
+        )
+
+    def render_stills(
+        self, img: "Image.Image", source: Path, missing: Missing, renditions: Renditions
+    ) -> "Image.Image":
+        from app.services.renditions import intermediate_size
+
+        original_size = self._upright_size(source)
+        sizes = {spec: intermediate_size(original_size, spec) for spec, _ in missing}
+        missing.sort(
+            key=lambda item: sizes[item[0]][0] * sizes[item[0]][1], reverse=True
+        )
+
+        base = intermediate = None
+        for spec, thumbnail_path in missing:
+            width, height = sizes[spec]
+            with processing_stage("resize", spec.label):
+                if base is None or base.width < width or base.height < height:
+                    # The largest intermediate comes from the file (rotated
+                    # upright, decoded with shrink-on-load or streamed) and is
+                    # kept in memory; smaller ones are scaled down from it.
+                    base = self.pyvips.Image.thumbnail(
+                        str(source), width, height=height, size="force"
+                    ).copy_memory()
+                    intermediate = base
+                elif (base.width, base.height) == (width, height):
+                    intermediate = base
+                else:
+                    intermediate = base.thumbnail_image(
+                        width, height=height, size="force"
+                    )
+                thumbnail = self._apply_mode(
+                    self._prepare(intermediate, spec.format), spec
+                )
+
+            with processing_stage("encode", spec.label):
+                quality, data = self._choose_quality(
+                    thumbnail, spec.format, spec.quality, spec.target
+                )
+                if data is None:
+                    data = self._save(thumbnail, spec.format, quality)
+            with processing_stage("write", spec.label):
+                write_atomic(thumbnail_path, data)
+
+            renditions[spec.label].update(
+                width=thumbnail.width, height=thumbnail.height
+            )
+            if spec.target is not None:
+                renditions[spec.label]["quality"] = quality
+            logger.debug("Created thumbnail: %s", thumbnail_path)
+        return self._to_pil(intermediate)
+
+    def preview(self, img: "Image.Image", source: Path, size: int) -> "Image.Image":
+        return self._to_pil(self.pyvips.Image.thumbnail(str(source), size, height=size))
+
+    def _open_upright(self, source: Path) -> Any:
+        image = self.pyvips.Image.new_from_file(str(source), access="sequential")
+        if image.get_typeof("orientation") and image.get("orientation") != 1:
+            # Rotating needs random access to the decoded pixels.
+            image = self.pyvips.Image.new_from_file(str(source)).autorot()
+        return image
+
+    def compress(
+        self, img: "Image.Image", source: Path, destination: Path, quality: int
+    ) -> None:
+        # Decoding happens while encoding, strip by strip.
+        with processing_stage("encode", "original"):
+            if settings.quality_target is not None:
+                # A sequential image can be read only once, so the search
+                # samples a copy of its own.
+                sample = self._prepare(self._open_upright(source), "jpeg")
+                quality, _ = self._choose_quality(
+                    sample, "jpeg", quality, settings.quality_target
+                )
+            data = self._save(
+                self._prepare(self._open_upright(source), "jpeg"), "jpeg", quality
+            )
+        with processing_stage("write", "original"):
+            write_atomic(destination, data)
+
+
+@lru_cache(maxsize=None)
+def get_engine(name: str) -> ResizeEngine:
+    """The engine called ``name``; Pillow when libvips is unavailable."""
+    if name == "vips":
+        try:
+            return VipsEngine()
+        except (ImportError, OSError) as e:
+            logger.warning("libvips is not available (%s), falling back to Pillow", e)
+    return PillowEngine()
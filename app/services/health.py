@@ -0,0 +1,227 @@
+"""Background health checks served from a cache.
+
+Probes (``/livez``, ``/readyz``, ``/health``) must be cheap: orchestrators
+hit them every few seconds on every replica, and a probe that opens a
+database connection adds load to exactly the resource that is struggling.
+``HealthMonitor`` runs the dependency checks on its own interval instead and
+probes only read the latest results.
+
+- Liveness says the process is working: the monitor loop keeps ticking, so
+  the event loop is not blocked. Dependencies do not count, restarting the
+  process would not fix them.
+- Readiness says the process should get traffic: every check passed on its
+  latest run, and that run is recent.
+
+State changes are logged, individual checks are not.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.services.rabbitmq import rabbitmq_service
+
+logger = logging.getLogger(__name__)
+
+Clock = Callable[[], float]
+# A check returns normally when healthy and raises otherwise.
+Check = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class CheckResult:
+    healthy: bool
+    checked_at: float
+    latency: float
+    error: Optional[str] = None
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "status": "healthy" if self.healthy else "unhealthy",
+            "age_seconds": round(now - self.checked_at, 3),
+            "latency_ms": round(self.latency * 1000, 3),
+            "error": self.error,
+        }
+
+
+async def check_database() -> None:
+    from sqlalchemy import text
+
+    from app.models.database import get_engine
+
+    async with get_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+def rabbitmq_check(service: Any) -> Check:
+    async def check() -> None:
+        connection = service.connection
+        if connection is None or connection.is_closed:
+            raise ConnectionError("not connected")
+
+    return check
+
+
+def storage_check(
+    directory: Optional[Path] = None, min_free_bytes: Optional[int] = None
+) -> Check:
+    """Uploads can be written: the directory is writable and has space left."""
+
+    def probe() -> None:
+        path = directory or Path(settings.upload_dir)
+        minimum = (
+            settings.health_min_free_bytes if min_free_bytes is None else min_free_bytes
+        )
+        path.mkdir(parents=True, exist_ok=True)
+        if not os.access(path, os.W_OK):
+            raise PermissionError(f"{path} is not writable")
+        free = shutil.disk_usage(path).free
+        if free < minimum:
+            raise OSError(f"{free} bytes free in {path}, need {minimum}")
+
+    async def check() -> None:
+        await asyncio.to_thread(probe)
+
+    return check
+
+
+class HealthMonitor:
+    def __init__(
+        self,
+        checks: Dict[str, Check],
+        interval: Optional[float] = None,
+        timeout: Optional[float] = None,
+        clock: Clock = time.monotonic,
+    ) -> None:
+        self.checks = checks
+        self._interval = interval
+        self._timeout = timeout
+        self.clock = clock
+        self.results: Dict[str, CheckResult] = {}
+        self.last_tick: Optional[float] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def interval(self) -> float:
+        return (
+            self._interval
+            if self._interval is not None
+            else settings.health_check_interval
+        )
+
+    @property
+    def timeout(self) -> float:
+        return (
+            self._timeout
+            if self._timeout is not None
+            else settings.health_check_timeout
+        )
+
+    @property
+    def stale_after(self) -> float:
+        # Allows for a couple of slow rounds before results count as stale.
+        return 3 * self.interval + self.timeout
+
+    async def _run_check(self, name: str, check: Check) -> None:
+        started = self.clock()
+        error = None
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {self.timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finished = self.clock()
+        result = CheckResult(error is None, finished, finished - started, error)
+
+        previous = self.results.get(name)
+        self.results[name] = result
+        if result.healthy and previous is not None and not previous.healthy:
+            logger.info("Health check %s recovered", name)
+        elif not result.healthy and (previous is None or previous.healthy):
+            logger.warning("Health check %s failed: %s", name, result.error)
+
+    async def run_checks(self) -> None:
+        await asyncio.gather(
+            *(self._run_check(name, check) for name, check in self.checks.items())
+        )
+        self.last_tick = self.clock()
+
+    def live(self) -> bool:
+        if self._task is None:
+            return True
+        if self._task.done():
+            return False
+        return (
+            self.last_tick is None or self.clock() - self.last_tick <= self.stale_after
+        )
+
+    def ready(self) -> bool:
+        now = self.clock()
+        return all(
+            name in self.results
+            and self.results[name].healthy
+            and now - self.results[name].checked_at <= self.stale_after
+            for name in self.checks
+        )
+
+    def status(self, name: str) -> str:
+        result = self.results.get(name)
+        if result is None:
+            return "unknown"
+        return "healthy" if result.healthy else "unhealthy"
+
+    def report(self) -> Dict[str, Any]:
+        now = self.clock()
+        return {
+            "status": "ready" if self.ready() else "unavailable",
+            "checks": {
+                name: (
+                    self.results[name].to_dict(now)
+                    if name in self.results
+                    else {"status": "unknown"}
+                )
+                for name in self.checks
+            },
+        }
+
+    async def start(self) -> None:
+        # The first round runs before returning, so the process reports
+        # ready as soon as its dependencies are.
+        await self.run_checks()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_checks()
+            except Exception as e:
+                logger.warning("Health checks failed to run: %s", e)
+
+
+def default_checks(rabbitmq: Any) -> Dict[str, Check]:
+    return {
+        "database": check_database,
+        "rabbitmq": rabbitmq_check(rabbitmq),
+        "storage": storage_check(),
+    }
+
+
+# One per process: the API and the worker each probe what they depend on.
+health_monitor = HealthMonitor(default_checks(rabbitmq_service))
@@ -1,69 +1,293 @@
+import asyncio
+import hashlib
 import logging
 import os
 import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
-import aiofiles
-from PIL import Image
+from app.config import RenditionSpec, settings
+from app.utils.metrics import PROCESSING_STAGE_SECONDS
+from app.utils.tracing import tracer
 
-from app.config import settings
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from app.services.engines import ResizeEngine
+
+# Pillow and aiofiles are imported where they are used: the API only needs
+# this module for uploads, and neither should slow down process start-up.
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def processing_stage(stage: str, size: str = "") -> Iterator[None]:
+    attributes = {"image.size": size} if size else None
+    with tracer.start_as_current_span(f"image.{stage}", attributes):
+        with PROCESSING_STAGE_SECONDS.time(stage=stage, size=size):
+            yield
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write via a temporary file and rename, so readers never see partial files."""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+COMPRESSED_SUFFIX = "_compressed"
+
+
+def renditions_fingerprint(specs: Optional[Tuple[RenditionSpec, ...]] = None) -> str:
+    """Fingerprint of the configured rendition set, used in idempotency keys."""
+    return _specs_fingerprint(settings.renditions if specs is None else specs)
+
+
+@lru_cache(maxsize=16)
+def _specs_fingerprint(specs: Tuple[RenditionSpec, ...]) -> str:
+    return _fingerprint(",".join(spec.key for spec in specs))
+
+
+@lru_cache(maxsize=64)
+def _fingerprint(value: str) -> str:
+    return hashlib.sha1(value.encode()).hexdigest()[:8]
+
+
+@dataclass
+class ImageAnalysis:
+    """What a job learns about an image besides its renditions."""
+
+    phash: Optional[int] = None
+    # ``data:`` URI of a tiny WebP (see app.services.placeholders).
+    placeholder: Optional[str] = None
+
+
 class ImageProcessingService:
     def __init__(self) -> None:
         self.upload_dir = Path(settings.upload_dir)
         self.original_dir = self.upload_dir / "original"
         self.thumbnails_dir = self.upload_dir / "thumbnails"
-        self._ensure_directories()
+        self._directories_ready = False
 
     def _ensure_directories(self) -> None:
-        self.original_dir.mkdir(parents=True, exist_ok=True)
-        self.thumbnails_dir.mkdir(parents=True, exist_ok=True)
+        # Done on first write instead of at construction, so importing the
+        # module has no filesystem side effects.
+        if not self._directories_ready:
+            self.original_dir.mkdir(parents=True, exist_ok=True)
+            self.thumbnails_dir.mkdir(parents=True, exist_ok=True)
+            self._directories_ready = True
 
-    async def save_original_image(self, file_content: bytes, filename: str) -> str:
+    async def save_original_image(self, file_content: bytes, filename: str, stem: Optional[str] = None) -> str:
+        # Naming the file after the image id (``stem``) lets the sweeper
+        # match files to rows by primary key.
         file_extension = Path(filename).suffix.lower()
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
+        unique_filename = f"{stem or uuid.uuid4()}{file_extension}"
         file_path = self.original_dir / unique_filename
         
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(file_content)
+        import aiofiles
+
+        self._ensure_directories()
+        with tracer.start_as_current_span("storage.write", {"file.bytes": len(file_content)}):
+            async with aiofiles.open(file_path, "wb") as f:
+                await f.write(file_content)
         
-        logger.info(f"Saved original image: {file_path}")
+        logger.info("Saved original image: %s", file_path)
         return str(file_path)
 
+    def rendition_path(self, original_file: Path, spec: RenditionSpec, animated: bool = False) -> Path:
+        # The spec fingerprint in the name makes an existing file a completion
+        # checkpoint for exactly this rendition: writes are atomic, so a file
+        # that exists is complete, and changed settings produce a new name.
+        stem = original_file.stem.removesuffix(COMPRESSED_SUFFIX)
+        if animated:
+            return self.thumbnails_dir / f"{stem}_{spec.label}_{_fingerprint(spec.key + ':anim')}.webp"
+        return self.thumbnails_dir / f"{stem}_{spec.label}_{_fingerprint(spec.key)}.{spec.extension}"
+
+    @staticmethod
+    def engine_for(img: "Image.Image") -> "ResizeEngine":
+        """The configured engine, or Pillow for sources it cannot handle."""
+        from app.services.engines import get_engine
+
+        engine = get_engine(settings.image_engine)
+        return engine if engine.supports(img) else get_engine("pillow")
+
+    @staticmethod
+    def _animate(spec: RenditionSpec) -> bool:
+        """Whether an animated source gets an animated rendition for ``spec``.
+
+        Larger sizes get a still poster (frame 0 only), which bounds the
+        memory and CPU an animation can take.
+        """
+        return (
+            settings.animation_mode == "animate"
+            and max(spec.width, spec.height) <= settings.animation_max_size
+        )
+
     async def create_thumbnails(self, original_path: str) -> Dict[str, str]:
+        renditions = await self.create_renditions(original_path)
+        return {size: info["path"] for size, info in renditions.items()}
+
+    async def create_renditions(self, original_path: str) -> Dict[str, Dict[str, Any]]:
+        """Create missing renditions and describe all of them.
+
+        Renditions already present on disk (e.g. from an interrupted earlier
+        attempt) are reused instead of being generated again.
+        """
+        renditions, _ = await self._run_renditions(original_path, analyse=False)
+        return renditions
+
+    async def create_renditions_with_analysis(
+        self, original_path: str, specs: Optional[Tuple[RenditionSpec, ...]] = None
+    ) -> Tuple[Dict[str, Dict[str, Any]], ImageAnalysis]:
+        """Like ``create_renditions``, plus the perceptual hash and placeholder.
+
+        Both are taken from the smallest intermediate already in memory;
+        only when every rendition was reused is the source decoded for them
+        (at reduced scale). ``specs`` defaults to ``settings.renditions``.
+        """
+        renditions, analysis = await self._run_renditions(original_path, analyse=True, specs=specs)
+        return renditions, analysis or ImageAnalysis()
+
+    async def _run_renditions(
+        self, original_path: str, analyse: bool, specs: Optional[Tuple[RenditionSpec, ...]] = None
+    ) -> Tuple[Dict[str, Dict[str, Any]], Optional[ImageAnalysis]]:
         original_file = Path(original_path)
         if not original_file.exists():
             raise FileNotFoundError(f"Original image not found: {original_path}")
         
-        thumbnails = {}
-        
         try:
-            with Image.open(original_file) as img:
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-                
-                for width, height in settings.thumbnail_size_list:
-                    thumbnail = img.copy()
-                    thumbnail.thumbnail((width, height), Image.Resampling.LANCZOS)
-                    
-                    thumbnail_filename = f"{original_file.stem}_{width}x{height}.jpg"
-                    thumbnail_path = self.thumbnails_dir / thumbnail_filename
-                    
-                    thumbnail.save(thumbnail_path, "JPEG", quality=85, optimize=True)
-                    
-                    thumbnails[f"{width}x{height}"] = str(thumbnail_path.relative_to(self.upload_dir))
-                    
-                    logger.info(f"Created thumbnail: {thumbnail_path}")
-        
+            # Pillow releases the GIL while resizing and encoding, so running
+            # the work in a thread keeps the event loop free and lets several
+            # jobs share the CPU cores.
+            return await asyncio.to_thread(
+                self._create_renditions_sync, original_file, analyse, settings.renditions if specs is None else specs
+            )
         except Exception as e:
-            logger.error(f"Failed to create thumbnails for {original_path}: {e}")
+            logger.error("Failed to create thumbnails for %s: %s", original_path, e)
             raise
+
+    def _create_renditions_sync(
+        self, original_file: Path, analyse: bool, specs: Tuple[RenditionSpec, ...]
+    ) -> Tuple[Dict[str, Dict[str, Any]], Optional[ImageAnalysis]]:
+        from PIL import Image
+
+        from app.services.animation import is_animated
+
+        renditions: Dict[str, Dict[str, Any]] = {}
+        smallest: Optional["Image.Image"] = None
+        missing = []
+        
+        # Opening only parses the header; nothing is decoded until needed.
+        with Image.open(original_file) as img:
+            animated_source = is_animated(img)
+            for spec in specs:
+                animated = animated_source and self._animate(spec)
+                thumbnail_path = self.rendition_path(original_file, spec, animated)
+                renditions[spec.label] = {
+                    "path": str(thumbnail_path.relative_to(self.upload_dir)),
+                    "key": spec.key,
+                    "format": "webp" if animated else spec.format,
+                    "mode": spec.mode,
+                }
+                if animated:
+                    renditions[spec.label]["animated"] = True
+                if thumbnail_path.exists():
+                    logger.debug("Reusing existing thumbnail: %s", thumbnail_path)
+                else:
+                    missing.append((spec, thumbnail_path, animated))
+            
+            if missing:
+                self._ensure_directories()
+                stills = [(spec, path) for spec, path, animated in missing if not animated]
+                moving = [(spec, path) for spec, path, animated in missing if animated]
+                if moving:
+                    smallest = self._render_animated(img, moving, renditions)
+                if stills:
+                    img.seek(0)
+                    smallest = self.engine_for(img).render_stills(img, original_file, stills, renditions)
+            
+            analysis = self._analyse(img, original_file, smallest) if analyse else None
+        
+        return renditions, analysis
+
+    def _analyse(self, img: "Image.Image", source: Path, smallest: Optional["Image.Image"]) -> ImageAnalysis:
+        from app.services.placeholders import placeholder
+        from app.services.similarity import dhash
+
+        # Everything here is best effort; the renditions are what matter.
+        analysis = ImageAnalysis()
+        try:
+            if smallest is None:
+                smallest = self.engine_for(img).preview(img, source, 64)
+        except Exception as e:
+            logger.warning("Failed to decode image for analysis: %s", e)
+            return analysis
+        try:
+            with processing_stage("hash"):
+                analysis.phash = dhash(smallest)
+        except Exception as e:
+            logger.warning("Failed to compute perceptual hash: %s", e)
+        try:
+            with processing_stage("placeholder"):
+                analysis.placeholder = placeholder(
+                    smallest, settings.placeholder_size, settings.placeholder_quality
+                )
+        except Exception as e:
+            logger.warning("Failed to create placeholder: %s", e)
+        return analysis
+
+    def _render_animated(
+        self, img: "Image.Image", missing: List[Tuple[RenditionSpec, Path]], renditions: Dict[str, Dict[str, Any]]
+    ) -> Optional["Image.Image"]:
+        """Render animated WebP renditions, decoding each source frame once.
+
+        Returns the smallest intermediate of frame 0.
+        """
+        from app.services.animation import encode_animated_webp, iter_frames
+        from app.services.metadata import ImageMetadata, oriented_size
+        from app.services.renditions import covers, intermediate_size, render
+
+        transpose = ImageMetadata.read(img).transpose
+        original_size = oriented_size(img.size, transpose)
+        sizes = {spec: intermediate_size(original_size, spec) for spec, _ in missing}
+        missing.sort(key=lambda item: sizes[item[0]][0] * sizes[item[0]][1], reverse=True)
+        frames: Dict[RenditionSpec, List[Any]] = {spec: [] for spec, _ in missing}
+        durations = []
+        smallest: Optional["Image.Image"] = None
+        
+        with processing_stage("resize", "animated"):
+            for frame, duration in iter_frames(
+                img, settings.animation_max_frames, settings.animation_max_duration_ms
+            ):
+                durations.append(duration)
+                source = frame
+                for spec, _ in missing:
+                    if source is frame or not covers(source, sizes[spec]):
+                        source, output = render(frame, original_size, spec, transpose)
+                    else:
+                        source, output = render(source, original_size, spec)
+                    frames[spec].append(output)
+                if smallest is None:
+                    smallest = source
         
-        return thumbnails
+        loop = int(img.info.get("loop", 0))
+        for spec, thumbnail_path in missing:
+            with processing_stage("encode", spec.label):
+                data = encode_animated_webp(frames[spec], durations, spec.quality, loop)
+            with processing_stage("write", spec.label):
+                write_atomic(thumbnail_path, data)
+            first = frames[spec][0]
+            renditions[spec.label].update(width=first.width, height=first.height, frames=len(durations))
+            logger.debug("Created animated thumbnail: %s (%s frames)", thumbnail_path, len(durations))
+        return smallest
 
     async def compress_image(self, image_path: str, quality: int = 85) -> str:
         file_path = Path(image_path)
@@ -71,26 +295,46 @@ class ImageProcessingService:
             raise FileNotFoundError(f"Image not found: {image_path}")
         
         try:
-            with Image.open(file_path) as img:
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-                
-                compressed_filename = f"{file_path.stem}_compressed.jpg"
-                compressed_path = file_path.parent / compressed_filename
-                
-                img.save(compressed_path, "JPEG", quality=quality, optimize=True)
-                
-                logger.info(f"Compressed image: {compressed_path}")
-                return str(compressed_path)
-        
+            compressed_path = await asyncio.to_thread(self._compress_image_sync, file_path, quality)
+            logger.info("Compressed image: %s", compressed_path)
+            return compressed_path
         except Exception as e:
-            logger.error(f"Failed to compress image {image_path}: {e}")
+            logger.error("Failed to compress image %s: %s", image_path, e)
             raise
 
+    def compressed_path(self, image_path: str, extension: str = ".jpg") -> Path:
+        file_path = Path(image_path)
+        return file_path.parent / f"{file_path.stem}{COMPRESSED_SUFFIX}{extension}"
+
+    def _compress_image_sync(self, file_path: Path, quality: int) -> str:
+        from PIL import Image
+
+        from app.services.animation import is_animated
+
+        with Image.open(file_path) as img:
+            if settings.animation_mode == "animate" and is_animated(img):
+                # Re-encoding every frame at full size is expensive and GIF
+                # and WebP are already compressed: keep the animation as-is,
+                # so it can be rendered again later (e.g. by a backfill).
+                compressed_path = self.compressed_path(str(file_path), file_path.suffix.lower())
+                if not compressed_path.exists():
+                    with processing_stage("write", "original"):
+                        write_atomic(compressed_path, file_path.read_bytes())
+                return str(compressed_path)
+
+            compressed_path = self.compressed_path(str(file_path))
+            if compressed_path.exists():
+                return str(compressed_path)
+            self.engine_for(img).compress(img, file_path, compressed_path, quality)
+        
+        return str(compressed_path)
+
     def get_file_size(self, file_path: str) -> int:
         return Path(file_path).stat().st_size
 
     def is_valid_image(self, file_path: str) -> bool:
+        from PIL import Image
+
         try:
             with Image.open(file_path) as img:
                 img.verify()
@@ -98,7 +342,9 @@ class ImageProcessingService:
         except Exception:
             return False
 
-    def get_image_info(self, file_path: str) -> Dict[str, int]:
+    def get_image_info(self, file_path: str) -> Dict[str, Any]:
+        from PIL import Image
+
         try:
             with Image.open(file_path) as img:
                 return {
@@ -108,7 +354,7 @@ class ImageProcessingService:
                     "format": img.format
                 }
         except Exception as e:
-            logger.error(f"Failed to get image info for {file_path}: {e}")
+            logger.error("Failed to get image info for %s: %s", file_path, e)
             raise
 
     async def cleanup_file(self, file_path: str) -> None:
@@ -116,9 +362,9 @@ class ImageProcessingService:
             path = Path(file_path)
             if path.exists():
                 path.unlink()
-                logger.info(f"Cleaned up file: {file_path}")
+                logger.info("Cleaned up file: %s", file_path)
         except Exception as e:
-            logger.error(f"Failed to cleanup file {file_path}: {e}")
+            logger.error("Failed to cleanup file %s: %s", file_path, e)
 
 
 image_processing_service = ImageProcessingService()
@@ -0,0 +1,49 @@
+"""Decode memory estimates read from image headers.
+
+What a job costs in memory depends on the pixel count, not the file size: a
+2 MB PNG of a flat 10000x10000 area decodes to 400 MB. ``Image.open`` reads
+only the header, so the estimate is cheap enough to make for every job
+before it is started.
+
+The estimate is deliberately pessimistic. It assumes a full-size decode,
+although the JPEG draft mode usually decodes at a fraction of the size.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Bytes per pixel of Pillow's in-memory image, which pads RGB and the other
+# 3-band modes to 4 bytes.
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16B": 2, "I;16L": 2, "I": 4, "F": 4}
+DEFAULT_MODE_BYTES = 4
+# The decoded source plus one working copy (mode conversion, EXIF transpose,
+# the preview kept for hashing and the placeholder).
+WORKING_COPIES = 2
+
+
+def decode_bytes(width: int, height: int, mode: str) -> int:
+    return width * height * MODE_BYTES.get(mode, DEFAULT_MODE_BYTES) * WORKING_COPIES
+
+
+def inspect_decode_bytes(path: str) -> Optional[int]:
+    """Estimate for the image at ``path``; None when its header cannot be read."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            return decode_bytes(img.width, img.height, img.mode)
+    except Image.DecompressionBombError:
+        # Too big for Pillow to open at all: it will fail fast, not eat memory.
+        return None
+    except Exception as e:
+        logger.debug("Cannot estimate decode memory of %s: %s", path, e)
+        return None
+
+
+async def estimate_decode_bytes(path: Optional[str]) -> Optional[int]:
+    if not path:
+        return None
+    return await asyncio.to_thread(inspect_decode_bytes, path)
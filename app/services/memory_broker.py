@@ -0,0 +1,232 @@
+"""In-process broker with the interface of ``RabbitMQService`` (``BROKER=memory``).
+
+For single-process deployments (edge, development, tests, benchmarks): jobs
+published by the API are delivered to consumers running in the same process
+(``EMBEDDED_WORKER``) without a network hop. Queues, lanes and routing keys
+mirror the RabbitMQ topology, and deliveries are acked, rejected and
+requeued the same way, so the worker code does not know the difference.
+
+Messages live in memory only. Jobs queued when the process stops are lost;
+their images stay in ``PROCESSING`` until the embedded worker queues them
+again on the next start.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from app.services.rabbitmq import (
+    ENQUEUED_AT_HEADER,
+    LEGACY_ROUTING_KEY,
+    QUEUE_NAME,
+    RabbitMQService,
+)
+from app.utils.metrics import LANE_QUEUE_DEPTH, PUBLISH_SECONDS
+from app.utils.tracing import inject, tracer
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[["InMemoryMessage"], Coroutine[Any, Any, None]]
+
+
+class InMemoryConnection:
+    """Stands in for the AMQP connection the health check looks at."""
+
+    is_closed = False
+
+
+class InMemoryMessage:
+    def __init__(
+        self,
+        queue: "InMemoryQueue",
+        body: bytes,
+        headers: Dict[str, Any],
+        routing_key: str,
+    ) -> None:
+        self.queue = queue
+        self.body = body
+        self.headers = headers
+        self.routing_key = routing_key
+        self.redelivered = False
+        self.processed = False
+
+    async def ack(self) -> None:
+        self._settle(requeue=False)
+
+    async def reject(self, requeue: bool = False) -> None:
+        self._settle(requeue)
+
+    async def nack(self, requeue: bool = True) -> None:
+        self._settle(requeue)
+
+    def _settle(self, requeue: bool) -> None:
+        if self.processed:
+            raise RuntimeError("Message already processed")
+        self.processed = True
+        self.queue.settled(self, requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False) -> AsyncIterator["InMemoryMessage"]:
+        """Ack on success, reject on any exception (cancellation included)."""
+        try:
+            yield self
+        except BaseException:
+            if not self.processed:
+                await self.reject(requeue=requeue)
+            raise
+        else:
+            if not self.processed:
+                await self.ack()
+
+
+class InMemoryQueue:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.ready: Deque[InMemoryMessage] = deque()
+        self.unacked = 0
+        self.prefetch = 0  # 0 = unlimited, as in AMQP
+        self.callback: Optional[Callback] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def put(self, message: InMemoryMessage) -> None:
+        self.ready.append(message)
+        self.deliver()
+
+    def settled(self, message: InMemoryMessage, requeue: bool) -> None:
+        self.unacked -= 1
+        if requeue:
+            # Back to the head of the queue, as RabbitMQ does.
+            requeued = InMemoryMessage(
+                self, message.body, message.headers, message.routing_key
+            )
+            requeued.redelivered = True
+            self.ready.appendleft(requeued)
+        self.deliver()
+
+    def deliver(self) -> None:
+        while (
+            self.callback is not None
+            and self.ready
+            and (not self.prefetch or self.unacked < self.prefetch)
+        ):
+            message = self.ready.popleft()
+            self.unacked += 1
+            task = asyncio.get_running_loop().create_task(self.callback(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+class InMemoryBroker(RabbitMQService):
+    def __init__(self) -> None:
+        super().__init__()
+        self.memory_queues: Dict[str, InMemoryQueue] = {}
+
+    def reset_after_fork(self) -> None:
+        # Queued messages belong to the parent process; the child starts empty.
+        if self._pid != os.getpid():
+            self.memory_queues = {}
+        super().reset_after_fork()
+
+    async def connect(self) -> None:
+        from app.services.tenancy import lanes
+
+        self.reset_after_fork()
+        for lane in lanes():
+            self.memory_queues.setdefault(lane.queue, InMemoryQueue(lane.queue))
+        self.connection = InMemoryConnection()  # type: ignore[assignment]
+        logger.info("Using the in-memory broker")
+
+    async def adopt_queues(self, names: Iterable[str]) -> List[str]:
+        # Memory queues do not outlive the process that declared them.
+        return list(names)
+
+    async def disconnect(self) -> None:
+        self.connection = None
+        self.consumer_tags = {}
+        for queue in self.memory_queues.values():
+            queue.callback = None
+
+    def _route(self, routing_key: str) -> Optional[InMemoryQueue]:
+        if routing_key == LEGACY_ROUTING_KEY:
+            routing_key = QUEUE_NAME
+        return self.memory_queues.get(routing_key)
+
+    async def publish_message(self, routing_key: str, message: Dict[str, Any]) -> None:
+        if self.connection is None:
+            raise RuntimeError("Broker not connected")
+        queue = self._route(routing_key)
+        if queue is None:
+            # A direct exchange drops messages no queue is bound for.
+            logger.warning(
+                "No queue bound for routing key %s, message dropped", routing_key
+            )
+            return
+        with (
+            tracer.start_as_current_span(
+                "rabbitmq.publish", {"messaging.routing_key": routing_key}
+            ),
+            PUBLISH_SECONDS.time(routing_key=routing_key),
+        ):
+            headers: Dict[str, Any] = {ENQUEUED_AT_HEADER: time.time()}
+            inject(headers)
+            queue.put(
+                InMemoryMessage(
+                    queue, json.dumps(message).encode(), headers, routing_key
+                )
+            )
+        logger.debug("Published message to queue: %s", routing_key)
+
+    async def set_prefetch(self, prefetch_count: int) -> None:
+        for queue in self.memory_queues.values():
+            queue.prefetch = prefetch_count
+            queue.deliver()
+
+    async def get_lane_stats(self) -> Dict[str, Tuple[int, int]]:
+        if self.connection is None:
+            raise RuntimeError("Broker not connected")
+        stats = {}
+        for name, queue in self.memory_queues.items():
+            stats[name] = (len(queue.ready), int(queue.callback is not None))
+            LANE_QUEUE_DEPTH.set(stats[name][0], lane=name)
+        return stats
+
+    async def consume_messages(self, callback: Callback) -> None:
+        if not self.memory_queues:
+            raise RuntimeError("Broker queues not initialized")
+        for name, queue in self.memory_queues.items():
+            queue.callback = callback
+            self.consumer_tags[name] = f"memory-{name}"
+            queue.deliver()
+        logger.info(
+            "Started consuming messages from %s queue(s)", len(self.memory_queues)
+        )
+
+    async def stop_consuming(self) -> None:
+        for name in self.consumer_tags:
+            self.memory_queues[name].callback = None
+        if self.consumer_tags:
+            logger.info("Stopped consuming messages from queue")
+        self.consumer_tags = {}
+
+    async def ack_message(self, message: InMemoryMessage) -> None:  # type: ignore[override]
+        await message.ack()
+
+    async def nack_message(self, message: InMemoryMessage, requeue: bool = True) -> None:  # type: ignore[override]
+        await message.nack(requeue=requeue)
@@ -0,0 +1,135 @@
+"""EXIF orientation, colour profile and metadata handling for renditions.
+
+Orientation is applied to the downscaled intermediate rather than to the
+decoded original, so honouring it costs a transpose of a thumbnail-sized
+image. What metadata is written to the outputs is governed by
+``settings.metadata_policy``:
+
+- ``strip``: no EXIF, XMP or ICC; pixels with a non-sRGB profile are
+  converted to sRGB first, so colours stay right without the profile;
+- ``icc``: keep the ICC profile, drop EXIF and XMP;
+- ``keep``: keep the ICC profile and EXIF (orientation reset, embedded
+  preview dropped).
+"""
+
+import io
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import ExifTags, Image
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_TAG = 0x0112
+
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_SWAPS_AXES = {
+    Image.Transpose.TRANSPOSE,
+    Image.Transpose.ROTATE_270,
+    Image.Transpose.TRANSVERSE,
+    Image.Transpose.ROTATE_90,
+}
+
+
+def swaps_axes(transpose: Optional[Image.Transpose]) -> bool:
+    return transpose in _SWAPS_AXES
+
+
+def oriented_size(
+    size: Tuple[int, int], transpose: Optional[Image.Transpose]
+) -> Tuple[int, int]:
+    return (size[1], size[0]) if swaps_axes(transpose) else size
+
+
+@lru_cache(maxsize=8)
+def _srgb_transform(icc_profile: bytes, mode: str) -> Optional[Any]:
+    """Transform from ``icc_profile`` to sRGB, or None if already sRGB."""
+    from PIL import ImageCms
+
+    source = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+    if "srgb" in ImageCms.getProfileDescription(source).lower():
+        return None
+    return ImageCms.buildTransform(source, ImageCms.createProfile("sRGB"), mode, "RGB")
+
+
+@dataclass
+class ImageMetadata:
+    transpose: Optional[Image.Transpose] = None
+    icc_profile: Optional[bytes] = None
+    exif: Optional[Image.Exif] = None
+    exif_data: bytes = field(default=b"", repr=False)
+
+    @classmethod
+    def read(cls, img: Image.Image) -> "ImageMetadata":
+        """Read from the header only; nothing is decoded."""
+        exif = img.getexif()
+        return cls(
+            transpose=_TRANSPOSE.get(exif.get(ORIENTATION_TAG, 1)),
+            icc_profile=img.info.get("icc_profile") or None,
+            exif=exif,
+            exif_data=img.info.get("exif", b""),
+        )
+
+    def embedded_thumbnail(self) -> Optional[Image.Image]:
+        """The JPEG preview stored in EXIF IFD1, decoded, if there is one."""
+        if self.exif is None or not self.exif_data:
+            return None
+        try:
+            ifd1 = self.exif.get_ifd(ExifTags.IFD.IFD1)
+            offset, length = ifd1.get(0x0201), ifd1.get(0x0202)
+            if not offset or not length:
+                return None
+            tiff = (
+                self.exif_data[6:]
+                if self.exif_data.startswith(b"Exif\x00\x00")
+                else self.exif_data
+            )
+            thumbnail = Image.open(io.BytesIO(tiff[offset : offset + length]))
+            thumbnail.load()
+            return thumbnail.convert("RGB")
+        except Exception as e:
+            logger.debug("Ignoring unreadable EXIF thumbnail: %s", e)
+            return None
+
+    def prepare(self, image: Image.Image, policy: str) -> Image.Image:
+        """Colour-convert ``image`` if the profile is about to be dropped."""
+        if (
+            policy != "strip"
+            or not self.icc_profile
+            or image.mode not in ("RGB", "CMYK", "L")
+        ):
+            return image
+        try:
+            transform = _srgb_transform(self.icc_profile, image.mode)
+        except Exception as e:
+            logger.debug("Ignoring unusable ICC profile: %s", e)
+            return image
+        if transform is None:
+            return image
+        from PIL import ImageCms
+
+        converted = ImageCms.applyTransform(image, transform)
+        # None only for in-place transforms, which this is not.
+        return image if converted is None else converted
+
+    def save_options(self, policy: str) -> Dict[str, Any]:
+        options: Dict[str, Any] = {}
+        if policy in ("icc", "keep") and self.icc_profile:
+            options["icc_profile"] = self.icc_profile
+        if policy == "keep" and self.exif_data:
+            exif = Image.Exif()
+            exif.load(self.exif_data)
+            # Pixels are already upright; the embedded preview is not rewritten.
+            exif[ORIENTATION_TAG] = 1
+            options["exif"] = exif.tobytes()
+        return options
@@ -0,0 +1,38 @@
+"""Inline low-quality image placeholders (LQIP).
+
+A placeholder is the image scaled down to a few pixels on its longest side
+and encoded as WebP, returned as a ``data:`` URI so clients can show it
+(stretched, usually with a CSS blur) in the same response that lists the
+image, before any thumbnail has been fetched. At 16 px it is typically
+100-300 bytes.
+
+A plain image was chosen over BlurHash because browsers render it as is,
+with no decoder on the client.
+"""
+
+import base64
+import io
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image as PILImage
+
+DATA_URI_PREFIX = "data:image/webp;base64,"
+
+
+def placeholder(image: "PILImage.Image", max_side: int, quality: int) -> Optional[str]:
+    """``data:`` URI of ``image`` scaled to ``max_side`` px; None when disabled."""
+    from PIL import Image
+
+    if max_side <= 0:
+        return None
+    scale = min(1.0, max_side / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    small = image.resize(size, Image.Resampling.BOX, reducing_gap=2.0)
+
+    buffer = io.BytesIO()
+    small.save(buffer, "WEBP", quality=quality, method=6)
+    return DATA_URI_PREFIX + base64.b64encode(buffer.getvalue()).decode("ascii")
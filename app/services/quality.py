@@ -0,0 +1,221 @@
+"""Adaptive JPEG/WebP quality (``QUALITY_MODE``).
+
+A fixed quality over-spends bytes on simple images (flat areas, graphics)
+and under-serves detailed ones. With a target, each rendition, and the
+compressed original, is encoded at the quality chosen for it:
+
+- ``ssim``: the lowest quality whose output still has an SSIM of at least
+  ``quality_target_ssim`` against the unencoded image;
+- ``size``: the highest quality whose output fits ``quality_target_bpp``
+  bits per pixel.
+
+The search is a bisection over ``quality_min..quality_max`` that starts at
+the quality chosen for the previous rendition of the same job (sizes of one
+image tend to land close together) and stops once the bracket is narrower
+than ``TOLERANCE``. Large images are searched on a centre crop of at most
+``SAMPLE_SIDE`` px and encoded in full once. Each job has
+``quality_search_seconds`` of search time; when it runs out, the best
+quality found so far is used, or the configured one.
+
+SSIM is computed on luma over 8x8 blocks with Pillow alone (block means via
+box resizing), which is accurate enough to rank qualities and needs no
+numpy. Animated renditions keep their configured quality.
+"""
+
+import contextvars
+import io
+import logging
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Tuple
+
+from app.config import QualityTarget, settings
+from app.utils.metrics import QUALITY_CHOSEN, QUALITY_PROBES
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+TOLERANCE = 2
+SAMPLE_SIDE = 1024
+SSIM_BLOCK = 8
+# SSIM stabilising constants for 8-bit data (K1=0.01, K2=0.03).
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+class SearchSession:
+    """Search time left and qualities chosen so far, for one job."""
+
+    def __init__(self, seconds: float) -> None:
+        self.deadline = time.perf_counter() + seconds
+        self.chosen: Dict[str, int] = {}
+
+    @property
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.deadline
+
+
+_session: contextvars.ContextVar[Optional[SearchSession]] = contextvars.ContextVar(
+    "quality_search_session", default=None
+)
+
+
+@contextmanager
+def search_session(seconds: Optional[float] = None) -> Iterator[SearchSession]:
+    """One search budget for everything run inside, ``asyncio.to_thread`` included."""
+    session = SearchSession(
+        settings.quality_search_seconds if seconds is None else seconds
+    )
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+
+
+def current_session() -> SearchSession:
+    # Outside a job (benchmarks, direct calls) every search gets its own budget.
+    return _session.get() or SearchSession(settings.quality_search_seconds)
+
+
+def ssim(reference: "Image.Image", other: "Image.Image") -> float:
+    """Mean SSIM of the luma of two images of the same size, over 8x8 blocks."""
+    from PIL import Image, ImageMath
+
+    blocks = (
+        max(1, reference.width // SSIM_BLOCK),
+        max(1, reference.height // SSIM_BLOCK),
+    )
+    area = (
+        0,
+        0,
+        min(reference.width, blocks[0] * SSIM_BLOCK),
+        min(reference.height, blocks[1] * SSIM_BLOCK),
+    )
+    x = reference.convert("L").crop(area).convert("F")
+    y = other.convert("L").crop(area).convert("F")
+
+    def mean(image: "Image.Image") -> "Image.Image":
+        return image.resize(blocks, Image.Resampling.BOX)
+
+    def product(a: "Image.Image", b: "Image.Image") -> "Image.Image":
+        result: "Image.Image" = ImageMath.lambda_eval(
+            lambda args: args["a"] * args["b"], a=a, b=b
+        )
+        return result
+
+    stats = {
+        "mx": mean(x),
+        "my": mean(y),
+        "xx": mean(product(x, x)),
+        "yy": mean(product(y, y)),
+        "xy": mean(product(x, y)),
+    }
+    scores = ImageMath.lambda_eval(
+        lambda v: (
+            (v["mx"] * v["my"] * 2 + _C1) * ((v["xy"] - v["mx"] * v["my"]) * 2 + _C2)
+        )
+        / (
+            (v["mx"] * v["mx"] + v["my"] * v["my"] + _C1)
+            * (v["xx"] - v["mx"] * v["mx"] + v["yy"] - v["my"] * v["my"] + _C2)
+        ),
+        **stats,
+    )
+    return float(scores.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0)))
+
+
+def sample_box(
+    width: int, height: int, side: int = SAMPLE_SIDE
+) -> Tuple[int, int, int, int]:
+    """``(left, top, width, height)`` of the centre crop the search runs on."""
+    # Aligned to 16 px so the crop keeps the JPEG block and chroma grid.
+    left = (max(0, width - side) // 2) & ~15
+    top = (max(0, height - side) // 2) & ~15
+    return left, top, min(side, width), min(side, height)
+
+
+def centre_sample(image: "Image.Image", side: int = SAMPLE_SIDE) -> "Image.Image":
+    if image.width <= side and image.height <= side:
+        return image
+    left, top, width, height = sample_box(image.width, image.height, side)
+    return image.crop((left, top, left + width, top + height))
+
+
+def _passes(target: QualityTarget, reference: "Image.Image", data: bytes) -> bool:
+    from PIL import Image
+
+    if target.metric == "size":
+        return len(data) * 8 <= target.value * reference.width * reference.height
+    with Image.open(io.BytesIO(data)) as decoded:
+        return ssim(reference, decoded) >= target.value
+
+
+def choose_quality(
+    reference: "Image.Image",
+    encode: Callable[[int], bytes],
+    target: QualityTarget,
+    fallback: int,
+    hint: str = "",
+) -> Tuple[int, Optional[bytes]]:
+    """Quality for ``reference``, and ``encode(quality)`` if the search produced it.
+
+    ``hint`` names the kind of output (e.g. its format); the quality chosen
+    for the last one seeds the next search in the same job.
+    """
+    session = current_session()
+    low, high = target.minimum, target.maximum
+    probe = min(high, max(low, session.chosen.get(hint, fallback)))
+    # "ssim" wants the lowest passing quality, "size" the highest.
+    lowest = target.metric == "ssim"
+    best: Optional[Tuple[int, bytes]] = None
+    probes = 0
+    while low <= high and not session.expired:
+        data = encode(probe)
+        probes += 1
+        if _passes(target, reference, data):
+            best = (probe, data)
+            if lowest:
+                high = probe - 1
+            else:
+                low = probe + 1
+        elif lowest:
+            low = probe + 1
+        else:
+            high = probe - 1
+        if best is not None and high - low < TOLERANCE:
+            break
+        probe = (low + high) // 2
+    QUALITY_PROBES.inc(probes, metric=target.metric)
+
+    chosen: Tuple[int, Optional[bytes]]
+    if best is not None:
+        chosen = best
+    elif session.expired:
+        chosen = fallback, None
+    else:
+        # Nothing in the range passes: get as close to the target as it allows.
+        chosen = (target.maximum if lowest else target.minimum), None
+    session.chosen[hint] = chosen[0]
+    QUALITY_CHOSEN.observe(chosen[0], metric=target.metric)
+    return chosen
+
+
+def encode_adaptive(
+    image: "Image.Image",
+    encode: Callable[["Image.Image", int], bytes],
+    quality: int,
+    target: Optional[QualityTarget],
+    hint: str = "",
+) -> Tuple[bytes, int]:
+    """Encode a Pillow image at the quality ``target`` calls for (``quality`` without one)."""
+    if target is None:
+        return encode(image, quality), quality
+    sample = centre_sample(image)
+    chosen, data = choose_quality(
+        sample, lambda q: encode(sample, q), target, quality, hint
+    )
+    if data is None or sample is not image:
+        data = encode(image, chosen)
+    return data, chosen
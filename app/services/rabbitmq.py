@@ -1,44 +1,120 @@
 import json
 import logging
-from typing import Any, Dict
-
-import aio_pika
-from aio_pika import Connection, Exchange, Message, Queue
-from aio_pika.abc import AbstractIncomingMessage
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Tuple
 
 from app.config import settings
+from app.utils.metrics import LANE_QUEUE_DEPTH, PUBLISH_SECONDS
+from app.utils.tracing import inject, tracer
+
+if TYPE_CHECKING:
+    from aio_pika import Connection
+    from aio_pika.abc import (
+        AbstractExchange,
+        AbstractIncomingMessage,
+        AbstractQueue,
+        AbstractRobustChannel,
+    )
+
+ENQUEUED_AT_HEADER = "x-enqueued-at"
+QUEUE_NAME = "images"
+# Routing key of QUEUE_NAME from before jobs were routed per tenant lane.
+LEGACY_ROUTING_KEY = "image_processing"
 
 logger = logging.getLogger(__name__)
 
 
 class RabbitMQService:
     def __init__(self) -> None:
-        self.connection: Connection | None = None
-        self.channel: aio_pika.Channel | None = None
-        self.exchange: Exchange | None = None
-        self.queue: Queue | None = None
+        self.connection: "Connection | None" = None
+        self.channel: "AbstractRobustChannel | None" = None
+        self.exchange: "AbstractExchange | None" = None
+        self.queue: "AbstractQueue | None" = None
+        # Every lane's queue by name (see app.services.tenancy); ``queue``
+        # is lane 0.
+        self.queues: Dict[str, "AbstractQueue"] = {}
+        self.consumer_tags: Dict[str, str] = {}
+        self._pid = os.getpid()
+
+    def reset_after_fork(self) -> None:
+        """Drop connection state inherited from the parent process.
+
+        The socket belongs to the parent, so it must not be closed or reused
+        here; the child connects again from its own lifespan.
+        """
+        if self._pid != os.getpid():
+            self.connection = None
+            self.channel = None
+            self.exchange = None
+            self.queue = None
+            self.queues = {}
+            self.consumer_tags = {}
+            self._pid = os.getpid()
 
     async def connect(self) -> None:
+        # aio_pika (and aiormq under it) is only needed once we connect.
+        import aio_pika
+
+        from app.services.tenancy import lanes
+
+        self.reset_after_fork()
         try:
             self.connection = await aio_pika.connect_robust(settings.rabbitmq_url)
             self.channel = await self.connection.channel()
             
-            self.exchange = await self.channel.declare_exchange(
+            exchange = await self.channel.declare_exchange(
                 "image_processing", aio_pika.ExchangeType.DIRECT
             )
+            self.exchange = exchange
             
-            self.queue = await self.channel.declare_queue(
-                "images", durable=True
-            )
-            
-            await self.queue.bind(self.exchange, "image_processing")
+            self.queues = {}
+            for lane in lanes():
+                queue = await self.channel.declare_queue(lane.queue, durable=True)
+                await queue.bind(exchange, lane.queue)
+                self.queues[lane.queue] = queue
+            self.queue = self.queues[QUEUE_NAME]
+            await self.queue.bind(exchange, LEGACY_ROUTING_KEY)
             
             logger.info("Connected to RabbitMQ successfully")
             
         except Exception as e:
-            logger.error(f"Failed to connect to RabbitMQ: {e}")
+            logger.error("Failed to connect to RabbitMQ: %s", e)
             raise
 
+    async def adopt_queues(self, names: Iterable[str]) -> List[str]:
+        """Consume lane queues of an earlier lane layout along with the current ones.
+
+        Their messages are scheduled in lane 0. Returns the names that are
+        gone: queues that no longer exist, and empty unused ones, which are
+        deleted here.
+        """
+        from aio_pika.exceptions import ChannelNotFoundEntity
+
+        if not self.connection or not self.channel:
+            raise RuntimeError("RabbitMQ not connected")
+        gone = []
+        for name in names:
+            try:
+                # A passive declare of a missing queue closes its channel.
+                async with self.connection.channel() as probe:
+                    queue = await probe.declare_queue(name, passive=True)
+                    result = queue.declaration_result
+                    if not result.message_count and not result.consumer_count:
+                        await queue.delete(if_unused=True, if_empty=True)
+                        gone.append(name)
+                        continue
+            except ChannelNotFoundEntity:
+                gone.append(name)
+                continue
+            self.queues[name] = await self.channel.declare_queue(name, durable=True)
+            logger.warning(
+                "Consuming %s messages left in %s, a lane of an earlier layout",
+                result.message_count,
+                name,
+            )
+        return gone
+
     async def disconnect(self) -> None:
         if self.connection and not self.connection.is_closed:
             await self.connection.close()
@@ -47,44 +123,118 @@ class RabbitMQService:
     async def publish_message(self, routing_key: str, message: Dict[str, Any]) -> None:
         if not self.channel or not self.exchange:
             raise RuntimeError("RabbitMQ not connected")
-            
+        
+        import aio_pika
+
         try:
             message_body = json.dumps(message).encode()
-            await self.exchange.publish(
-                Message(message_body, delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
-                routing_key=routing_key
-            )
-            logger.info(f"Published message to queue: {routing_key}")
+            with tracer.start_as_current_span(
+                "rabbitmq.publish", {"messaging.routing_key": routing_key}
+            ), PUBLISH_SECONDS.time(routing_key=routing_key):
+                headers: Dict[str, Any] = {ENQUEUED_AT_HEADER: time.time()}
+                inject(headers)
+                await self.exchange.publish(
+                    aio_pika.Message(
+                        message_body,
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        headers=headers,
+                    ),
+                    routing_key=routing_key
+                )
+            logger.debug("Published message to queue: %s", routing_key)
             
         except Exception as e:
-            logger.error(f"Failed to publish message: {e}")
+            logger.error("Failed to publish message: %s", e)
             raise
 
+    async def publish_job(self, message: Dict[str, Any]) -> None:
+        """Publish a processing job to the lane of its ``tenant``.
+
+        The decode memory estimate is added to the message (the worker
+        admits jobs by it) and picks the large-image lane for big images.
+        """
+        from app.services.memory import estimate_decode_bytes
+        from app.services.tenancy import lane_for
+
+        if "decode_bytes" not in message:
+            message = {**message, "decode_bytes": await estimate_decode_bytes(message.get("original_path"))}
+        lane = lane_for(message.get("tenant"), message["decode_bytes"])
+        await self.publish_message(lane.queue, message)
+
+    async def set_prefetch(self, prefetch_count: int) -> None:
+        """Limit how many unacknowledged messages this consumer holds."""
+        if not self.channel:
+            raise RuntimeError("RabbitMQ not connected")
+        await self.channel.set_qos(prefetch_count=prefetch_count)
+        logger.debug("Prefetch count set to %s", prefetch_count)
+
+    async def get_lane_stats(self) -> Dict[str, Tuple[int, int]]:
+        """Return (ready messages, consumers) per lane via passive queue declares."""
+        if not self.channel:
+            raise RuntimeError("RabbitMQ not connected")
+        stats = {}
+        for name in self.queues or (QUEUE_NAME,):
+            queue = await self.channel.declare_queue(name, passive=True, robust=False)
+            result = queue.declaration_result
+            stats[name] = (result.message_count or 0, result.consumer_count or 0)
+            LANE_QUEUE_DEPTH.set(stats[name][0], lane=name)
+        return stats
+
+    async def get_queue_stats(self) -> Tuple[int, int]:
+        """Return (ready messages over all lanes, consumers)."""
+        stats = (await self.get_lane_stats()).values()
+        return sum(ready for ready, _ in stats), max(consumers for _, consumers in stats)
+
     async def consume_messages(self, callback) -> None:
-        if not self.queue:
+        if not self.queues:
             raise RuntimeError("RabbitMQ queue not initialized")
             
         try:
-            await self.queue.consume(callback)
-            logger.info("Started consuming messages from queue")
+            for name, queue in self.queues.items():
+                self.consumer_tags[name] = await queue.consume(callback)
+            logger.info("Started consuming messages from %s queue(s)", len(self.queues))
             
         except Exception as e:
-            logger.error(f"Failed to start consuming messages: {e}")
+            logger.error("Failed to start consuming messages: %s", e)
             raise
 
-    async def ack_message(self, message: AbstractIncomingMessage) -> None:
+    async def stop_consuming(self) -> None:
+        """Cancel the consumers so the broker stops sending new deliveries."""
+        for name, consumer_tag in list(self.consumer_tags.items()):
+            try:
+                await self.queues[name].cancel(consumer_tag)
+            except Exception as e:
+                logger.error("Failed to cancel consumer on %s: %s", name, e)
+        if self.consumer_tags:
+            logger.info("Stopped consuming messages from queue")
+        self.consumer_tags = {}
+
+    async def ack_message(self, message: "AbstractIncomingMessage") -> None:
         try:
             message.ack()
             logger.debug("Message acknowledged")
         except Exception as e:
-            logger.error(f"Failed to acknowledge message: {e}")
+            logger.error("Failed to acknowledge message: %s", e)
 
-    async def nack_message(self, message: AbstractIncomingMessage, requeue: bool = True) -> None:
+    async def nack_message(self, message: "AbstractIncomingMessage", requeue: bool = True) -> None:
         try:
             message.nack(requeue=requeue)
-            logger.debug(f"Message nacked, requeue: {requeue}")
+            logger.debug("Message nacked, requeue: %s", requeue)
         except Exception as e:
-            logger.error(f"Failed to nack message: {e}")
+            logger.error("Failed to nack message: %s", e)
+
+
+def create_broker() -> RabbitMQService:
+    """The broker ``settings.broker`` selects."""
+    if settings.broker == "memory":
+        # Imported here: the in-memory broker subclasses RabbitMQService.
+        from app.services.memory_broker import InMemoryBroker
+
+        return InMemoryBroker()
+    return RabbitMQService()
+
 
+rabbitmq_service = create_broker()
 
-rabbitmq_service = RabbitMQService()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=rabbitmq_service.reset_after_fork)
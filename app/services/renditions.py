@@ -0,0 +1,107 @@
+"""Geometry of a single rendition: resize, crop and pad per ``RenditionSpec``.
+
+Every mode first scales the image to an intermediate size (the fitted image
+for ``fit``/``pad``, the smallest image covering the box for ``fill``) and
+does any cropping or padding on that intermediate, so the extra work is
+proportional to the thumbnail, not to the original.
+"""
+
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from app.config import RenditionSpec
+from app.services.metadata import swaps_axes
+
+Size = Tuple[int, int]
+Box = Tuple[int, int, int, int]
+
+
+def intermediate_size(original: Size, spec: RenditionSpec) -> Size:
+    """Size to scale the original to before cropping or padding.
+
+    ``fit`` and ``pad`` never upscale; ``fill`` scales up if it has to,
+    because its output must be exactly the requested size.
+    """
+    width, height = original
+    if spec.mode == "fill":
+        scale = max(spec.width / width, spec.height / height)
+        return max(spec.width, round(width * scale)), max(
+            spec.height, round(height * scale)
+        )
+    scale = min(spec.width / width, spec.height / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _entropy_offset(
+    gray: Image.Image, start: int, end: int, target: int, axis: int
+) -> int:
+    """Trim the lower-entropy edge of ``gray`` along ``axis`` until ``target`` remains."""
+    other = gray.size[1 - axis]
+    step = max(1, target // 10)
+    while end - start > target:
+        trim = min(step, end - start - target)
+        if axis == 0:
+            head = gray.crop((start, 0, start + trim, other))
+            tail = gray.crop((end - trim, 0, end, other))
+        else:
+            head = gray.crop((0, start, other, start + trim))
+            tail = gray.crop((0, end - trim, other, end))
+        if head.entropy() < tail.entropy():
+            start += trim
+        else:
+            end -= trim
+    return start
+
+
+def crop_box(image: Image.Image, spec: RenditionSpec) -> Box:
+    """Box of ``spec``'s size inside ``image`` (which covers it)."""
+    width, height = image.size
+    if spec.crop == "entropy":
+        # Keeps the busiest region (detail, edges, faces) rather than
+        # whatever happens to be in the middle.
+        gray = image.convert("L")
+        left = _entropy_offset(gray, 0, width, spec.width, axis=0)
+        top = _entropy_offset(gray, 0, height, spec.height, axis=1)
+    else:
+        left = (width - spec.width) // 2
+        top = (height - spec.height) // 2
+    return left, top, left + spec.width, top + spec.height
+
+
+def render(
+    source: Image.Image,
+    original: Size,
+    spec: RenditionSpec,
+    transpose: Optional[Image.Transpose] = None,
+) -> Tuple[Image.Image, Image.Image]:
+    """Return ``(intermediate, rendition)`` for ``spec``.
+
+    ``source`` is either the decoded original or an intermediate of a larger
+    rendition (same aspect ratio); sizes are always computed from
+    ``original`` (the upright size) so the result does not depend on which
+    one was used. ``transpose`` (EXIF orientation of a decoded original) is
+    applied after the resize, on the small image.
+    """
+    size = intermediate_size(original, spec)
+    target = (size[1], size[0]) if swaps_axes(transpose) else size
+    if source.size == target:
+        intermediate = source
+    else:
+        intermediate = source.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if transpose is not None:
+        intermediate = intermediate.transpose(transpose)
+
+    if spec.mode == "fill":
+        return intermediate, intermediate.crop(crop_box(intermediate, spec))
+    if spec.mode == "pad":
+        mode = "RGBA" if intermediate.mode == "RGBA" else "RGB"
+        canvas = Image.new(mode, (spec.width, spec.height), "#" + spec.background)
+        offset = ((spec.width - size[0]) // 2, (spec.height - size[1]) // 2)
+        canvas.paste(intermediate, offset, intermediate if mode == "RGBA" else None)
+        return intermediate, canvas
+    return intermediate, intermediate
+
+
+def covers(image: Image.Image, size: Size) -> bool:
+    return image.width >= size[0] and image.height >= size[1]
@@ -0,0 +1,115 @@
+"""Perceptual hashes and near-duplicate search.
+
+Every processed image gets a 64-bit difference hash (dHash) of its smallest
+intermediate, which survives re-encoding, resizing and mild edits. Near
+duplicates are hashes within a small Hamming distance.
+
+Lookups use multi-index hashing: the hash is split into four 16-bit bands,
+each stored in its own indexed column. Two hashes within distance ``d``
+agree on at least one band to within ``d // 4`` bits (pigeonhole), so the
+candidates are the rows whose band matches one of the few values within
+that radius of ours, found through the band indexes; exact distances are
+then computed for those candidates only.
+"""
+
+from itertools import combinations
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.image import Image, ImageStatus
+
+if TYPE_CHECKING:
+    from PIL import Image as PILImage
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+# Band radius 2 (137 values per band) is where lookups stop being cheap.
+MAX_SEARCH_DISTANCE = BANDS * 3 - 1
+BAND_COLUMNS = tuple(f"phash_band{index}" for index in range(BANDS))
+
+
+def dhash(image: "PILImage.Image") -> int:
+    """Difference hash: whether each pixel of a 9x8 gray version is brighter than its right neighbour."""
+    from PIL import Image
+
+    small = image.convert("L").resize((9, 8), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def bands(value: int) -> Tuple[int, ...]:
+    mask = (1 << BAND_BITS) - 1
+    return tuple((value >> (BAND_BITS * index)) & mask for index in range(BANDS))
+
+
+def to_signed(value: int) -> int:
+    # BIGINT is signed; the hash is stored in two's complement.
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hash_columns(value: Optional[int]) -> Dict[str, Optional[int]]:
+    """Column values for ``Image`` (all None when there is no hash)."""
+    if value is None:
+        return {"phash": None, **{column: None for column in BAND_COLUMNS}}
+    return {"phash": to_signed(value), **dict(zip(BAND_COLUMNS, bands(value)))}
+
+
+def band_neighbours(band: int, radius: int) -> List[int]:
+    """All band values within ``radius`` bits of ``band``, itself included."""
+    values = [band]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), distance):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+async def find_similar(
+    db: AsyncSession,
+    value: int,
+    max_distance: int,
+    limit: int,
+    exclude: Optional[UUID] = None,
+) -> List[Tuple[Any, int]]:
+    """``(row, distance)`` for finished images within ``max_distance``, closest first."""
+    if not 0 <= max_distance <= MAX_SEARCH_DISTANCE:
+        raise ValueError(f"max_distance must be between 0 and {MAX_SEARCH_DISTANCE}")
+    radius = max_distance // BANDS
+    query = select(Image.id, Image.original_url, Image.phash).where(
+        Image.status == ImageStatus.DONE,
+        or_(
+            *(
+                getattr(Image, column).in_(band_neighbours(band, radius))
+                for column, band in zip(BAND_COLUMNS, bands(value))
+            )
+        ),
+    )
+    if exclude is not None:
+        query = query.where(Image.id != exclude)
+
+    matches = []
+    for row in (await db.execute(query)).all():
+        distance = hamming(value, from_signed(row.phash))
+        if distance <= max_distance:
+            matches.append((row, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches[:limit]
@@ -0,0 +1,152 @@
+"""Tenants and the queues their jobs travel in.
+
+Every job belongs to a tenant and is published to that tenant's lane: a
+queue the worker schedules as a unit. Tenants are spread over
+``queue_shards`` shared lanes by a stable hash of their name. Tenants listed
+in ``tenant_weights`` get a dedicated lane with that weight instead. Workers
+take jobs from the lanes in weighted round-robin (see
+``app.worker.scheduling``), so a tenant's bulk import fills only its own
+lane and interactive uploads in other lanes are not queued behind it.
+
+The tenant comes from ``tenant_header``, which clients can set to anything:
+it is only trusted when the request also carries ``tenant_secret``, added
+by the proxy that authenticates clients (and strips both headers from what
+clients send). Otherwise a client could name another tenant's lane, or
+spread its uploads over many names, and escape its fair share.
+
+Shared lane 0 is the original ``images`` queue, so jobs published before
+sharding, and jobs without a tenant, are still processed.
+
+The lane set follows ``queue_shards``, ``tenant_weights`` and
+``large_image_min_bytes``, so it can change between restarts. Every lane a
+process declares is recorded in ``queue_lanes``; on start the worker keeps
+consuming recorded lanes that are no longer in the set until they are
+empty (``retire_lanes``), so jobs queued there are not stranded.
+
+Images that need at least ``large_image_min_bytes`` to decode go to the
+large-image lane whatever their tenant: they are admitted against the
+worker's memory budget (see ``app.services.memory``) and often wait for
+memory to free up, which should not hold up the small jobs of their tenant.
+"""
+
+import hmac
+import logging
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import TENANT_PATTERN, settings
+from app.models.database import AsyncSessionLocal
+from app.models.image import QueueLane
+from app.services.rabbitmq import QUEUE_NAME, RabbitMQService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+LARGE_QUEUE = f"{QUEUE_NAME}.large"
+
+
+@dataclass(frozen=True)
+class Lane:
+    queue: str
+    weight: int = 1
+
+
+def shard_queue(index: int) -> str:
+    return QUEUE_NAME if index == 0 else f"{QUEUE_NAME}.{index}"
+
+
+def tenant_queue(tenant: str) -> str:
+    return f"{QUEUE_NAME}.tenant.{tenant}"
+
+
+def normalise_tenant(value: Optional[str]) -> str:
+    """The tenant for a raw header value; raises ValueError when it is malformed."""
+    if value is None or not value.strip():
+        return DEFAULT_TENANT
+    tenant = value.strip()
+    if not TENANT_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant {tenant!r}")
+    return tenant
+
+
+def request_tenant(headers: Mapping[str, str]) -> str:
+    """The tenant of a request; ``DEFAULT_TENANT`` unless a trusted proxy named it.
+
+    Raises ValueError when a trusted tenant name is malformed.
+    """
+    secret = settings.tenant_secret
+    presented = headers.get(settings.tenant_secret_header, "")
+    if not secret or not hmac.compare_digest(presented.encode(), secret.encode()):
+        return DEFAULT_TENANT
+    return normalise_tenant(headers.get(settings.tenant_header))
+
+
+def lanes() -> Tuple[Lane, ...]:
+    shared = tuple(Lane(shard_queue(index)) for index in range(settings.queue_shards))
+    dedicated = tuple(
+        Lane(tenant_queue(tenant), weight)
+        for tenant, weight in settings.tenant_weight_map.items()
+    )
+    large = (Lane(LARGE_QUEUE),) if settings.large_image_min_bytes else ()
+    return shared + dedicated + large
+
+
+def lane_for(tenant: Optional[str], decode_bytes: Optional[int] = None) -> Lane:
+    if (
+        settings.large_image_min_bytes
+        and decode_bytes
+        and decode_bytes >= settings.large_image_min_bytes
+    ):
+        return Lane(LARGE_QUEUE)
+    tenant = tenant or DEFAULT_TENANT
+    weight = settings.tenant_weight_map.get(tenant)
+    if weight is not None:
+        return Lane(tenant_queue(tenant), weight)
+    # crc32 rather than hash(): the same tenant must map to the same lane
+    # in every process.
+    return Lane(shard_queue(zlib.crc32(tenant.encode()) % settings.queue_shards))
+
+
+def lane_weights() -> Dict[str, int]:
+    return {lane.queue: lane.weight for lane in lanes()}
+
+
+async def record_lanes(
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+) -> List[str]:
+    """Record the current lanes; returns the recorded ones no longer among them."""
+    current = {lane.queue for lane in lanes()}
+    async with session_factory() as db:
+        recorded = set((await db.execute(select(QueueLane.queue))).scalars())
+        db.add_all(QueueLane(queue=name) for name in sorted(current - recorded))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another process recorded them first.
+            await db.rollback()
+    return sorted(recorded - current)
+
+
+async def retire_lanes(
+    broker: RabbitMQService,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+) -> None:
+    """Have ``broker`` consume lanes of an earlier layout until they are empty.
+
+    Call after connecting and before consuming. Lanes found empty are
+    deleted and forgotten.
+    """
+    retired = await record_lanes(session_factory)
+    if not retired:
+        return
+    gone = await broker.adopt_queues(retired)
+    if gone:
+        async with session_factory() as db:
+            await db.execute(delete(QueueLane).where(QueueLane.queue.in_(gone)))
+            await db.commit()
+        logger.info("Removed %s empty lane(s) of an earlier layout", len(gone))
@@ -1,10 +1,26 @@
+import atexit
+import copy
 import json
 import logging
+import queue
 import sys
-from typing import Any, Dict
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from app.config import settings
 
+try:  # the optional "fast-json" extra
+    import orjson
+
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return orjson.dumps(obj, default=str).decode()
+
+except ImportError:  # pragma: no cover - depends on the environment
+
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=str)
+
 
 class JSONFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
@@ -20,36 +36,176 @@ class JSONFormatter(logging.Formatter):
 
         if record.exc_info:
             log_entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_entry["exception"] = record.exc_text
 
         if hasattr(record, "extra_fields"):
             log_entry.update(record.extra_fields)
 
-        return json.dumps(log_entry, ensure_ascii=False)
+        return _dumps(log_entry)
+
+
+class RateLimitFilter(logging.Filter):
+    """Sample and rate-limit high-frequency records per logger.
+
+    ``rate_limits`` maps a logger name prefix to the maximum number of records
+    per second (token bucket, burst of one second). ``sample_rates`` maps a
+    prefix to the fraction of records kept. Warnings and errors always pass.
+    """
+
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, float]] = None,
+        sample_rates: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__()
+        self.rate_limits = rate_limits or {}
+        self.sample_rates = sample_rates or {}
+        self.clock = clock
+        self.dropped = 0
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._sample_counters: Dict[str, float] = {}
+
+    @staticmethod
+    def _match(rules: Dict[str, float], name: str) -> Optional[Tuple[str, float]]:
+        best: Optional[Tuple[str, float]] = None
+        for prefix, value in rules.items():
+            if name == prefix or name.startswith(prefix + "."):
+                if best is None or len(prefix) > len(best[0]):
+                    best = (prefix, value)
+        return best
+
+    def _sampled(self, name: str) -> bool:
+        rule = self._match(self.sample_rates, name)
+        if rule is None:
+            return True
+        # Deterministic sampling: keep every 1/rate-th record.
+        counter = self._sample_counters.get(rule[0], 0.0) + rule[1]
+        keep = counter >= 1.0
+        self._sample_counters[rule[0]] = counter - 1.0 if keep else counter
+        return keep
+
+    def _within_rate(self, name: str) -> bool:
+        rule = self._match(self.rate_limits, name)
+        if rule is None:
+            return True
+        prefix, rate = rule
+        now = self.clock()
+        tokens, updated = self._buckets.get(prefix, (rate, now))
+        tokens = min(rate, tokens + (now - updated) * rate)
+        if tokens < 1.0:
+            self._buckets[prefix] = (tokens, now)
+            return False
+        self._buckets[prefix] = (tokens - 1.0, now)
+        return True
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self._sampled(record.name) and self._within_rate(record.name):
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to a background listener without ever blocking the caller.
+
+    The message is rendered here (arguments may be mutated later), while the
+    JSON serialisation and the write to stdout happen on the listener thread.
+    Records are dropped, not waited for, when the queue is full.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _parse_rules(value: str) -> Dict[str, float]:
+    rules = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, number = item.partition("=")
+            rules[name.strip()] = float(number)
+    return rules
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
 
 
 def setup_logging() -> None:
+    global _listener
     log_level = getattr(logging, settings.log_level.upper(), logging.INFO)
-    
+
     formatter = JSONFormatter()
-    
+
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    
+
+    rate_filter = RateLimitFilter(
+        _parse_rules(settings.log_rate_limits),
+        _parse_rules(settings.log_sample_rates),
+    )
+
+    shutdown_logging()
     root_logger = logging.getLogger()
+    for existing in list(root_logger.handlers):
+        if getattr(existing, "_app_handler", False):
+            root_logger.removeHandler(existing)
+
+    handler: logging.Handler
+    if settings.log_async:
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(settings.log_queue_size)
+        handler = NonBlockingQueueHandler(log_queue)
+        _listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = console_handler
+    handler.addFilter(rate_filter)
+    setattr(handler, "_app_handler", True)
+
     root_logger.setLevel(log_level)
-    root_logger.addHandler(console_handler)
-    
+    root_logger.addHandler(handler)
+
     logging.getLogger("uvicorn").setLevel(logging.INFO)
     logging.getLogger("uvicorn.access").setLevel(logging.INFO)
     logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
     logging.getLogger("aio_pika").setLevel(logging.INFO)
-    
+
     logger = logging.getLogger(__name__)
     logger.info(
         "Logging configured",
         extra={
             "extra_fields": {
                 "log_level": settings.log_level,
+                "async": settings.log_async,
                 "service": "image-processing"
             }
         }
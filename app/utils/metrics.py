@@ -0,0 +1,408 @@
+"""Minimal Prometheus-compatible metrics.
+
+Implements counters, gauges and histograms rendered in the Prometheus text
+exposition format (version 0.0.4), without pulling in an extra dependency.
+
+Metrics live in the process that records them. When several processes
+serve one endpoint (API workers), each writes a snapshot of its samples to
+a shared directory (``write_snapshot``) and the scraped process merges the
+fresh ones (``render_merged``): counters and histograms are summed, gauges
+summed or maxed per their ``aggregate``.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+QUEUE_WAIT_BUCKETS: Tuple[float, ...] = (
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    900.0,
+    3600.0,
+)
+SIZE_BUCKETS: Tuple[float, ...] = tuple(
+    float(1024 * 4**i) for i in range(9)
+)  # 1KB..64MB
+QUALITY_BUCKETS: Tuple[float, ...] = tuple(float(q) for q in range(10, 101, 10))
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric(ABC):
+    type_name = ""
+    # How samples of several processes combine: "sum" or "max".
+    aggregate = "sum"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional["MetricsRegistry"] = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """The metric's lines in the exposition format, without HELP and TYPE."""
+
+    def render(self, samples: Optional[List[str]] = None) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self.samples() if samples is None else samples)
+        return "\n".join(lines)
+
+    def merge(self, snapshots: Sequence[List[str]]) -> List[str]:
+        """Combine the samples of several processes, keeping first-seen order."""
+        merged: Dict[str, float] = {}
+        for samples in snapshots:
+            for line in samples:
+                key, _, raw = line.rpartition(" ")
+                value = float(raw)
+                if key not in merged:
+                    merged[key] = value
+                elif self.aggregate == "max":
+                    merged[key] = max(merged[key], value)
+                else:
+                    merged[key] += value
+        return [f"{key} {_format_value(value)}" for key, value in merged.items()]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional["MetricsRegistry"] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional["MetricsRegistry"] = None,
+        aggregate: str = "sum",
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        if aggregate not in ("sum", "max"):
+            raise ValueError(f"Unknown aggregate {aggregate!r}")
+        self.aggregate = aggregate
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: object) -> None:
+        """Compute the value lazily at scrape time."""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def value(self, **labels: object) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return float(self._functions[key]())
+        return self._values.get(key, 0.0)
+
+    @contextmanager
+    def track_in_progress(self, **labels: object) -> Iterator[None]:
+        self.inc(1.0, **labels)
+        try:
+            yield
+        finally:
+            self.dec(1.0, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                values.pop(key, None)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        registry: Optional["MetricsRegistry"] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: object) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._counts.items())
+            sums = dict(self._sums)
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+    def snapshot(self) -> Dict[str, List[str]]:
+        return {name: metric.samples() for name, metric in self._metrics.items()}
+
+    def write_snapshot(self, directory: Path) -> None:
+        """Write this process's samples to ``directory`` for ``render_merged``."""
+        path = directory / f"{os.getpid()}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def remove_snapshot(self, directory: Path) -> None:
+        (directory / f"{os.getpid()}.json").unlink(missing_ok=True)
+
+    def render_merged(self, directory: Path, max_age: float) -> str:
+        """Render the samples of every process with a snapshot in ``directory``.
+
+        Snapshots older than ``max_age`` seconds belong to processes that
+        stopped without removing theirs and are skipped.
+        """
+        self.write_snapshot(directory)
+        cutoff = time.time() - max_age
+        snapshots = []
+        for path in sorted(directory.glob("*.json")):
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # removed or replaced meanwhile
+        return (
+            "\n".join(
+                metric.render(
+                    metric.merge([snapshot.get(name, []) for snapshot in snapshots])
+                )
+                for name, metric in self._metrics.items()
+            )
+            + "\n"
+        )
+
+
+REGISTRY = MetricsRegistry()
+
+
+UPLOAD_SIZE_BYTES = Histogram(
+    "image_upload_size_bytes", "Size of uploaded original images", buckets=SIZE_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Database statement latency", ["operation"]
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Database connection pool state", ["state"]
+)
+PUBLISH_SECONDS = Histogram(
+    "rabbitmq_publish_duration_seconds",
+    "Latency of publishing a message",
+    ["routing_key"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds",
+    "Time from enqueue to the start of processing",
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+PROCESSING_STAGE_SECONDS = Histogram(
+    "image_processing_stage_seconds",
+    "Time spent per processing stage",
+    ["stage", "size"],
+)
+JOBS_TOTAL = Counter("image_jobs", "Processed image jobs by outcome", ["status"])
+IN_FLIGHT = Gauge(
+    "in_flight", "Requests or jobs currently being handled", ["component"]
+)
+UPLOAD_REJECTIONS = Counter(
+    "image_upload_rejections", "Uploads turned away by admission control", ["reason"]
+)
+# Read from the broker, so every process reports the same queue.
+QUEUE_DEPTH = Gauge(
+    "queue_depth", "Messages ready in the processing queue", aggregate="max"
+)
+# Per scheduling lane (one queue), not per tenant: shared lanes carry many
+# tenants, which keeps the label set bounded.
+LANE_QUEUE_DEPTH = Gauge(
+    "lane_queue_depth",
+    "Messages ready per scheduling lane",
+    ["lane"],
+    aggregate="max",
+)
+LANE_BUFFERED = Gauge(
+    "lane_buffered",
+    "Messages a worker holds for a lane but has not started yet",
+    ["lane"],
+)
+LANE_JOBS = Counter("lane_jobs", "Jobs started per scheduling lane", ["lane"])
+WORKER_CONCURRENCY = Gauge(
+    "worker_concurrency", "Current in-flight job limit of the worker"
+)
+WORKER_MEMORY_RESERVED = Gauge(
+    "worker_memory_reserved_bytes",
+    "Estimated decode memory of the jobs the worker is running",
+)
+MEMORY_WAITS = Counter(
+    "worker_memory_waits", "Times a job waited for memory budget to start", ["lane"]
+)
+QUALITY_CHOSEN = Histogram(
+    "encode_quality_chosen",
+    "Encoder quality picked by the adaptive search",
+    ["metric"],
+    buckets=QUALITY_BUCKETS,
+)
+QUALITY_PROBES = Counter(
+    "encode_quality_probes",
+    "Trial encodes made by the adaptive quality search",
+    ["metric"],
+)
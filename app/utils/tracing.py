@@ -0,0 +1,286 @@
+"""Lightweight OpenTelemetry-style tracing.
+
+Spans carry W3C ``traceparent`` compatible identifiers so a request can be
+followed from the API, through the RabbitMQ message headers, into the worker.
+Finished spans are handed to an exporter; the file exporter writes one JSON
+object per line, which any OTLP collector stand-in can tail.
+"""
+
+import contextvars
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, MutableMapping, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    def to_traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def from_traceparent(cls, value: str) -> Optional["SpanContext"]:
+        parts = value.strip().split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            flags = int(parts[3], 16)
+            int(parts[1], 16), int(parts[2], 16)
+        except ValueError:
+            return None
+        return cls(trace_id=parts[1], span_id=parts[2], sampled=bool(flags & 1))
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: Optional[str]
+    service: str
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start_time_ns: int = field(default_factory=time.time_ns)
+    end_time_ns: Optional[int] = None
+    status: str = "OK"
+    tracer: Optional["Tracer"] = field(default=None, repr=False)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "ERROR"
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = str(exc)
+
+    def end(self) -> None:
+        if self.end_time_ns is not None:
+            return
+        self.end_time_ns = time.time_ns()
+        if self.tracer is not None and self.context.sampled:
+            self.tracer.exporter.export(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_time_ns if self.end_time_ns is not None else time.time_ns()
+        return (end - self.start_time_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start_time_ns": self.start_time_ns,
+            "end_time_ns": self.end_time_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    def export(self, span: Span) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+
+class FileSpanExporter(SpanExporter):
+    """Append finished spans as JSON lines from a background thread.
+
+    Like log records (see ``app.utils.logging``), spans are only queued on the
+    caller's thread; serialisation and the batched file writes happen on a
+    writer thread. Spans are dropped, not waited for, when the queue is full.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_batch: int = 64,
+        max_delay: float = 2.0,
+        queue_size: int = 10000,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        batch: List[str] = []
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.max_delay)
+            except queue.Empty:
+                item = {}
+            if item is None:
+                break
+            if item:
+                batch.append(json.dumps(item, default=str))
+            if (
+                len(batch) >= self.max_batch
+                or time.monotonic() - last_flush >= self.max_delay
+            ):
+                self._write(batch)
+                batch = []
+                last_flush = time.monotonic()
+        self._write(batch)
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        try:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logger.warning("Failed to export spans to %s: %s", self.path, e)
+
+    def shutdown(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _random_hex(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+class Tracer:
+    def __init__(
+        self,
+        service: str = "image-processing",
+        exporter: Optional[SpanExporter] = None,
+        sample_ratio: float = 1.0,
+    ) -> None:
+        self.service = service
+        self.exporter = exporter or SpanExporter()
+        self.sample_ratio = sample_ratio
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[SpanContext] = None,
+    ) -> Span:
+        """Start a span without making it current; the caller must ``end()`` it."""
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current is not None else None
+
+        if parent is None:
+            context = SpanContext(
+                trace_id=_random_hex(128),
+                span_id=_random_hex(64),
+                sampled=random.random() < self.sample_ratio,
+            )
+        else:
+            context = SpanContext(parent.trace_id, _random_hex(64), parent.sampled)
+
+        return Span(
+            name=name,
+            context=context,
+            parent_id=parent.span_id if parent is not None else None,
+            service=self.service,
+            attributes=dict(attributes or {}),
+            tracer=self,
+        )
+
+    @contextmanager
+    def start_as_current_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[SpanContext] = None,
+    ) -> Iterator[Span]:
+        span = self.start_span(name, attributes, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def inject(headers: MutableMapping[str, Any]) -> None:
+    """Write the current span context into outgoing message headers."""
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.context.to_traceparent()
+
+
+def extract(headers: Optional[Mapping[str, Any]]) -> Optional[SpanContext]:
+    value = (headers or {}).get(TRACEPARENT_HEADER)
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    return SpanContext.from_traceparent(value) if isinstance(value, str) else None
+
+
+def _create_exporter() -> SpanExporter:
+    if settings.tracing_exporter == "file":
+        return FileSpanExporter(settings.tracing_file)
+    if settings.tracing_exporter != "none":
+        logger.warning("Unknown tracing exporter: %s", settings.tracing_exporter)
+    return SpanExporter()
+
+
+tracer = Tracer(sample_ratio=settings.tracing_sample_ratio)
+
+
+def configure_tracing(service: str) -> Tracer:
+    tracer.service = service
+    tracer.exporter.shutdown()
+    tracer.exporter = _create_exporter()
+    tracer.sample_ratio = settings.tracing_sample_ratio
+    return tracer
@@ -0,0 +1,255 @@
+"""Re-render existing images after the rendition settings changed.
+
+Usage::
+
+    python -m app.worker.backfill [--rate 50] [--batch-size 500] [--restart]
+
+Finished images are scanned in primary-key order, one keyset page at a time
+(each page is read through a server-side cursor in a short transaction), and
+a job is published for every image whose stored renditions are missing a
+configured size or were built with different settings. The job is the same
+as for an upload: the worker renders the full configured set, and since the
+renditions already on disk are reused, only the stale sizes are generated.
+
+Progress is checkpointed after every page, so an interrupted run resumes
+where it stopped. Publishing is paced to ``--rate`` jobs per second and
+pauses while the queue holds more than ``--max-queue-depth`` messages, so
+live uploads are not stuck behind the backfill.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal, dispose_engine
+from app.models.image import Image, ImageStatus
+from app.services.image_processing import renditions_fingerprint, write_atomic
+from app.services.rabbitmq import rabbitmq_service
+from app.utils.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+Publisher = Callable[[Dict[str, Any]], Awaitable[None]]
+QueueDepth = Callable[[], Awaitable[int]]
+
+
+def stale_sizes(renditions: Optional[Dict[str, Any]]) -> List[str]:
+    """Configured sizes that are missing or were rendered with other settings."""
+    renditions = renditions or {}
+    stale = []
+    for spec in settings.renditions:
+        info = renditions.get(spec.label)
+        if not isinstance(info, dict) or info.get("key") != spec.key:
+            stale.append(spec.label)
+    return stale
+
+
+@dataclass
+class Checkpoint:
+    fingerprint: str
+    last_id: Optional[str] = None
+    scanned: int = 0
+    enqueued: int = 0
+    finished: bool = False
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str) -> "Checkpoint":
+        """Resume from ``path`` unless it belongs to other rendition settings."""
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return cls(fingerprint)
+        if data.get("fingerprint") != fingerprint:
+            logger.info(
+                "Rendition settings changed since the last checkpoint, starting over"
+            )
+            return cls(fingerprint)
+        return cls(**data)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, json.dumps(asdict(self)).encode())
+
+
+class Throttle:
+    """Space out calls so that at most ``rate`` happen per second."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+class Backfill:
+    def __init__(
+        self,
+        publish: Publisher,
+        checkpoint_path: Path,
+        queue_depth: Optional[QueueDepth] = None,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        batch_size: int = 500,
+        rate: float = 50.0,
+        max_queue_depth: int = 1000,
+    ) -> None:
+        self.publish = publish
+        self.checkpoint_path = checkpoint_path
+        self.queue_depth = queue_depth
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.throttle = Throttle(rate)
+        self.max_queue_depth = max_queue_depth
+
+    async def _fetch_page(self, after: Optional[UUID]) -> List[Tuple[Any, ...]]:
+        query = (
+            select(
+                Image.id,
+                Image.original_path,
+                Image.original_filename,
+                Image.renditions,
+                Image.tenant,
+            )
+            .where(Image.status == ImageStatus.DONE)
+            .order_by(Image.id)
+            .limit(self.batch_size)
+            .execution_options(yield_per=self.batch_size)
+        )
+        if after is not None:
+            query = query.where(Image.id > after)
+        async with self.session_factory() as db:
+            result = await db.stream(query)
+            return [tuple(row) async for row in result]
+
+    async def _wait_for_queue(self) -> None:
+        if self.queue_depth is None or self.max_queue_depth <= 0:
+            return
+        while (depth := await self.queue_depth()) > self.max_queue_depth:
+            logger.info("Queue holds %s messages, pausing backfill", depth)
+            await asyncio.sleep(5)
+
+    async def run(self, restart: bool = False) -> Checkpoint:
+        fingerprint = renditions_fingerprint()
+        checkpoint = (
+            Checkpoint(fingerprint)
+            if restart
+            else Checkpoint.load(self.checkpoint_path, fingerprint)
+        )
+        if checkpoint.finished:
+            logger.info("Backfill for settings %s already finished", fingerprint)
+            return checkpoint
+
+        logger.info(
+            "Starting backfill for settings %s after id %s",
+            fingerprint,
+            checkpoint.last_id,
+        )
+        while True:
+            after = UUID(checkpoint.last_id) if checkpoint.last_id else None
+            page = await self._fetch_page(after)
+            if not page:
+                break
+
+            await self._wait_for_queue()
+            for image_id, stored_path, filename, renditions, tenant in page:
+                if stale_sizes(renditions):
+                    await self.throttle.wait()
+                    await self.publish(
+                        {
+                            "image_id": str(image_id),
+                            "original_path": str(
+                                Path(settings.upload_dir) / stored_path
+                            ),
+                            "original_filename": filename,
+                            "tenant": tenant,
+                        }
+                    )
+                    checkpoint.enqueued += 1
+
+            # Saved only after the page is published: a crash re-publishes at
+            # most one page, which the worker handles idempotently.
+            checkpoint.scanned += len(page)
+            checkpoint.last_id = str(page[-1][0])
+            checkpoint.save(self.checkpoint_path)
+            logger.info(
+                "Backfill progress: %s scanned, %s enqueued",
+                checkpoint.scanned,
+                checkpoint.enqueued,
+            )
+
+        checkpoint.finished = True
+        checkpoint.save(self.checkpoint_path)
+        logger.info(
+            "Backfill finished: %s scanned, %s enqueued",
+            checkpoint.scanned,
+            checkpoint.enqueued,
+        )
+        return checkpoint
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Re-render images for the current thumbnail settings"
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.backfill_batch_size)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=settings.backfill_rate,
+        help="jobs per second, 0 = unlimited",
+    )
+    parser.add_argument(
+        "--max-queue-depth", type=int, default=settings.backfill_max_queue_depth
+    )
+    parser.add_argument(
+        "--checkpoint", type=Path, default=Path(settings.backfill_checkpoint_file)
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the saved checkpoint"
+    )
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    async def publish(message: Dict[str, Any]) -> None:
+        await rabbitmq_service.publish_job(message)
+
+    async def queue_depth() -> int:
+        ready, _ = await rabbitmq_service.get_queue_stats()
+        return ready
+
+    await rabbitmq_service.connect()
+    try:
+        await Backfill(
+            publish,
+            args.checkpoint,
+            queue_depth=queue_depth,
+            batch_size=args.batch_size,
+            rate=args.rate,
+            max_queue_depth=args.max_queue_depth,
+        ).run(restart=args.restart)
+    finally:
+        await rabbitmq_service.disconnect()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.services.rabbitmq import RabbitMQService
+from app.utils.metrics import QUEUE_DEPTH, WORKER_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+@dataclass
+class BacklogSnapshot:
+    queue_depth: int
+    consumers: int
+    concurrency: int
+    in_flight: int
+    throughput_per_second: float
+    average_job_seconds: Optional[float]
+    cpu_utilisation: float
+    estimated_drain_seconds: Optional[float]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def next_concurrency(
+    current: int,
+    queue_depth: int,
+    cpu_utilisation: float,
+    job_latency: Optional[float],
+    baseline_latency: Optional[float],
+    minimum: int,
+    maximum: int,
+    target_cpu: float,
+    latency_tolerance: float,
+) -> int:
+    """Additive-increase / multiplicative-decrease step for in-flight jobs.
+
+    Concurrency grows by one while there is a backlog, spare CPU and job
+    latency stays close to the best latency seen so far; it is cut back when
+    the CPU saturates or jobs slow down (contention), and drifts back to the
+    minimum once the queue is empty.
+    """
+    degraded = (
+        job_latency is not None
+        and baseline_latency is not None
+        and job_latency > baseline_latency * latency_tolerance
+    )
+    if cpu_utilisation > target_cpu or degraded:
+        proposed = int(current * 0.75)
+    elif queue_depth > current:
+        proposed = current + 1
+    elif queue_depth == 0:
+        proposed = current - 1
+    else:
+        proposed = current
+    return max(minimum, min(maximum, proposed))
+
+
+class ConcurrencyController:
+    """Adjusts the worker's prefetch (in-flight job limit) from live signals."""
+
+    def __init__(self, rabbitmq: RabbitMQService) -> None:
+        self.rabbitmq = rabbitmq
+        self.minimum = max(1, settings.worker_min_concurrency)
+        self.maximum = max(self.minimum, settings.worker_max_concurrency)
+        self.concurrency = self.minimum
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.consumers = 0
+        self.cpu_utilisation = 0.0
+        self._latency_ewma: Optional[float] = None
+        self._baseline_latency: Optional[float] = None
+        self._completed = 0
+        self._throughput = 0.0
+        self._cpu_sample = (time.monotonic(), time.process_time())
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def job_started(self) -> None:
+        self.in_flight += 1
+
+    def job_finished(self, seconds: float) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+        self._completed += 1
+        alpha = 0.2
+        if self._latency_ewma is None:
+            self._latency_ewma = seconds
+        else:
+            self._latency_ewma = alpha * seconds + (1 - alpha) * self._latency_ewma
+
+    def _sample_cpu(self) -> float:
+        wall, cpu = time.monotonic(), time.process_time()
+        previous_wall, previous_cpu = self._cpu_sample
+        self._cpu_sample = (wall, cpu)
+        elapsed = wall - previous_wall
+        if elapsed <= 0:
+            return self.cpu_utilisation
+        return min(1.0, (cpu - previous_cpu) / (elapsed * available_cpus()))
+
+    def _sample_throughput(self, elapsed: float) -> None:
+        if elapsed > 0:
+            rate = self._completed / elapsed
+            self._throughput = (
+                rate if not self._throughput else 0.5 * rate + 0.5 * self._throughput
+            )
+        self._completed = 0
+
+    async def adjust(self, elapsed: float) -> None:
+        self.queue_depth, self.consumers = await self.rabbitmq.get_queue_stats()
+        self.cpu_utilisation = self._sample_cpu()
+        self._sample_throughput(elapsed)
+
+        # Latency at low concurrency is the reference for "uncontended".
+        if self._latency_ewma is not None and (
+            self._baseline_latency is None
+            or self._latency_ewma < self._baseline_latency
+        ):
+            self._baseline_latency = self._latency_ewma
+
+        proposed = next_concurrency(
+            current=self.concurrency,
+            queue_depth=self.queue_depth,
+            cpu_utilisation=self.cpu_utilisation,
+            job_latency=self._latency_ewma,
+            baseline_latency=self._baseline_latency,
+            minimum=self.minimum,
+            maximum=self.maximum,
+            target_cpu=settings.worker_target_cpu,
+            latency_tolerance=settings.worker_latency_tolerance,
+        )
+        if proposed != self.concurrency:
+            logger.info(
+                "Adjusting worker concurrency from %s to %s", self.concurrency, proposed
+            )
+            await self.rabbitmq.set_prefetch(proposed)
+            self.concurrency = proposed
+
+        QUEUE_DEPTH.set(self.queue_depth)
+        WORKER_CONCURRENCY.set(self.concurrency)
+
+    def snapshot(self) -> BacklogSnapshot:
+        average = self._latency_ewma
+        if self._throughput > 0:
+            drain: Optional[float] = self.queue_depth / (
+                self._throughput * max(1, self.consumers)
+            )
+        elif average is not None:
+            drain = (
+                self.queue_depth * average / (self.concurrency * max(1, self.consumers))
+            )
+        else:
+            drain = None if self.queue_depth else 0.0
+        return BacklogSnapshot(
+            queue_depth=self.queue_depth,
+            consumers=self.consumers,
+            concurrency=self.concurrency,
+            in_flight=self.in_flight,
+            throughput_per_second=round(self._throughput, 3),
+            average_job_seconds=round(average, 3) if average is not None else None,
+            cpu_utilisation=round(self.cpu_utilisation, 3),
+            estimated_drain_seconds=round(drain, 1) if drain is not None else None,
+        )
+
+    async def start(self) -> None:
+        await self.rabbitmq.set_prefetch(self.concurrency)
+        WORKER_CONCURRENCY.set(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        interval = settings.worker_concurrency_interval
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            try:
+                await self.adjust(now - last)
+            except Exception as e:
+                logger.warning("Concurrency adjustment failed: %s", e)
+            last = now
@@ -0,0 +1,74 @@
+"""Image processing inside the API process (``EMBEDDED_WORKER``).
+
+Runs the same consumer as ``app.worker.main`` (concurrency controller,
+fair scheduler, processor) on the API's event loop; decoding and resizing
+already run in threads, so requests keep being served meanwhile. Works with
+either broker; with ``BROKER=memory`` a job goes from upload to processing
+without leaving the process. Its queues die with the process, so on start
+the images a previous run left in flight are queued again.
+"""
+
+import logging
+from typing import Any
+
+from app.config import settings
+from app.services.memory_broker import InMemoryBroker
+from app.services.rabbitmq import RabbitMQService
+from app.services.tenancy import lane_weights, retire_lanes
+from app.worker.concurrency import ConcurrencyController
+from app.worker.processor import ImageProcessor
+from app.worker.scheduling import FairScheduler
+from app.worker.sweeper import Sweeper, SweepReport
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddedWorker:
+    def __init__(self, broker: RabbitMQService) -> None:
+        self.broker = broker
+        self.concurrency = ConcurrencyController(broker)
+        self.processor = ImageProcessor(self.concurrency)
+        self.scheduler = FairScheduler(
+            self._handle,
+            lane_weights,
+            lambda: self.concurrency.concurrency,
+            budget=lambda: settings.worker_memory_budget,
+            cost=self.processor.memory_estimate,
+        )
+
+    async def _handle(self, message: Any) -> None:
+        try:
+            await self.processor.process_message(message)
+        except Exception as e:
+            logger.error("Error in message handler: %s", e)
+
+    async def start(self) -> None:
+        """Start consuming; the broker must be connected."""
+        if isinstance(self.broker, InMemoryBroker):
+            await self.recover()
+        else:
+            await retire_lanes(self.broker)
+        await self.concurrency.start()
+        self.scheduler.start()
+        await self.broker.consume_messages(self.scheduler.submit)
+        logger.info("Embedded worker started")
+
+    async def recover(self) -> int:
+        """Queue every image still in NEW or PROCESSING; returns how many."""
+        report = SweepReport()
+        await Sweeper(self.broker.publish_job, rate=0, stuck_after=0).sweep_rows(report)
+        if report.requeued or report.failed_rows:
+            logger.info(
+                "Requeued %s unfinished image(s), %s failed",
+                report.requeued,
+                report.failed_rows,
+            )
+        return report.requeued
+
+    async def stop(self, timeout: float) -> None:
+        """Stop taking deliveries and let in-flight jobs finish up to ``timeout``."""
+        await self.broker.stop_consuming()
+        buffered = await self.scheduler.stop()
+        cancelled = await self.processor.drain(timeout)
+        await self.concurrency.stop()
+        logger.info("Embedded worker stopped, %s job(s) requeued", buffered + cancelled)
@@ -1,66 +1,158 @@
 import asyncio
+import json
 import logging
 import signal
 import sys
-from typing import Any
+from typing import Any, Optional, Tuple
 
+from app.config import reload_settings, settings
+from app.models.database import dispose_engine
+from app.services.health import health_monitor
 from app.services.rabbitmq import rabbitmq_service
+from app.services.tenancy import lane_weights, retire_lanes
 from app.utils.logging import setup_logging
+from app.utils.metrics import CONTENT_TYPE, REGISTRY
+from app.utils.tracing import configure_tracing, tracer
+from app.worker.concurrency import ConcurrencyController
 from app.worker.processor import ImageProcessor
+from app.worker.scheduling import FairScheduler
+from app.worker.status_server import StatusServer
 
 
-setup_logging()
 logger = logging.getLogger(__name__)
 
 
-worker_running = True
-processor = ImageProcessor()
+shutdown_event = asyncio.Event()
+concurrency = ConcurrencyController(rabbitmq_service)
+processor = ImageProcessor(concurrency)
 
 
 async def message_handler(message: Any) -> None:
     try:
         await processor.process_message(message)
     except Exception as e:
-        logger.error(f"Error in message handler: {e}")
+        logger.error("Error in message handler: %s", e)
+
+
+# Prefetch applies per lane consumer; the scheduler keeps the jobs actually
+# running within the controller's limit and the memory budget.
+scheduler = FairScheduler(
+    message_handler,
+    lane_weights,
+    lambda: concurrency.concurrency,
+    budget=lambda: settings.worker_memory_budget,
+    cost=processor.memory_estimate,
+)
+
+
+async def metrics_handler() -> Tuple[int, str, str]:
+    return 200, CONTENT_TYPE, REGISTRY.render()
+
+
+async def backlog_handler() -> Tuple[int, str, str]:
+    backlog = concurrency.snapshot().to_dict()
+    backlog["buffered"] = scheduler.buffered
+    backlog["memory_reserved"] = scheduler.reserved
+    return 200, "application/json", json.dumps(backlog)
+
+
+async def livez_handler() -> Tuple[int, str, str]:
+    live = health_monitor.live()
+    return 200 if live else 503, "application/json", json.dumps({"status": "ok" if live else "stalled"})
+
+
+async def readyz_handler() -> Tuple[int, str, str]:
+    return 200 if health_monitor.ready() else 503, "application/json", json.dumps(health_monitor.report())
+
+
+def create_status_server() -> Optional[StatusServer]:
+    if not settings.worker_status_port:
+        return None
+    server = StatusServer(settings.worker_status_host, settings.worker_status_port)
+    server.add_route("/metrics", metrics_handler)
+    server.add_route("/backlog", backlog_handler)
+    server.add_route("/livez", livez_handler)
+    server.add_route("/readyz", readyz_handler)
+    return server
 
 
 async def start_worker() -> None:
     logger.info("Starting image processing worker")
+    configure_tracing("worker")
+    status_server = create_status_server()
     
     try:
+        if status_server is not None:
+            await status_server.start()
+
         await rabbitmq_service.connect()
         logger.info("Connected to RabbitMQ")
+        await retire_lanes(rabbitmq_service)
         
-        await rabbitmq_service.consume_messages(message_handler)
+        await health_monitor.start()
+        await concurrency.start()
+        scheduler.start()
+        await rabbitmq_service.consume_messages(scheduler.submit)
         logger.info("Started consuming messages")
         
-        while worker_running:
-            await asyncio.sleep(1)
+        await shutdown_event.wait()
+        await drain()
             
     except Exception as e:
-        logger.error(f"Worker error: {e}")
+        logger.error("Worker error: %s", e)
         raise
     finally:
+        await health_monitor.stop()
+        await concurrency.stop()
         await rabbitmq_service.disconnect()
+        # Returns pooled connections only after every job has committed.
+        await dispose_engine()
+        if status_server is not None:
+            await status_server.stop()
+        tracer.shutdown()
         logger.info("Worker stopped")
 
 
-def signal_handler(signum: int, frame: Any) -> None:
-    global worker_running
-    logger.info(f"Received signal {signum}, shutting down gracefully...")
-    worker_running = False
+async def drain() -> None:
+    """Stop taking deliveries, then let in-flight jobs finish up to a deadline."""
+    logger.info("Draining worker")
+    await rabbitmq_service.stop_consuming()
+    buffered = await scheduler.stop()
+    if buffered:
+        logger.info("Requeued %s buffered message(s)", buffered)
+    cancelled = await processor.drain(settings.worker_shutdown_timeout)
+    logger.info("Worker drained, %s job(s) requeued", cancelled)
+
+
+def signal_handler(signum: int) -> None:
+    logger.info("Received signal %s, shutting down gracefully...", signum)
+    shutdown_event.set()
+
+
+def reload_handler() -> None:
+    # New jobs pick up the reloaded renditions; running jobs finish with
+    # the snapshot they started with.
+    if reload_settings():
+        setup_logging()
 
 
 async def main() -> None:
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    setup_logging()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, signal_handler, signum)
+        except NotImplementedError:  # pragma: no cover - Windows
+            signal.signal(signum, lambda s, _: loop.call_soon_threadsafe(signal_handler, s))
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(signal.SIGHUP, reload_handler)
     
     try:
         await start_worker()
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt")
     except Exception as e:
-        logger.error(f"Worker failed: {e}")
+        logger.error("Worker failed: %s", e)
         sys.exit(1)
 
 
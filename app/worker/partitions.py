@@ -0,0 +1,361 @@
+"""Maintain the monthly partitions of ``images`` (PostgreSQL only).
+
+Usage::
+
+    python -m app.worker.partitions [--months-ahead 3] [--retention-months 24] [--dry-run]
+
+Creates the partitions for the current and the next ``--months-ahead``
+months, so inserts never land in the default partition. Rows that did land
+there (the job fell behind) are moved into the new month's partition: the
+default partition is detached, the partition created, the rows moved and
+the default attached again, in one transaction.
+
+With a retention set, partitions that ended more than ``--retention-months``
+ago are archived: the partition is detached first, so nothing writes to it
+any more, then its rows are written to ``ARCHIVE_DIR/<partition>.jsonl.gz``
+and the table is dropped. The detach is ``CONCURRENTLY`` where PostgreSQL
+allows it, which is not while a default partition exists; then it is a
+plain detach that gives up after ``LOCK_TIMEOUT`` rather than queueing
+writers behind it. A partition left detached (or detach-pending) by an
+interrupted run is finished by the next one. Files of archived images are
+left to the sweeper, which removes them as orphans.
+
+Run it daily (e.g. from cron); every step is idempotent.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    cast,
+)
+
+from sqlalchemy import CursorResult, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal, dispose_engine
+from app.utils.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^images_p(\d{4})(\d{2})$")
+DEFAULT_PARTITION = "images_default"
+LOCK_TIMEOUT = "5s"
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"images_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def months_to_create(today: date, months_ahead: int) -> List[date]:
+    current = today.replace(day=1)
+    return [add_months(current, offset) for offset in range(months_ahead + 1)]
+
+
+def expired_partitions(
+    names: List[str], today: date, retention_months: int
+) -> List[str]:
+    """Monthly partitions that ended more than ``retention_months`` ago, oldest first."""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(today.replace(day=1), -retention_months)
+    expired: List[Tuple[date, str]] = []
+    for name in names:
+        month = partition_month(name)
+        if month is not None and add_months(month, 1) <= cutoff:
+            expired.append((month, name))
+    return [name for _, name in sorted(expired)]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+async def write_archive(path: Path, rows: AsyncIterator[Dict[str, Any]]) -> int:
+    """Write ``rows`` as gzipped JSON lines; the file appears only when complete."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    count = 0
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as archive:
+            async for row in rows:
+                archive.write(json.dumps(row, default=_encode) + "\n")
+                count += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return count
+
+
+class Partitions(NamedTuple):
+    attached: List[str]
+    # Detached by an interrupted archive run, or still detach-pending.
+    detached: List[str]
+    detach_pending: List[str]
+
+
+@dataclass
+class MaintenanceReport:
+    created: List[str] = field(default_factory=list)
+    archived: Dict[str, int] = field(default_factory=dict)
+
+
+class PartitionMaintainer:
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        archive_dir: Optional[Path] = None,
+        months_ahead: int = 3,
+        retention_months: int = 0,
+        dry_run: bool = False,
+    ) -> None:
+        self.session_factory = session_factory
+        self.archive_dir = Path(archive_dir or settings.archive_dir)
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.dry_run = dry_run
+
+    async def partitions(self) -> Partitions:
+        async with self.session_factory() as db:
+            attached = (await db.execute(text("""
+                SELECT child.relname, pg_inherits.inhdetachpending
+                FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = 'images'::regclass
+            """))).all()
+            detached = (await db.execute(text("""
+                SELECT relname FROM pg_class
+                WHERE relkind = 'r' AND relname ~ '^images_p[0-9]{6}$'
+                  AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = pg_class.oid)
+            """))).scalars().all()
+        return Partitions(
+            attached=[name for name, pending in attached if not pending],
+            detached=list(detached),
+            detach_pending=[name for name, pending in attached if pending],
+        )
+
+    async def ensure(self, today: date, report: MaintenanceReport) -> None:
+        partitions = await self.partitions()
+        existing = set(partitions.attached)
+        missing = [
+            month
+            for month in months_to_create(today, self.months_ahead)
+            if partition_name(month) not in existing
+        ]
+        if not missing or self.dry_run:
+            report.created += [partition_name(month) for month in missing]
+            return
+        has_default = DEFAULT_PARTITION in existing
+        async with self.session_factory() as db:
+            for month in missing:
+                if has_default and await self._in_default(db, month):
+                    report.created.append(await self._create_from_default(db, month))
+                else:
+                    result = await db.execute(
+                        text("SELECT create_images_partition(:month)"), {"month": month}
+                    )
+                    report.created.append(result.scalar_one())
+            await db.commit()
+        logger.info("Created partitions: %s", ", ".join(report.created))
+
+    @staticmethod
+    async def _in_default(db: AsyncSession, month: date) -> bool:
+        result = await db.execute(
+            text(
+                f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" '
+                "WHERE created_at >= :start AND created_at < :end)"
+            ),
+            {"start": month, "end": add_months(month, 1)},
+        )
+        return bool(result.scalar_one())
+
+    @staticmethod
+    async def _create_from_default(db: AsyncSession, month: date) -> str:
+        """Create ``month``'s partition and move its rows out of the default one.
+
+        PostgreSQL refuses to create a partition while the default holds
+        rows that belong to it. Runs in the caller's transaction; ``images``
+        is locked until it commits.
+        """
+        bounds = {"start": month, "end": add_months(month, 1)}
+        in_month = "created_at >= :start AND created_at < :end"
+        await db.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        await db.execute(
+            text(f'ALTER TABLE images DETACH PARTITION "{DEFAULT_PARTITION}"')
+        )
+        name = (
+            await db.execute(
+                text("SELECT create_images_partition(:month)"), {"month": month}
+            )
+        ).scalar_one()
+        moved = cast(
+            "CursorResult[Any]",
+            await db.execute(
+                text(
+                    f'INSERT INTO images SELECT * FROM "{DEFAULT_PARTITION}" WHERE {in_month}'
+                ),
+                bounds,
+            ),
+        )
+        await db.execute(
+            text(f'DELETE FROM "{DEFAULT_PARTITION}" WHERE {in_month}'), bounds
+        )
+        await db.execute(
+            text(f'ALTER TABLE images ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT')
+        )
+        logger.warning(
+            "Moved %s row(s) from %s into %s", moved.rowcount, DEFAULT_PARTITION, name
+        )
+        return str(name)
+
+    async def _rows(self, name: str) -> AsyncIterator[Dict[str, Any]]:
+        async with self.session_factory() as db:
+            result = await db.stream(
+                text(f'SELECT * FROM "{name}" ORDER BY id').execution_options(
+                    yield_per=1000
+                )
+            )
+            async for row in result:
+                yield dict(row._mapping)
+
+    async def detach(
+        self, name: str, concurrently: bool, pending: bool = False
+    ) -> None:
+        """Detach ``name`` from ``images``; nothing can write to it afterwards.
+
+        ``pending`` finishes a concurrent detach that was interrupted.
+        """
+        async with self.session_factory() as db:
+            if pending:
+                statement = f'ALTER TABLE images DETACH PARTITION "{name}" FINALIZE'
+            elif concurrently:
+                statement = f'ALTER TABLE images DETACH PARTITION "{name}" CONCURRENTLY'
+            else:
+                await db.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                statement = f'ALTER TABLE images DETACH PARTITION "{name}"'
+            # CONCURRENTLY and FINALIZE cannot run inside a transaction block.
+            options = (
+                {"isolation_level": "AUTOCOMMIT"} if concurrently or pending else {}
+            )
+            connection = await db.connection(execution_options=options)
+            await connection.execute(text(statement))
+            await db.commit()
+
+    async def archive(
+        self,
+        name: str,
+        report: MaintenanceReport,
+        state: str = "attached",
+        concurrently: bool = True,
+    ) -> None:
+        """Archive and drop partition ``name``; ``state`` is "attached", "pending" or "detached"."""
+        month = partition_month(name)
+        if month is None:
+            raise ValueError(f"Not a monthly partition: {name}")
+        path = self.archive_dir / f"{name}.jsonl.gz"
+        if self.dry_run:
+            report.archived[name] = 0
+            return
+        # Detached before the export, so the archive holds the rows' final
+        # state; a failed export leaves the detached table for the next run.
+        if state != "detached":
+            await self.detach(name, concurrently, pending=state == "pending")
+        count = await write_archive(path, self._rows(name))
+        async with self.session_factory() as db:
+            await db.execute(text(f'DROP TABLE "{name}"'))
+            await db.execute(
+                text(
+                    "DELETE FROM image_partition_hints WHERE created_at >= :start AND created_at < :end"
+                ),
+                {"start": month, "end": add_months(month, 1)},
+            )
+            await db.commit()
+        report.archived[name] = count
+        logger.info("Archived partition %s (%s rows) to %s", name, count, path)
+
+    async def run(self, today: Optional[date] = None) -> MaintenanceReport:
+        today = today or datetime.utcnow().date()
+        report = MaintenanceReport()
+        await self.ensure(today, report)
+        partitions = await self.partitions()
+        # DETACH ... CONCURRENTLY is not allowed while a default partition exists.
+        concurrently = DEFAULT_PARTITION not in partitions.attached
+        states = {name: "attached" for name in partitions.attached}
+        states.update({name: "detached" for name in partitions.detached})
+        states.update({name: "pending" for name in partitions.detach_pending})
+        for name in expired_partitions(list(states), today, self.retention_months):
+            await self.archive(name, report, states[name], concurrently)
+        logger.info(
+            "Partition maintenance %sfinished: %s created, %s archived",
+            "(dry run) " if self.dry_run else "",
+            report.created,
+            report.archived,
+        )
+        return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Create upcoming and archive expired images partitions"
+    )
+    parser.add_argument(
+        "--months-ahead", type=int, default=settings.partition_months_ahead
+    )
+    parser.add_argument(
+        "--retention-months",
+        type=int,
+        default=settings.partition_retention_months,
+        help="archive partitions older than this, 0 = keep everything",
+    )
+    parser.add_argument("--archive-dir", type=Path, default=Path(settings.archive_dir))
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report what would be done"
+    )
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    try:
+        await PartitionMaintainer(
+            archive_dir=args.archive_dir,
+            months_ahead=args.months_ahead,
+            retention_months=args.retention_months,
+            dry_run=args.dry_run,
+        ).run()
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
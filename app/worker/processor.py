@@ -1,117 +1,327 @@
+import asyncio
 import json
 import logging
-from typing import Any, Dict
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set
 from uuid import UUID
 
-import aio_pika
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.database import AsyncSessionLocal
-from app.models.image import Image, ImageStatus
-from app.services.image_processing import image_processing_service
 from app.config import settings
-from pathlib import Path
+from app.models.database import AsyncSessionLocal
+from app.models.image import ImageStatus
+from app.models.partitioning import image_lookup, image_sql
+from app.services.image_processing import (
+    COMPRESSED_SUFFIX,
+    ImageAnalysis,
+    image_processing_service,
+    renditions_fingerprint,
+)
+from app.services.memory import estimate_decode_bytes
+from app.services.quality import search_session
+from app.services.rabbitmq import ENQUEUED_AT_HEADER
+from app.services.similarity import hash_columns
+from app.utils.metrics import IN_FLIGHT, JOBS_TOTAL, QUEUE_WAIT_SECONDS
+from app.utils.tracing import extract, tracer
+
+if TYPE_CHECKING:
+    import aio_pika
+
+    from app.worker.concurrency import ConcurrencyController
 
 logger = logging.getLogger(__name__)
 
 
+def _load_json(value: Any) -> Any:
+    # Raw SQL returns JSON columns as text on some drivers.
+    return json.loads(value) if isinstance(value, str) else value
+
+
 class ImageProcessor:
-    async def process_message(self, message: aio_pika.IncomingMessage) -> None:
-        async with message.process():
-            try:
-                message_data = json.loads(message.body.decode())
-                logger.info(f"Processing message: {message_data}")
-                
-                image_id = UUID(message_data["image_id"])
-                original_path = message_data["original_path"]
-                original_filename = message_data["original_filename"]
-                
-                await self._process_image(image_id, original_path, original_filename)
-                
-                logger.info(f"Successfully processed image: {image_id}")
-                
-            except Exception as e:
-                logger.error(f"Failed to process message: {e}")
+    def __init__(self, concurrency: Optional["ConcurrencyController"] = None) -> None:
+        self.concurrency = concurrency
+        self._active: Set["asyncio.Task[Any]"] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._active)
+
+    async def drain(self, timeout: float) -> int:
+        """Wait for in-flight jobs; cancel the ones still running at the deadline.
+
+        Cancelled jobs are requeued by ``message.process(requeue=True)`` and
+        return the number of jobs that had to be cancelled.
+        """
+        if not self._active:
+            return 0
+        logger.info("Waiting up to %ss for %s in-flight job(s)", timeout, len(self._active))
+        _, pending = await asyncio.wait(set(self._active), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning("Cancelled %s job(s) still running at the shutdown deadline", len(pending))
+        return len(pending)
+
+    @staticmethod
+    async def memory_estimate(message: "aio_pika.IncomingMessage") -> int:
+        """Decode memory the job needs: the publisher's estimate, else the header's.
+
+        0 when unknown (a malformed message or an unreadable file), so the
+        job is not held back and fails as usual.
+        """
+        try:
+            data = json.loads(message.body.decode())
+            estimate = data.get("decode_bytes")
+            if estimate is None:
+                estimate = await estimate_decode_bytes(data.get("original_path"))
+            return max(0, int(estimate or 0))
+        except Exception:
+            return 0
+
+    async def process_message(self, message: "aio_pika.IncomingMessage") -> None:
+        enqueued_at = (message.headers or {}).get(ENQUEUED_AT_HEADER)
+        attributes = {}
+        if isinstance(enqueued_at, (int, float)):
+            queue_wait = max(0.0, time.time() - enqueued_at)
+            QUEUE_WAIT_SECONDS.observe(queue_wait)
+            attributes["messaging.queue_wait_ms"] = round(queue_wait * 1000, 3)
+
+        task = asyncio.current_task()
+        if task is not None:
+            self._active.add(task)
+        if self.concurrency is not None:
+            self.concurrency.job_started()
+        started = time.perf_counter()
+        try:
+            # requeue=True: a job cancelled during shutdown goes back to the
+            # queue instead of being dropped.
+            async with message.process(requeue=True):
+                with IN_FLIGHT.track_in_progress(component="worker_jobs"), tracer.start_as_current_span(
+                    "image.process", attributes, parent=extract(message.headers)
+                ):
+                    await self._handle_message(message)
+        finally:
+            if task is not None:
+                self._active.discard(task)
+            if self.concurrency is not None:
+                self.concurrency.job_finished(time.perf_counter() - started)
+
+    async def _handle_message(self, message: "aio_pika.IncomingMessage") -> None:
+        try:
+            message_data = json.loads(message.body.decode())
+            logger.debug("Processing message: %s", message_data)
+            
+            image_id = UUID(message_data["image_id"])
+            original_path = message_data["original_path"]
+            original_filename = message_data["original_filename"]
+            
+            processed = await self._process_image(image_id, original_path, original_filename)
+            
+            JOBS_TOTAL.inc(status="done" if processed else "skipped")
+            logger.info("Successfully processed image: %s", image_id)
+            
+        except Exception as e:
+            JOBS_TOTAL.inc(status="error")
+            logger.error("Failed to process message: %s", e)
 
     async def _process_image(
         self, 
         image_id: UUID, 
         original_path: str, 
         original_filename: str
-    ) -> None:
+    ) -> bool:
+        """Process one image; returns False when the job was already done.
+
+        Safe to run again for the same message: finished renditions are
+        reused, and the original is deleted only once the final UPDATE has
+        been committed, so a retry always has a source to work from.
+        """
+        # One snapshot for the key and the render, so a settings reload in
+        # between cannot record renditions under the wrong key.
+        specs = settings.renditions
+        idempotency_key = f"{image_id}:{renditions_fingerprint(specs)}"
+        reprocessing = False
+        heartbeat: "Optional[asyncio.Task[None]]" = None
+        
         async with AsyncSessionLocal() as db:
+            where, lookup = await image_lookup(db, image_id)
             try:
-                from sqlalchemy import text
-                result = await db.execute(
-                    text("SELECT * FROM images WHERE id = :image_id"),
-                    {"image_id": image_id}
-                )
+                result = await db.execute(image_sql(f"SELECT * FROM images WHERE {where}"), lookup)
                 image_data = result.fetchone()
                 
                 if not image_data:
                     raise ValueError(f"Image not found: {image_id}")
                 
-                await db.execute(
-                    text("UPDATE images SET status = :status WHERE id = :image_id"),
-                    {"status": ImageStatus.PROCESSING.value, "image_id": image_id}
-                )
-                await db.commit()
+                row = image_data._mapping
+                if row["status"] == ImageStatus.DONE.value and row.get("idempotency_key") == idempotency_key:
+                    logger.info("Image already processed, skipping: %s", image_id)
+                    return False
+                
+                # A finished image being re-rendered for new settings (backfill)
+                # keeps serving its current thumbnails until the new ones land.
+                reprocessing = row["status"] == ImageStatus.DONE.value
+                previous_thumbnails = _load_json(row["thumbnails"]) or {}
                 
-                logger.info(f"Started processing image: {image_id}")
+                if not reprocessing:
+                    await db.execute(
+                        image_sql(f"UPDATE images SET status = :status, updated_at = :now WHERE {where}"),
+                        {"status": ImageStatus.PROCESSING.value, "now": datetime.utcnow(), **lookup}
+                    )
+                    await db.commit()
+                    heartbeat = asyncio.create_task(self._heartbeat(where, lookup))
                 
-                thumbnails = await image_processing_service.create_thumbnails(original_path)
-
-                compressed_abs_path = await image_processing_service.compress_image(original_path)
-
-                try:
-                    compressed_rel_path = str(Path(compressed_abs_path).relative_to(Path(settings.upload_dir)))
-                except Exception:
-                    compressed_rel_path = compressed_abs_path
-
-                try:
-                    await image_processing_service.cleanup_file(original_path)
-                except Exception as cleanup_err:
-                    logger.warning(f"Failed to cleanup original file {original_path}: {cleanup_err}")
-
-                await db.execute(
-                    text("""
-                    UPDATE images 
-                    SET 
-                        status = :status,
-                        thumbnails = :thumbnails,
-                        original_path = :compressed_path,
-                        original_url = :original_url
-                    WHERE id = :image_id
-                    """),
-                    {
-                        "status": ImageStatus.DONE.value,
-                        "thumbnails": json.dumps(thumbnails),
-                        "compressed_path": compressed_rel_path,
-                        "original_url": f"/uploads/{compressed_rel_path}",
-                        "image_id": image_id
-                    }
-                )
-                await db.commit()
+                logger.info("Started processing image: %s", image_id)
                 
-                logger.info(f"Completed processing image: {image_id}")
+                source_path = self._resolve_source(original_path, row["original_path"])
+                # The renditions and the compressed original share one
+                # quality search budget (QUALITY_MODE).
+                with search_session():
+                    renditions, analysis = await image_processing_service.create_renditions_with_analysis(
+                        source_path, specs
+                    )
+                    if not Path(source_path).stem.endswith(COMPRESSED_SUFFIX):
+                        compressed_abs_path = await image_processing_service.compress_image(original_path)
+                    else:
+                        compressed_abs_path = source_path
+                thumbnails = {size: info["path"] for size, info in renditions.items()}
+
+                await self._mark_done(db, where, lookup, renditions, analysis, compressed_abs_path, idempotency_key)
+                
+                logger.info("Completed processing image: %s", image_id)
                 
             except Exception as e:
-                logger.error(f"Error processing image {image_id}: {e}")
+                logger.error("Error processing image %s: %s", image_id, e)
                 
-                await db.execute(
-                    text("""
-                    UPDATE images 
-                    SET 
-                        status = :status,
-                        error_message = :error_message
-                    WHERE id = :image_id
-                    """),
-                    {
-                        "status": ImageStatus.ERROR.value,
-                        "error_message": str(e),
-                        "image_id": image_id
-                    }
-                )
-                await db.commit()
+                if reprocessing:
+                    await db.rollback()
+                    raise
                 
+                await self._mark_error(db, where, lookup, e)
                 raise
+            finally:
+                if heartbeat is not None:
+                    heartbeat.cancel()
+
+        stale_thumbnails = set(previous_thumbnails.values()) - set(thumbnails.values())
+        await self._cleanup(source_path, compressed_abs_path, stale_thumbnails)
+        return True
+
+    @staticmethod
+    async def _cleanup(source_path: str, compressed_abs_path: str, stale_thumbnails: Set[str]) -> None:
+        """Remove what the committed row no longer references."""
+        # Only now is the compressed copy referenced by a committed row.
+        if compressed_abs_path != source_path:
+            try:
+                await image_processing_service.cleanup_file(source_path)
+            except Exception as cleanup_err:
+                logger.warning("Failed to cleanup original file %s: %s", source_path, cleanup_err)
+        
+        for stale_path in stale_thumbnails:
+            await image_processing_service.cleanup_file(str(Path(settings.upload_dir) / stale_path))
+
+    @staticmethod
+    async def _mark_done(
+        db: AsyncSession,
+        where: str,
+        lookup: Dict[str, Any],
+        renditions: Dict[str, Dict[str, Any]],
+        analysis: ImageAnalysis,
+        compressed_abs_path: str,
+        idempotency_key: str,
+    ) -> None:
+        try:
+            compressed_rel_path = str(Path(compressed_abs_path).relative_to(Path(settings.upload_dir)))
+        except Exception:
+            compressed_rel_path = compressed_abs_path
+
+        await db.execute(
+            image_sql(f"""
+            UPDATE images 
+            SET 
+                status = :status,
+                thumbnails = :thumbnails,
+                renditions = :renditions,
+                original_path = :compressed_path,
+                original_url = :original_url,
+                idempotency_key = :idempotency_key,
+                phash = :phash,
+                phash_band0 = :phash_band0,
+                phash_band1 = :phash_band1,
+                phash_band2 = :phash_band2,
+                phash_band3 = :phash_band3,
+                placeholder = :placeholder,
+                error_message = NULL,
+                updated_at = :now
+            WHERE {where}
+            """),
+            {
+                "status": ImageStatus.DONE.value,
+                "thumbnails": json.dumps({size: info["path"] for size, info in renditions.items()}),
+                "renditions": json.dumps(renditions),
+                "compressed_path": compressed_rel_path,
+                "original_url": f"/uploads/{compressed_rel_path}",
+                "idempotency_key": idempotency_key,
+                "now": datetime.utcnow(),
+                **lookup,
+                "placeholder": analysis.placeholder,
+                **hash_columns(analysis.phash),
+            }
+        )
+        await db.commit()
+
+    @staticmethod
+    async def _mark_error(db: AsyncSession, where: str, lookup: Dict[str, Any], error: Exception) -> None:
+        await db.execute(
+            image_sql(f"""
+            UPDATE images 
+            SET 
+                status = :status,
+                error_message = :error_message,
+                updated_at = :now
+            WHERE {where}
+            """),
+            {
+                "status": ImageStatus.ERROR.value,
+                "error_message": str(error),
+                "now": datetime.utcnow(),
+                **lookup,
+            }
+        )
+        await db.commit()
+
+    @staticmethod
+    async def _heartbeat(where: str, lookup: Dict[str, Any]) -> None:
+        """Keep ``updated_at`` fresh while the job runs, so the sweeper
+        does not take a long render for a stuck one."""
+        while True:
+            await asyncio.sleep(settings.worker_heartbeat_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        image_sql(f"UPDATE images SET updated_at = :now WHERE {where}"),
+                        {"now": datetime.utcnow(), **lookup},
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning("Failed to record job heartbeat: %s", e)
+
+    @staticmethod
+    def _resolve_source(original_path: str, stored_path: Optional[str]) -> str:
+        """Pick the image to render from.
+
+        Normally the uploaded original; if it is already gone (a previous
+        attempt committed and cleaned up), the compressed copy recorded in
+        the row is used instead.
+        """
+        if Path(original_path).exists():
+            return original_path
+        if stored_path:
+            stored = Path(stored_path)
+            if not stored.is_absolute() and not stored.exists():
+                stored = Path(settings.upload_dir) / stored
+            if stored.exists():
+                return str(stored)
+        raise FileNotFoundError(f"Original image not found: {original_path}")
@@ -0,0 +1,200 @@
+"""Weighted round-robin over the tenant lanes.
+
+The worker consumes every lane queue (see ``app.services.tenancy``). The
+broker delivers up to the prefetch count per lane; deliveries are buffered
+per lane and started from here, at most ``slots()`` at a time, picking the
+next lane by smooth weighted round-robin. A lane with a deep backlog
+therefore gets its weight's share of the worker while other lanes have
+work, and all of it when they do not.
+
+Jobs are also admitted against a memory budget: each delivery's decode
+memory estimate (``cost``) is reserved while it runs, and a job that does
+not fit keeps its turn and waits for running jobs to free memory, while
+nothing else is started ahead of it. A job bigger than the whole budget
+runs alone.
+
+The weights are read at dispatch time, so a settings reload (SIGHUP)
+changes the share of the lanes without restarting the worker.
+
+Buffered messages are unacknowledged: if the worker dies they go back to
+their queue, and on shutdown they are rejected with requeue.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from app.services.rabbitmq import QUEUE_NAME
+from app.utils.metrics import (
+    LANE_BUFFERED,
+    LANE_JOBS,
+    MEMORY_WAITS,
+    WORKER_MEMORY_RESERVED,
+)
+
+if TYPE_CHECKING:
+    import aio_pika
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[["aio_pika.IncomingMessage"], Awaitable[None]]
+Cost = Callable[["aio_pika.IncomingMessage"], Awaitable[int]]
+
+
+class SmoothWeightedRoundRobin:
+    """Interleaves picks in proportion to the weights (a=3, b=1: a a b a ...).
+
+    Each pick credits every ready lane with its weight and takes the lane
+    with the most credit, which then pays the total back. Lanes without
+    work are skipped and earn nothing meanwhile, so they cannot save up a
+    burst for later.
+    """
+
+    def __init__(self, weights: Dict[str, int]) -> None:
+        self.weights = weights
+        self._credit: Dict[str, int] = {lane: 0 for lane in weights}
+
+    def pick(self, ready: Iterable[str]) -> str:
+        ready = [lane for lane in ready if lane in self.weights]
+        if not ready:
+            raise ValueError("No lane is ready")
+        total = 0
+        for lane in ready:
+            self._credit[lane] = self._credit.get(lane, 0) + self.weights[lane]
+            total += self.weights[lane]
+        chosen = max(ready, key=lambda lane: self._credit[lane])
+        self._credit[chosen] -= total
+        return chosen
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        handler: Handler,
+        weights: Callable[[], Dict[str, int]],
+        slots: Callable[[], int],
+        budget: Callable[[], int] = lambda: 0,
+        cost: Optional[Cost] = None,
+    ) -> None:
+        self.handler = handler
+        self.weights = weights
+        self.slots = slots
+        self.budget = budget
+        self.cost = cost
+        # The set of lanes is fixed for the process (queues are declared on
+        # connect); only their weights follow the settings.
+        self._policy = SmoothWeightedRoundRobin(weights())
+        self._buffers: Dict[str, Deque[Tuple["aio_pika.IncomingMessage", int]]] = {
+            lane: deque() for lane in self._policy.weights
+        }
+        self._running = 0
+        self.reserved = 0
+        # The lane whose turn it is but whose next job does not fit yet.
+        self._waiting: Optional[str] = None
+        self._wakeup = asyncio.Event()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+
+    def lane_of(self, message: "aio_pika.IncomingMessage") -> str:
+        # Lanes are bound with their queue name as the routing key; anything
+        # else (the legacy key) was routed to lane 0.
+        key = message.routing_key
+        return key if key in self._buffers else QUEUE_NAME
+
+    @property
+    def buffered(self) -> Dict[str, int]:
+        return {lane: len(buffer) for lane, buffer in self._buffers.items()}
+
+    async def submit(self, message: "aio_pika.IncomingMessage") -> None:
+        """Consumer callback: buffer the delivery until its lane's turn."""
+        lane = self.lane_of(message)
+        cost = await self.cost(message) if self.cost is not None else 0
+        self._buffers[lane].append((message, cost))
+        LANE_BUFFERED.set(len(self._buffers[lane]), lane=lane)
+        self._wakeup.set()
+
+    def _fits(self, cost: int) -> bool:
+        budget = self.budget()
+        return budget <= 0 or self._running == 0 or self.reserved + cost <= budget
+
+    def _dispatch(self) -> None:
+        self._policy.weights = self.weights()
+        while self._running < max(1, self.slots()):
+            lane = self._waiting
+            if lane is None:
+                ready = [lane for lane, buffer in self._buffers.items() if buffer]
+                if not ready:
+                    return
+                lane = self._policy.pick(ready)
+            message, cost = self._buffers[lane][0]
+            if not self._fits(cost):
+                if self._waiting is None:
+                    MEMORY_WAITS.inc(lane=lane)
+                self._waiting = lane
+                return
+            self._waiting = None
+            self._buffers[lane].popleft()
+            LANE_BUFFERED.set(len(self._buffers[lane]), lane=lane)
+            LANE_JOBS.inc(lane=lane)
+            self._running += 1
+            self.reserved += cost
+            WORKER_MEMORY_RESERVED.set(self.reserved)
+            task = asyncio.create_task(self._process(message, cost))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, message: "aio_pika.IncomingMessage", cost: int) -> None:
+        try:
+            await self.handler(message)
+        finally:
+            self._running -= 1
+            self.reserved -= cost
+            WORKER_MEMORY_RESERVED.set(self.reserved)
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            self._dispatch()
+
+    def start(self) -> None:
+        self._dispatcher = asyncio.create_task(self._run())
+
+    async def stop(self) -> int:
+        """Stop starting jobs and requeue the buffered ones; returns how many.
+
+        Jobs already started are left to finish (see ``ImageProcessor.drain``).
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        self._waiting = None
+        requeued = 0
+        for lane, buffer in self._buffers.items():
+            while buffer:
+                message, _ = buffer.popleft()
+                try:
+                    await message.reject(requeue=True)
+                    requeued += 1
+                except Exception as e:
+                    logger.warning(
+                        "Failed to requeue buffered message from %s: %s", lane, e
+                    )
+            LANE_BUFFERED.set(0, lane=lane)
+        return requeued
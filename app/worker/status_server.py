@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A handler returns (status code, content type, body).
+RouteHandler = Callable[[], Awaitable[Tuple[int, str, str]]]
+
+_REASONS = {
+    200: "OK",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    503: "Service Unavailable",
+}
+
+
+class StatusServer:
+    """Tiny HTTP server exposing worker status endpoints such as ``/metrics``.
+
+    The worker has no web framework, so this serves a handful of GET routes
+    directly on top of ``asyncio.start_server``.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._routes: Dict[str, RouteHandler] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    def add_route(self, path: str, handler: RouteHandler) -> None:
+        self._routes[path] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Worker status server listening on %s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            method, path = (
+                (parts[0], parts[1].split("?", 1)[0]) if len(parts) >= 2 else ("", "")
+            )
+            handler = self._routes.get(path)
+
+            if handler is None:
+                status, content_type, body = 404, "text/plain", "Not Found\n"
+            elif method != "GET":
+                status, content_type, body = 405, "text/plain", "Method Not Allowed\n"
+            else:
+                status, content_type, body = await handler()
+
+            payload = body.encode()
+            head = (
+                f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode() + payload)
+            await writer.drain()
+        except Exception as e:
+            logger.warning("Status server request failed: %s", e)
+        finally:
+            writer.close()
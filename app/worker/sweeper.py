@@ -0,0 +1,463 @@
+"""Remove files and rows left behind by failed or interrupted work.
+
+Usage::
+
+    python -m app.worker.sweeper [--dry-run] [--interval 3600]
+
+Two passes:
+
+- files: ``original/`` and ``thumbnails/`` are scanned one batch of
+  directory entries at a time; each batch is matched against the rows of
+  the images it belongs to (file names start with the image id, so this is
+  a primary-key lookup) and the difference is deleted: files of images that
+  no longer exist, thumbnails a finished image no longer references,
+  partial thumbnails of failed images, originals of images that failed
+  more than ``sweeper_error_retention`` ago and abandoned temporary files.
+- rows: images stuck in NEW or PROCESSING for longer than
+  ``sweeper_stuck_after`` (e.g. after a worker crash) are published again,
+  or marked ERROR if their original is gone. Workers touch ``updated_at``
+  when they start, finish and every ``worker_heartbeat_interval`` while a
+  job runs, so only a job nobody is working on goes stale. One waiting in
+  the queue has not been started either: rows are not published again
+  while their lane still has messages ready, they may be among them.
+
+Files younger than ``sweeper_grace_seconds`` are never touched, so uploads
+and renders in progress are safe. Deletes are paced to ``--rate`` per
+second.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import String, cast, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal, dispose_engine
+from app.models.image import Image, ImageStatus
+from app.models.partitioning import image_filter
+from app.services.image_processing import COMPRESSED_SUFFIX
+from app.services.memory import estimate_decode_bytes
+from app.services.rabbitmq import rabbitmq_service
+from app.services.tenancy import lane_for
+from app.utils.logging import setup_logging
+from app.worker.backfill import Publisher, Throttle
+
+logger = logging.getLogger(__name__)
+
+STEM_LENGTH = 36  # str(uuid)
+IN_FLIGHT_STATUSES = (ImageStatus.NEW, ImageStatus.PROCESSING)
+
+LaneStats = Callable[[], Awaitable[Dict[str, Tuple[int, int]]]]
+
+
+@dataclass
+class ScannedFile:
+    path: Path
+    stem: Optional[str]
+    size: int
+    mtime: float
+
+
+@dataclass
+class SweepReport:
+    scanned_files: int = 0
+    deleted_files: int = 0
+    reclaimed_bytes: int = 0
+    deleted_by_reason: Dict[str, int] = field(default_factory=dict)
+    requeued: int = 0
+    deferred: int = 0  # stuck, but their lane still has messages waiting
+    failed_rows: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def file_stem(name: str) -> Optional[str]:
+    """The image id a stored file belongs to, if its name starts with one."""
+    try:
+        return str(UUID(name[:STEM_LENGTH]))
+    except ValueError:
+        return None
+
+
+def _path_stem(path: str) -> Optional[str]:
+    return file_stem(Path(path).stem.removesuffix(COMPRESSED_SUFFIX)) if path else None
+
+
+def _row_paths(upload_dir: Path, row: Any) -> Set[Path]:
+    """Absolute paths the row references.
+
+    ``original_path`` is relative to the upload dir once processed, and the
+    path as saved on upload before that.
+    """
+    paths = set()
+    stored = [row.original_path]
+    stored += list((row.thumbnails or {}).values())
+    stored += [
+        info.get("path")
+        for info in (row.renditions or {}).values()
+        if isinstance(info, dict)
+    ]
+    for value in stored:
+        if not value:
+            continue
+        path = Path(value)
+        paths.add(path.resolve())
+        if not path.is_absolute():
+            paths.add((upload_dir / path).resolve())
+    return paths
+
+
+def iter_batches(
+    directories: List[Path], batch_size: int
+) -> Iterator[List[ScannedFile]]:
+    """Directory entries in batches, without listing whole directories up front."""
+    batch: List[ScannedFile] = []
+    for directory in directories:
+        if not directory.is_dir():
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                batch.append(
+                    ScannedFile(
+                        Path(entry.path),
+                        file_stem(entry.name),
+                        stat.st_size,
+                        stat.st_mtime,
+                    )
+                )
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+class Sweeper:
+    def __init__(
+        self,
+        publish: Optional[Publisher] = None,
+        lane_stats: Optional[LaneStats] = None,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        upload_dir: Optional[Path] = None,
+        batch_size: int = 1000,
+        rate: float = 200.0,
+        grace_seconds: float = 3600.0,
+        stuck_after: float = 1800.0,
+        error_retention: float = 7 * 86400.0,
+        dry_run: bool = False,
+    ) -> None:
+        self.publish = publish
+        self.lane_stats = lane_stats
+        self.session_factory = session_factory
+        self.upload_dir = Path(upload_dir or settings.upload_dir)
+        self.batch_size = batch_size
+        self.throttle = Throttle(rate)
+        self.grace_seconds = grace_seconds
+        self.stuck_after = stuck_after
+        self.error_retention = error_retention
+        self.dry_run = dry_run
+        self._legacy: Optional[Dict[str, UUID]] = None
+
+    async def _legacy_stems(self) -> Dict[str, UUID]:
+        """Stems of files that are not named after their image's id.
+
+        Uploads are named after their id now, so no legacy rows are added:
+        the scan runs on the first sweep only and its result is kept. A
+        stem whose row is deleted later maps to no row, as it should.
+        """
+        if self._legacy is None:
+            self._legacy = await self._scan_legacy_stems()
+        return self._legacy
+
+    async def _scan_legacy_stems(self) -> Dict[str, UUID]:
+        """Uploads used to get a random file name; those rows are found by a
+        keyset scan over the rows whose path does not contain their id.
+        (Where the id does not cast to its canonical text, SQLite, that is
+        every row; the check below is exact either way.)
+        """
+        legacy: Dict[str, UUID] = {}
+        after: Optional[UUID] = None
+        while True:
+            query = (
+                select(Image.id, Image.original_path)
+                .where(~Image.original_path.contains(cast(Image.id, String)))
+                .order_by(Image.id)
+                .limit(self.batch_size)
+            )
+            if after is not None:
+                query = query.where(Image.id > after)
+            async with self.session_factory() as db:
+                page = (await db.execute(query)).all()
+            if not page:
+                return legacy
+            for image_id, original_path in page:
+                stem = _path_stem(original_path)
+                if stem is not None and stem != str(image_id):
+                    legacy[stem] = image_id
+            after = page[-1][0]
+
+    async def _rows_for(
+        self, stems: Set[str], legacy: Dict[str, UUID]
+    ) -> Dict[str, Any]:
+        ids = {legacy.get(stem) or UUID(stem): stem for stem in stems}
+        query = select(
+            Image.id,
+            Image.status,
+            Image.original_path,
+            Image.thumbnails,
+            Image.renditions,
+            Image.updated_at,
+        ).where(Image.id.in_(list(ids)))
+        async with self.session_factory() as db:
+            rows = (await db.execute(query)).all()
+        return {ids[row.id]: row for row in rows}
+
+    def _reason(self, scanned: ScannedFile, row: Any, now: datetime) -> Optional[str]:
+        """Why ``scanned`` should be deleted, or None to keep it."""
+        if scanned.stem is None:
+            return "temporary" if scanned.path.name.endswith(".tmp") else None
+        if row is None:
+            return "orphaned"
+        if row.status in IN_FLIGHT_STATUSES:
+            return None
+        if scanned.path.resolve() in _row_paths(self.upload_dir, row):
+            if row.status == ImageStatus.ERROR and now - row.updated_at > timedelta(
+                seconds=self.error_retention
+            ):
+                return "failed"
+            return None
+        return "failed" if row.status == ImageStatus.ERROR else "unreferenced"
+
+    async def sweep_files(self, report: SweepReport) -> None:
+        legacy = await self._legacy_stems()
+        cutoff = time.time() - self.grace_seconds
+        directories = [self.upload_dir / "original", self.upload_dir / "thumbnails"]
+        for batch in iter_batches(directories, self.batch_size):
+            report.scanned_files += len(batch)
+            candidates = [scanned for scanned in batch if scanned.mtime < cutoff]
+            stems = {scanned.stem for scanned in candidates if scanned.stem is not None}
+            rows = await self._rows_for(stems, legacy) if stems else {}
+            now = datetime.utcnow()
+            for scanned in candidates:
+                reason = self._reason(scanned, rows.get(scanned.stem or ""), now)
+                if reason is not None:
+                    await self._delete(scanned, reason, report)
+
+    async def _delete(
+        self, scanned: ScannedFile, reason: str, report: SweepReport
+    ) -> None:
+        await self.throttle.wait()
+        if not self.dry_run:
+            try:
+                scanned.path.unlink()
+            except FileNotFoundError:
+                return
+            except OSError as e:
+                logger.warning("Failed to delete %s: %s", scanned.path, e)
+                return
+        logger.debug(
+            "Deleted %s file %s (%s bytes)", reason, scanned.path, scanned.size
+        )
+        report.deleted_files += 1
+        report.reclaimed_bytes += scanned.size
+        report.deleted_by_reason[reason] = report.deleted_by_reason.get(reason, 0) + 1
+
+    def _source(self, original_path: str) -> Optional[Path]:
+        if not original_path:
+            return None
+        path = Path(original_path)
+        for candidate in (path, self.upload_dir / path):
+            if candidate.exists():
+                return candidate
+        return None
+
+    async def sweep_rows(self, report: SweepReport) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stuck_after)
+        busy = await self._busy_lanes()
+        after: Optional[UUID] = None
+        while True:
+            query = (
+                select(
+                    Image.id, Image.original_path, Image.original_filename, Image.tenant
+                )
+                .where(Image.status.in_(IN_FLIGHT_STATUSES), Image.updated_at < cutoff)
+                .order_by(Image.id)
+                .limit(self.batch_size)
+            )
+            if after is not None:
+                query = query.where(Image.id > after)
+            async with self.session_factory() as db:
+                page = (await db.execute(query)).all()
+                for image_id, original_path, filename, tenant in page:
+                    await self._recover(
+                        db, image_id, original_path, filename, tenant, busy, report
+                    )
+                if not self.dry_run:
+                    await db.commit()
+            if not page:
+                return
+            after = page[-1][0]
+
+    async def _busy_lanes(self) -> Set[str]:
+        """Lanes with messages ready; unknown (no broker) counts as none."""
+        if self.lane_stats is None:
+            return set()
+        return {lane for lane, (ready, _) in (await self.lane_stats()).items() if ready}
+
+    async def _recover(
+        self,
+        db: AsyncSession,
+        image_id: UUID,
+        original_path: str,
+        filename: str,
+        tenant: Optional[str],
+        busy: Set[str],
+        report: SweepReport,
+    ) -> None:
+        source = self._source(original_path)
+        if source is None:
+            logger.warning(
+                "Image %s is stuck and its original is gone, marking it failed",
+                image_id,
+            )
+            report.failed_rows += 1
+            values: Dict[str, Any] = {
+                "status": ImageStatus.ERROR,
+                "error_message": "Original file missing",
+            }
+        else:
+            if self.publish is None:
+                return
+            decode_bytes = await estimate_decode_bytes(str(source))
+            if lane_for(tenant, decode_bytes).queue in busy:
+                logger.debug(
+                    "Image %s looks stuck, but its lane still has jobs waiting",
+                    image_id,
+                )
+                report.deferred += 1
+                return
+            logger.info("Image %s is stuck, enqueueing it again", image_id)
+            await self.throttle.wait()
+            if not self.dry_run:
+                await self.publish(
+                    {
+                        "image_id": str(image_id),
+                        "original_path": str(source),
+                        "original_filename": filename,
+                        "tenant": tenant,
+                        "decode_bytes": decode_bytes,
+                    }
+                )
+            report.requeued += 1
+            # Restarts the timeout, so the job is not published on every run.
+            values = {"status": ImageStatus.PROCESSING}
+        if not self.dry_run:
+            await db.execute(
+                update(Image)
+                .where(await image_filter(db, image_id))
+                .values(updated_at=datetime.utcnow(), **values)
+            )
+
+    async def run(self) -> SweepReport:
+        report = SweepReport()
+        started = time.monotonic()
+        await self.sweep_rows(report)
+        await self.sweep_files(report)
+        logger.info(
+            "Sweep %sfinished in %.1fs: %s files scanned, %s deleted (%s bytes reclaimed, %s), "
+            "%s jobs re-enqueued, %s left to their queue, %s rows marked failed",
+            "(dry run) " if self.dry_run else "",
+            time.monotonic() - started,
+            report.scanned_files,
+            report.deleted_files,
+            report.reclaimed_bytes,
+            report.deleted_by_reason,
+            report.requeued,
+            report.deferred,
+            report.failed_rows,
+        )
+        return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Remove orphaned files and recover stuck images"
+    )
+    parser.add_argument("--batch-size", type=int, default=settings.sweeper_batch_size)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=settings.sweeper_rate,
+        help="operations per second, 0 = unlimited",
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=settings.sweeper_grace_seconds,
+        help="never touch files younger than this (s)",
+    )
+    parser.add_argument(
+        "--stuck-after", type=float, default=settings.sweeper_stuck_after
+    )
+    parser.add_argument(
+        "--error-retention", type=float, default=settings.sweeper_error_retention
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=settings.sweeper_interval,
+        help="repeat every N seconds, 0 = run once",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report what would be done"
+    )
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    async def publish(message: Dict[str, Any]) -> None:
+        await rabbitmq_service.publish_job(message)
+
+    sweeper = Sweeper(
+        publish,
+        rabbitmq_service.get_lane_stats,
+        batch_size=args.batch_size,
+        rate=args.rate,
+        grace_seconds=args.grace,
+        stuck_after=args.stuck_after,
+        error_retention=args.error_retention,
+        dry_run=args.dry_run,
+    )
+    await rabbitmq_service.connect()
+    try:
+        while True:
+            await sweeper.run()
+            if args.interval <= 0:
+                break
+            await asyncio.sleep(args.interval)
+    finally:
+        await rabbitmq_service.disconnect()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,4 @@
+"""Benchmark suite for the image processing service.
+
+Run ``python -m benchmarks --help`` for the available commands.
+"""
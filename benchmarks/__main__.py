@@ -0,0 +1,144 @@
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.results import compare_results, load_results, write_results
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--corpus-dir",
+        type=Path,
+        default=Path(".bench/corpus"),
+        help="Directory holding the generated image corpus",
+    )
+    parser.add_argument("--seed", type=int, default=1234)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("corpus", help="Generate the image corpus")
+
+    micro = commands.add_parser("micro", help="Benchmark create_thumbnails/compress_image")
+    micro.add_argument("--iterations", type=int, default=5)
+    micro.add_argument("--warmup", type=int, default=1)
+    micro.add_argument("--output", type=Path, default=Path(".bench/micro.json"))
+
+    engines = commands.add_parser("engines", help="Compare resize engines: throughput and memory")
+    engines.add_argument("--engines", default="pillow,vips", help="Comma-separated engine names")
+    engines.add_argument("--iterations", type=int, default=3)
+    engines.add_argument("--output", type=Path, default=Path(".bench/engines.json"))
+
+    e2e = commands.add_parser("e2e", help="Benchmark API and workers end to end")
+    e2e.add_argument("--count", type=int, default=200)
+    e2e.add_argument("--concurrency", type=int, default=16)
+    e2e.add_argument(
+        "--services",
+        action="store_true",
+        help="Use the configured database and RabbitMQ with worker processes "
+        "instead of SQLite, the in-memory broker and the embedded worker",
+    )
+    e2e.add_argument("--workers", type=int, default=2, help="Worker processes (with --services)")
+    e2e.add_argument("--timeout", type=float, default=300.0)
+    e2e.add_argument("--output", type=Path, default=Path(".bench/e2e.json"))
+
+    startup = commands.add_parser("startup", help="Measure import time of the entry points")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--output", type=Path, default=Path(".bench/startup.json"))
+
+    compare = commands.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument("candidate", type=Path)
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative change treated as a regression (default: 0.10)",
+    )
+    return parser
+
+
+def _compare(baseline: Path, candidate: Path, threshold: float) -> int:
+    rows = compare_results(load_results(baseline), load_results(candidate), threshold)
+    regressions = 0
+    for row in rows:
+        marker = "REGRESSION" if row["regression"] else "ok"
+        regressions += row["regression"]
+        print(
+            f"{row['name']:<60} {row['baseline']:>12.2f} -> {row['candidate']:>12.2f} "
+            f"{row['unit']:<18} {row['change']:+7.1%}  {marker}"
+        )
+    return 1 if regressions else 0
+
+
+def _configure_environment(args: argparse.Namespace) -> None:
+    # Settings are read at import time, so this must run before anything
+    # from ``app`` is imported.
+    upload_dir = tempfile.mkdtemp(prefix="bench-uploads-")
+    os.environ.setdefault("UPLOAD_DIR", upload_dir)
+    if args.command == "e2e" and not args.services:
+        # In-process stand-ins: nothing to start, jobs never leave the process.
+        os.environ.update(
+            BROKER="memory",
+            EMBEDDED_WORKER="true",
+            API_WORKERS="1",
+            DATABASE_URL=f"sqlite+aiosqlite:///{Path(upload_dir) / 'e2e.db'}",
+        )
+        args.workers = 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+
+    if args.command == "compare":
+        return _compare(args.baseline, args.candidate, args.threshold)
+
+    if args.command == "startup":
+        from benchmarks.startup import run_startup_benchmarks
+
+        results = run_startup_benchmarks(repeat=args.repeat)
+        write_results(args.output, args.command, results)
+        for result in results:
+            print(f"{result.name:<60} {result.value:>12.2f} {result.unit}  "
+                  f"(budget {result.extra['budget_ms']:.0f} {result.unit})")
+            for name, ms in result.extra["slowest_ms"].items():
+                print(f"    {name:<56} {ms:>10.2f} ms")
+        print(f"Results written to {args.output}")
+        return 0
+
+    _configure_environment(args)
+
+    corpus = generate_corpus(args.corpus_dir, seed=args.seed)
+    if args.command == "corpus":
+        for item in corpus:
+            print(f"{item.name:<32} {item.size_bytes:>10} bytes  {item.path}")
+        return 0
+
+    if args.command == "micro":
+        from benchmarks.micro import run_micro_benchmarks
+
+        results = run_micro_benchmarks(corpus, args.iterations, args.warmup)
+    elif args.command == "engines":
+        from benchmarks.engines import run_engine_benchmarks
+
+        names = [name.strip() for name in args.engines.split(",") if name.strip()]
+        results = run_engine_benchmarks(corpus, names, args.iterations)
+    else:
+        from benchmarks.e2e import run_e2e_benchmark
+
+        results = run_e2e_benchmark(
+            corpus, args.count, args.concurrency, args.workers, timeout=args.timeout
+        )
+
+    write_results(args.output, args.command, results)
+    for result in results:
+        print(f"{result.name:<60} {result.value:>12.2f} {result.unit}")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
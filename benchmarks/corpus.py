@@ -0,0 +1,116 @@
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from PIL import Image, ImageDraw
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    width: int
+    height: int
+    format: str
+    mode: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.format.lower()}_{self.mode.lower()}_{self.width}x{self.height}"
+
+    @property
+    def extension(self) -> str:
+        return {"JPEG": "jpg"}.get(self.format, self.format.lower())
+
+
+@dataclass(frozen=True)
+class CorpusImage:
+    name: str
+    path: str
+    width: int
+    height: int
+    format: str
+    mode: str
+    size_bytes: int
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+DEFAULT_SPECS: Sequence[CorpusSpec] = (
+    CorpusSpec(640, 480, "JPEG", "RGB"),
+    CorpusSpec(1920, 1080, "JPEG", "RGB"),
+    CorpusSpec(4032, 3024, "JPEG", "RGB"),
+    CorpusSpec(1920, 1080, "PNG", "RGB"),
+    CorpusSpec(1920, 1080, "PNG", "RGBA"),
+    CorpusSpec(1024, 768, "PNG", "P"),
+    CorpusSpec(800, 600, "GIF", "P"),
+    CorpusSpec(1920, 1080, "WEBP", "RGB"),
+    CorpusSpec(1024, 768, "BMP", "RGB"),
+)
+
+
+def _render(spec: CorpusSpec, rng: random.Random) -> Image.Image:
+    """Draw a deterministic photo-like image: gradient, shapes and grain."""
+    base = Image.linear_gradient("L").resize((spec.width, spec.height))
+    img = Image.merge(
+        "RGB",
+        (base, base.rotate(90), base.transpose(Image.Transpose.FLIP_LEFT_RIGHT)),
+    )
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(48):
+        x0 = rng.randrange(spec.width)
+        y0 = rng.randrange(spec.height)
+        x1 = x0 + rng.randrange(1, max(2, spec.width // 4))
+        y1 = y0 + rng.randrange(1, max(2, spec.height // 4))
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=colour)
+        else:
+            draw.rectangle((x0, y0, x1, y1), outline=colour, width=3)
+
+    grain = rng.randbytes(spec.width * spec.height)
+    noise = Image.frombytes("L", (spec.width, spec.height), grain).convert("RGB")
+    img = Image.blend(img, noise, 0.1)
+
+    if spec.mode == "RGBA":
+        alpha = Image.radial_gradient("L").resize((spec.width, spec.height))
+        img.putalpha(alpha)
+    elif spec.mode == "P":
+        img = img.quantize(colors=256)
+    elif spec.mode != "RGB":
+        img = img.convert(spec.mode)
+    return img
+
+
+def generate_corpus(
+    output_dir: Path,
+    specs: Sequence[CorpusSpec] = DEFAULT_SPECS,
+    seed: int = 1234,
+) -> List[CorpusImage]:
+    """Write one image per spec into ``output_dir``.
+
+    Images are reproducible for a given seed, so results from different
+    commits are measured against identical inputs.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    corpus = []
+    for spec in specs:
+        rng = random.Random(f"{seed}:{spec.name}")
+        path = output_dir / f"{spec.name}.{spec.extension}"
+        if not path.exists():
+            img = _render(spec, rng)
+            save_kwargs = {"quality": 90} if spec.format in ("JPEG", "WEBP") else {}
+            img.save(path, spec.format, **save_kwargs)
+        corpus.append(
+            CorpusImage(
+                name=spec.name,
+                path=str(path),
+                width=spec.width,
+                height=spec.height,
+                format=spec.format,
+                mode=spec.mode,
+                size_bytes=path.stat().st_size,
+            )
+        )
+    return corpus
@@ -0,0 +1,158 @@
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+from benchmarks.corpus import CorpusImage
+from benchmarks.results import BenchmarkResult, latency_summary
+
+if TYPE_CHECKING:
+    import httpx
+
+TERMINAL_STATUSES = ("DONE", "ERROR")
+
+
+def _spawn_workers(count: int) -> List["subprocess.Popen[bytes]"]:
+    return [
+        subprocess.Popen([sys.executable, "-m", "app.worker"], env=os.environ.copy())
+        for _ in range(count)
+    ]
+
+
+def _stop_workers(workers: Sequence["subprocess.Popen[bytes]"]) -> None:
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        try:
+            worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+async def _upload_all(
+    client: "httpx.AsyncClient", corpus: Sequence[CorpusImage], count: int, concurrency: int
+) -> Tuple[Dict[str, float], List[float], float]:
+    """Upload ``count`` images; returns upload time by task id, latencies and wall time."""
+    payloads = [(Path(item.path).name, Path(item.path).read_bytes()) for item in corpus]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    task_ids: Dict[str, float] = {}
+
+    async def upload(filename: str, content: bytes) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                "/api/v1/images", files={"file": (filename, content)}
+            )
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+            task_ids[response.json()["task_id"]] = started
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(upload(name, content) for name, content in itertools.islice(itertools.cycle(payloads), count))
+    )
+    return task_ids, latencies, time.perf_counter() - started
+
+
+async def _wait_for_completion(
+    client: "httpx.AsyncClient", task_ids: Dict[str, float], poll_interval: float, timeout: float
+) -> Tuple[List[float], List[float], Dict[str, int]]:
+    """Poll until every task is finished; returns GET latencies, completion times and statuses."""
+    pending = dict(task_ids)
+    get_latencies: List[float] = []
+    completion: List[float] = []
+    statuses: Dict[str, int] = {}
+    deadline = time.perf_counter() + timeout
+
+    while pending and time.perf_counter() < deadline:
+        for task_id, uploaded_at in list(pending.items()):
+            started = time.perf_counter()
+            response = await client.get(f"/api/v1/images/{task_id}")
+            get_latencies.append(time.perf_counter() - started)
+            status = response.json().get("status")
+            if status in TERMINAL_STATUSES:
+                completion.append(time.perf_counter() - uploaded_at)
+                statuses[status] = statuses.get(status, 0) + 1
+                del pending[task_id]
+        if pending:
+            await asyncio.sleep(poll_interval)
+
+    statuses["TIMEOUT"] = len(pending)
+    return get_latencies, completion, statuses
+
+
+async def _run(
+    corpus: Sequence[CorpusImage],
+    count: int,
+    concurrency: int,
+    workers: int,
+    poll_interval: float,
+    timeout: float,
+) -> List[BenchmarkResult]:
+    import httpx
+
+    from app.api.main import app, lifespan
+
+    worker_processes = _spawn_workers(workers)
+    try:
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                task_ids, upload_latencies, upload_wall = await _upload_all(
+                    client, corpus, count, concurrency
+                )
+                get_latencies, completion, statuses = await _wait_for_completion(
+                    client, task_ids, poll_interval, timeout
+                )
+    finally:
+        _stop_workers(worker_processes)
+
+    return [
+        BenchmarkResult(
+            name="e2e.upload_throughput",
+            value=count / upload_wall if upload_wall else 0.0,
+            unit="uploads/s",
+            extra={"concurrency": concurrency, **latency_summary(upload_latencies)},
+        ),
+        BenchmarkResult(
+            name="e2e.get_image_p99",
+            value=latency_summary(get_latencies)["p99_ms"],
+            unit="ms",
+            higher_is_better=False,
+            extra=latency_summary(get_latencies),
+        ),
+        BenchmarkResult(
+            name="e2e.processing_p99",
+            value=latency_summary(completion)["p99_ms"],
+            unit="ms",
+            higher_is_better=False,
+            extra={"workers": workers, "statuses": statuses, **latency_summary(completion)},
+        ),
+    ]
+
+
+def run_e2e_benchmark(
+    corpus: Sequence[CorpusImage],
+    count: int = 200,
+    concurrency: int = 16,
+    workers: int = 2,
+    poll_interval: float = 0.05,
+    timeout: float = 300.0,
+) -> List[BenchmarkResult]:
+    """Drive the API in-process and ``workers`` worker processes end to end.
+
+    Uses the configured database and broker. ``python -m benchmarks e2e``
+    configures in-process stand-ins by default (SQLite, the in-memory broker
+    and the embedded worker, ``workers=0``); with ``--services`` it uses
+    ``DATABASE_URL`` and ``RABBITMQ_URL`` (``make dev-setup`` starts both).
+    """
+    from app.config import settings
+
+    if settings.broker == "memory" and workers:
+        raise ValueError("Worker processes cannot reach the in-memory broker, use workers=0")
+    return asyncio.run(_run(corpus, count, concurrency, workers, poll_interval, timeout))
@@ -0,0 +1,119 @@
+"""Resize engines compared on the corpus: throughput and peak memory.
+
+Every (engine, image) pair runs in a fresh interpreter, so the peak RSS it
+reports belongs to that pair alone. Memory is reported above the RSS the
+process had before the first image was touched, i.e. what processing one
+image costs rather than what the interpreter and its imports cost.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Sequence
+
+from benchmarks.corpus import CorpusImage
+from benchmarks.results import BenchmarkResult, latency_summary
+
+ENGINES = ("pillow", "vips")
+
+_PROBE = """
+import asyncio, json, resource, shutil, sys, time
+from pathlib import Path
+
+source_path, work_dir, iterations = sys.argv[1], Path(sys.argv[2]), int(sys.argv[3])
+
+from PIL import Image
+from app.config import settings
+from benchmarks.micro import _make_service
+
+service = _make_service(work_dir)
+source = service.original_dir / Path(source_path).name
+shutil.copyfile(source_path, source)
+with Image.open(source) as img:
+    engine = service.engine_for(img).name
+
+
+def reset():
+    # Finished renditions are reused, so every iteration starts empty.
+    shutil.rmtree(service.thumbnails_dir)
+    service.thumbnails_dir.mkdir()
+    service.compressed_path(str(source)).unlink(missing_ok=True)
+
+
+async def run():
+    samples = []
+    cpu = 0.0
+    for _ in range(iterations):
+        reset()
+        cpu_start, started = time.process_time(), time.perf_counter()
+        await service.create_thumbnails(str(source))
+        await service.compress_image(str(source))
+        samples.append(time.perf_counter() - started)
+        cpu += time.process_time() - cpu_start
+    return samples, cpu
+
+
+baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+samples, cpu = asyncio.run(run())
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "engine": engine,
+    "samples": samples,
+    "cpu_seconds": cpu,
+    "baseline_kb": baseline_kb,
+    "peak_kb": peak_kb,
+    "sizes": len(settings.thumbnail_size_list),
+}))
+"""
+
+
+def _run_probe(engine: str, item: CorpusImage, iterations: int, work_dir: Path) -> dict:
+    work_dir.mkdir(parents=True)
+    env = dict(os.environ, IMAGE_ENGINE=engine, UPLOAD_DIR=str(work_dir))
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE, item.path, str(work_dir), str(iterations)],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def run_engine_benchmarks(
+    corpus: Sequence[CorpusImage],
+    engines: Sequence[str] = ENGINES,
+    iterations: int = 3,
+) -> List[BenchmarkResult]:
+    """Thumbnails plus compression per CPU-second, and peak memory, per engine.
+
+    ``engine_used`` in the results shows when a request fell back to
+    Pillow (pyvips missing, or a format libvips does not load).
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-engines-") as tmp:
+        for engine in engines:
+            for item in corpus:
+                run = _run_probe(engine, item, iterations, Path(tmp) / f"{engine}-{item.name}")
+                extra = {
+                    "engine_used": run["engine"],
+                    "input_bytes": item.size_bytes,
+                    **latency_summary(run["samples"]),
+                }
+                results.append(
+                    BenchmarkResult(
+                        name=f"engines.{engine}.process.{item.name}",
+                        value=iterations / run["cpu_seconds"] if run["cpu_seconds"] else 0.0,
+                        unit="images/s/core",
+                        extra=extra,
+                    )
+                )
+                results.append(
+                    BenchmarkResult(
+                        name=f"engines.{engine}.peak_memory.{item.name}",
+                        value=max(0, run["peak_kb"] - run["baseline_kb"]) / 1024,
+                        unit="MiB",
+                        higher_is_better=False,
+                        extra=extra,
+                    )
+                )
+    return results
@@ -0,0 +1,112 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Sequence, Tuple
+
+from benchmarks.corpus import CorpusImage
+from benchmarks.results import BenchmarkResult, latency_summary
+
+if TYPE_CHECKING:
+    from app.services.image_processing import ImageProcessingService
+
+
+def _make_service(work_dir: Path) -> "ImageProcessingService":
+    from app.services.image_processing import ImageProcessingService
+
+    service = ImageProcessingService()
+    service.upload_dir = work_dir
+    service.original_dir = work_dir / "original"
+    service.thumbnails_dir = work_dir / "thumbnails"
+    service._ensure_directories()
+    return service
+
+
+async def _measure(
+    operation: Callable[[], Awaitable[object]],
+    reset: Callable[[], None],
+    iterations: int,
+    warmup: int,
+) -> Tuple[List[float], float]:
+    """Run ``operation`` and return wall-clock samples and total CPU seconds.
+
+    ``reset`` runs before every iteration, outside the timed region.
+    """
+    for _ in range(warmup):
+        reset()
+        await operation()
+
+    samples = []
+    cpu_seconds = 0.0
+    for _ in range(iterations):
+        reset()
+        cpu_start, started = time.process_time(), time.perf_counter()
+        await operation()
+        samples.append(time.perf_counter() - started)
+        cpu_seconds += time.process_time() - cpu_start
+    return samples, cpu_seconds
+
+
+async def _run(
+    corpus: Sequence[CorpusImage],
+    iterations: int,
+    warmup: int,
+    work_dir: Path,
+) -> List[BenchmarkResult]:
+    from app.config import settings
+
+    service = _make_service(work_dir)
+    sizes = len(settings.thumbnail_size_list)
+    results = []
+
+    for item in corpus:
+        source = service.original_dir / Path(item.path).name
+        shutil.copyfile(item.path, source)
+
+        def reset() -> None:
+            # Finished renditions and compressed copies are reused, so every
+            # iteration starts without them.
+            shutil.rmtree(service.thumbnails_dir)
+            service.thumbnails_dir.mkdir()
+            service.compressed_path(str(source)).unlink(missing_ok=True)
+
+        samples, cpu_seconds = await _measure(
+            lambda: service.create_thumbnails(str(source)), reset, iterations, warmup
+        )
+        results.append(
+            BenchmarkResult(
+                name=f"micro.create_thumbnails.{item.name}",
+                value=(sizes * iterations) / cpu_seconds if cpu_seconds else 0.0,
+                unit="thumbnails/s/core",
+                extra={"input_bytes": item.size_bytes, **latency_summary(samples)},
+            )
+        )
+
+        samples, cpu_seconds = await _measure(
+            lambda: service.compress_image(str(source)), reset, iterations, warmup
+        )
+        results.append(
+            BenchmarkResult(
+                name=f"micro.compress_image.{item.name}",
+                value=iterations / cpu_seconds if cpu_seconds else 0.0,
+                unit="images/s/core",
+                extra={"input_bytes": item.size_bytes, **latency_summary(samples)},
+            )
+        )
+
+    return results
+
+
+def run_micro_benchmarks(
+    corpus: Sequence[CorpusImage],
+    iterations: int = 5,
+    warmup: int = 1,
+) -> List[BenchmarkResult]:
+    """Time ``create_thumbnails`` and ``compress_image`` on every corpus image.
+
+    Throughput is reported per CPU-second, which makes it a per-core figure
+    independent of how many cores the benchmark machine has.
+    """
+    with tempfile.TemporaryDirectory(prefix="bench-micro-") as tmp:
+        return asyncio.run(_run(corpus, iterations, warmup, Path(tmp)))
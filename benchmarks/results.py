@@ -0,0 +1,118 @@
+import json
+import math
+import os
+import platform
+import subprocess
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+RESULTS_SCHEMA_VERSION = 1
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool = True
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile, ``pct`` in the 0-100 range."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(samples_s: Sequence[float]) -> Dict[str, float]:
+    """Summarise latencies given in seconds as milliseconds."""
+    return {
+        "count": len(samples_s),
+        "p50_ms": percentile(samples_s, 50) * 1000,
+        "p90_ms": percentile(samples_s, 90) * 1000,
+        "p99_ms": percentile(samples_s, 99) * 1000,
+        "max_ms": max(samples_s, default=0.0) * 1000,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_metadata() -> Dict[str, Any]:
+    from PIL import __version__ as pillow_version
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "pillow": pillow_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(path: Path, suite: str, results: List[BenchmarkResult]) -> Dict[str, Any]:
+    document = {
+        "schema": RESULTS_SCHEMA_VERSION,
+        "suite": suite,
+        "meta": environment_metadata(),
+        "results": {result.name: result.to_dict() for result in results},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, indent=2, sort_keys=True))
+    return document
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    document: Dict[str, Any] = json.loads(path.read_text())
+    if document.get("schema") != RESULTS_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported results schema in {path}: {document.get('schema')}")
+    return document
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    candidate: Dict[str, Any],
+    threshold: float = 0.10,
+) -> List[Dict[str, Any]]:
+    """Compare two result documents.
+
+    Returns one row per benchmark present in both documents. A row is marked
+    as a regression when the candidate is worse than the baseline by more
+    than ``threshold`` (relative).
+    """
+    rows = []
+    for name, base in sorted(baseline["results"].items()):
+        cand = candidate["results"].get(name)
+        if cand is None or not base["value"]:
+            continue
+        change = (cand["value"] - base["value"]) / base["value"]
+        worse = -change if base["higher_is_better"] else change
+        rows.append(
+            {
+                "name": name,
+                "unit": base["unit"],
+                "baseline": base["value"],
+                "candidate": cand["value"],
+                "change": change,
+                "regression": worse > threshold,
+            }
+        )
+    return rows
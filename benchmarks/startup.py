@@ -0,0 +1,105 @@
+"""Cold-start cost of the service entry points.
+
+Each entry point is imported in a fresh interpreter, so the numbers reflect
+what a new API or worker replica pays before it can serve traffic.
+"""
+import os
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from benchmarks.results import BenchmarkResult
+
+ENTRY_POINTS = ("app.api.main", "app.worker.main")
+
+# Import-time budget per entry point, in seconds. Generous enough for a
+# loaded CI machine, tight enough to catch a heavy import sneaking back in.
+STARTUP_BUDGET_SECONDS: Dict[str, float] = {
+    "app.api.main": 2.5,
+    "app.worker.main": 2.0,
+}
+
+# Loaded on first use (connect, first job, first upload), never at import.
+DEFERRED_MODULES = ("PIL", "aio_pika", "aiormq", "asyncpg", "aiofiles")
+
+_PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed)
+print(",".join(sorted(name for name in {deferred!r} if name in sys.modules)))
+"""
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    seconds: float
+    loaded_deferred: List[str]
+    slowest: List[Tuple[str, float]]
+
+
+def _run_probe(module: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _PROBE.format(module=module, deferred=DEFERRED_MODULES)]
+    return subprocess.run(
+        command, capture_output=True, text=True, check=True, env=dict(os.environ)
+    )
+
+
+def _parse_importtime(stderr: str, top: int) -> List[Tuple[str, float]]:
+    """Slowest modules by self time from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us) / 1e6))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def profile_import(module: str, top: int = 10) -> ImportProfile:
+    completed = _run_probe(module, importtime=True)
+    lines = completed.stdout.splitlines()
+    return ImportProfile(
+        module=module,
+        seconds=float(lines[-2]),
+        loaded_deferred=[name for name in lines[-1].split(",") if name],
+        slowest=_parse_importtime(completed.stderr, top),
+    )
+
+
+def measure_import(module: str, repeat: int = 5) -> float:
+    """Median import time of ``module`` across fresh interpreters."""
+    samples = []
+    for _ in range(repeat):
+        lines = _run_probe(module).stdout.splitlines()
+        samples.append(float(lines[-2]))
+    return statistics.median(samples)
+
+
+def run_startup_benchmarks(
+    entry_points: Sequence[str] = ENTRY_POINTS, repeat: int = 5
+) -> List[BenchmarkResult]:
+    results = []
+    for module in entry_points:
+        profile = profile_import(module)
+        results.append(
+            BenchmarkResult(
+                name=f"startup.import.{module}",
+                value=measure_import(module, repeat) * 1000,
+                unit="ms",
+                higher_is_better=False,
+                extra={
+                    "budget_ms": STARTUP_BUDGET_SECONDS.get(module, 0) * 1000,
+                    "loaded_deferred": profile.loaded_deferred,
+                    "slowest_ms": {name: round(s * 1000, 2) for name, s in profile.slowest},
+                },
+            )
+        )
+    return results
@@ -1,20 +1,33 @@
 import asyncio
+import os
+import shutil
 import tempfile
 from pathlib import Path
 from typing import AsyncGenerator, Generator
 
 import pytest
 import pytest_asyncio
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from app.api.main import app
-from app.models.database import Base, get_db
-from app.services.rabbitmq import RabbitMQService
+# The app mounts UPLOAD_DIR when it is imported, so the suite's scratch
+# directory has to exist before that; nothing is written to the tree.
+TEST_ROOT = Path(tempfile.mkdtemp(prefix="image-processing-tests-"))
+os.environ["UPLOAD_DIR"] = str(TEST_ROOT / "uploads")
+(TEST_ROOT / "uploads").mkdir()
 
+from app.api.main import app  # noqa: E402
+from app.models.database import Base, get_db  # noqa: E402
+from app.services.memory_broker import InMemoryBroker  # noqa: E402
+from app.services.rabbitmq import RabbitMQService  # noqa: E402
 
-TEST_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
+
+TEST_DATABASE_URL = f"sqlite+aiosqlite:///{TEST_ROOT / 'test.db'}"
+
+
+def pytest_sessionfinish(session: pytest.Session, exitstatus: int) -> None:
+    shutil.rmtree(TEST_ROOT, ignore_errors=True)
 
 
 @pytest.fixture(scope="session")
@@ -59,9 +72,19 @@ def override_get_db(test_db):
     app.dependency_overrides.clear()
 
 
+@pytest_asyncio.fixture
+async def memory_broker() -> AsyncGenerator[InMemoryBroker, None]:
+    broker = InMemoryBroker()
+    await broker.connect()
+    yield broker
+    await broker.disconnect()
+
+
 @pytest.fixture
-async def test_client(override_get_db) -> AsyncGenerator[AsyncClient, None]:
-    async with AsyncClient(app=app, base_url="http://test") as client:
+async def test_client(override_get_db, memory_broker, monkeypatch) -> AsyncGenerator[AsyncClient, None]:
+    # Uploads are queued in memory; nothing consumes them.
+    monkeypatch.setattr("app.api.routes.rabbitmq_service", memory_broker)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         yield client
 
 
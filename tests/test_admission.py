@@ -0,0 +1,135 @@
+from typing import Tuple
+
+import pytest
+
+from app.api.admission import AdmissionController, TokenBucket
+from app.config import settings
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRabbitMQ:
+    def __init__(self, depth: int = 0) -> None:
+        self.depth = depth
+        self.reads = 0
+
+    async def get_queue_stats(self) -> Tuple[int, int]:
+        self.reads += 1
+        return self.depth, 1
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def rabbitmq() -> FakeRabbitMQ:
+    return FakeRabbitMQ()
+
+
+@pytest.fixture
+def controller(rabbitmq: FakeRabbitMQ, clock: FakeClock) -> AdmissionController:
+    return AdmissionController(rabbitmq, clock=clock)
+
+
+class TestTokenBucket:
+    def test_burst_then_rate(self) -> None:
+        bucket = TokenBucket(rate=2.0, burst=3, now=0.0)
+
+        assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert bucket.take(0.0) == pytest.approx(0.5)
+        assert bucket.take(0.5) == 0.0
+
+
+class TestAdmission:
+    async def test_admits_everything_when_disabled(
+        self, controller: AdmissionController, rabbitmq: FakeRabbitMQ
+    ) -> None:
+        rabbitmq.depth = 10**6
+
+        assert await controller.admit("a") is None
+        assert rabbitmq.reads == 0
+
+    async def test_sheds_above_max_depth(
+        self, controller: AdmissionController, rabbitmq: FakeRabbitMQ, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "admission_max_queue_depth", 100)
+        rabbitmq.depth = 150
+
+        rejection = await controller.admit("a")
+
+        assert rejection is not None
+        assert rejection.status_code == 503
+        assert rejection.retry_after_header == str(int(settings.admission_retry_after))
+
+    async def test_queue_depth_read_is_cached(
+        self,
+        controller: AdmissionController,
+        rabbitmq: FakeRabbitMQ,
+        clock: FakeClock,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(settings, "admission_max_queue_depth", 100)
+
+        for _ in range(5):
+            await controller.admit("a")
+        clock.now += settings.admission_refresh_interval
+        await controller.admit("a")
+
+        assert rabbitmq.reads == 2
+
+    async def test_sheds_when_drain_time_too_long(
+        self,
+        controller: AdmissionController,
+        rabbitmq: FakeRabbitMQ,
+        clock: FakeClock,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(settings, "admission_max_queue_wait", 30.0)
+        rabbitmq.depth = 500
+        assert await controller.admit("a") is None
+
+        # 10 published, queue shrank by 40 in 10s: consumers do 5 jobs/s.
+        for _ in range(10):
+            controller.record_publish()
+        clock.now += 10
+        rabbitmq.depth = 460
+
+        rejection = await controller.admit("a")
+
+        assert controller.throughput == pytest.approx(5.0)
+        assert rejection is not None
+        assert rejection.reason == "queue_wait"
+        assert rejection.retry_after == pytest.approx(460 / 5.0 - 30.0)
+
+    async def test_rate_limit_per_client(
+        self, controller: AdmissionController, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "upload_rate_limit", 1.0)
+        monkeypatch.setattr(settings, "upload_rate_burst", 2)
+
+        results = [await controller.admit("a") for _ in range(3)]
+
+        assert results[:2] == [None, None]
+        assert results[2] is not None and results[2].status_code == 429
+        assert results[2].retry_after_header == "1"
+        assert await controller.admit("b") is None
+
+    async def test_fails_open_when_broker_unavailable(
+        self, controller: AdmissionController, rabbitmq: FakeRabbitMQ, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "admission_max_queue_depth", 100)
+
+        async def broken() -> Tuple[int, int]:
+            raise ConnectionError("broker down")
+
+        rabbitmq.get_queue_stats = broken
+
+        assert await controller.admit("a") is None
@@ -0,0 +1,98 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.services.animation import is_animated, iter_frames
+from app.services.image_processing import ImageProcessingService
+
+
+def make_gif(
+    path: Path, frames: int = 6, duration: int = 100, size: tuple = (200, 120)
+) -> Path:
+    images: List[Image.Image] = [
+        Image.new("RGB", size, (index * 40 % 256, 80, 160)) for index in range(frames)
+    ]
+    images[0].save(
+        path, "GIF", save_all=True, append_images=images[1:], duration=duration, loop=0
+    )
+    return path
+
+
+class TestFrames:
+    def test_frame_cap(self, tmp_path: Path) -> None:
+        with Image.open(make_gif(tmp_path / "a.gif", frames=6)) as img:
+            assert is_animated(img)
+            frames = list(iter_frames(img, max_frames=4, max_duration_ms=10_000))
+
+        assert len(frames) == 4
+        assert all(frame.mode == "RGBA" for frame, _ in frames)
+
+    def test_duration_cap(self, tmp_path: Path) -> None:
+        with Image.open(make_gif(tmp_path / "a.gif", frames=6, duration=100)) as img:
+            durations = [
+                duration for _, duration in iter_frames(img, 100, max_duration_ms=250)
+            ]
+
+        assert durations == [100, 100]
+
+
+class TestAnimatedRenditions:
+    @pytest.fixture
+    def service(self, temp_upload_dir: Path, monkeypatch) -> ImageProcessingService:
+        monkeypatch.setattr(
+            settings, "thumbnail_sizes", "50x50:mode=fill,150x150,1200x1200"
+        )
+        monkeypatch.setattr(settings, "animation_max_size", 200)
+        monkeypatch.setattr(settings, "animation_max_frames", 5)
+        service = ImageProcessingService()
+        service.upload_dir = temp_upload_dir
+        service.original_dir = temp_upload_dir / "original"
+        service.thumbnails_dir = temp_upload_dir / "thumbnails"
+        return service
+
+    async def test_small_sizes_animated_large_sizes_poster(
+        self, service: ImageProcessingService, temp_upload_dir: Path
+    ) -> None:
+        source = make_gif(temp_upload_dir / "original" / "anim.gif", frames=8)
+
+        renditions = await service.create_renditions(str(source))
+
+        for label in ("50x50", "150x150"):
+            info = renditions[label]
+            assert info["animated"] and info["frames"] == 5
+            with Image.open(temp_upload_dir / info["path"]) as img:
+                assert img.format == "WEBP"
+                assert img.n_frames == 5
+        with Image.open(temp_upload_dir / renditions["50x50"]["path"]) as img:
+            assert img.size == (50, 50)
+
+        poster = renditions["1200x1200"]
+        assert "animated" not in poster
+        with Image.open(temp_upload_dir / poster["path"]) as img:
+            assert img.format == "JPEG"
+
+    async def test_poster_mode(
+        self, service: ImageProcessingService, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "animation_mode", "poster")
+        source = make_gif(temp_upload_dir / "original" / "anim.gif")
+
+        renditions = await service.create_renditions(str(source))
+        compressed = await service.compress_image(str(source))
+
+        assert not any(info.get("animated") for info in renditions.values())
+        assert compressed.endswith("_compressed.jpg")
+
+    async def test_compress_keeps_animation(
+        self, service: ImageProcessingService, temp_upload_dir: Path
+    ) -> None:
+        source = make_gif(temp_upload_dir / "original" / "anim.gif")
+
+        compressed = await service.compress_image(str(source))
+
+        assert compressed.endswith("_compressed.gif")
+        with Image.open(compressed) as img:
+            assert img.n_frames == 6
@@ -31,9 +31,15 @@ class TestImageUpload:
         assert "Unsupported file type" in response.json()["detail"]
 
     async def test_upload_no_filename(self, test_client: AsyncClient) -> None:
-        files = {"file": (None, b"some content", "image/png")}
+        # httpx leaves out an empty filename, so the part is written by hand.
+        body = (
+            b'--boundary\r\nContent-Disposition: form-data; name="file"; filename=""\r\n'
+            b"Content-Type: image/png\r\n\r\nsome content\r\n--boundary--\r\n"
+        )
         
-        response = await test_client.post("/api/v1/images", files=files)
+        response = await test_client.post(
+            "/api/v1/images", content=body, headers={"Content-Type": "multipart/form-data; boundary=boundary"}
+        )
         
         assert response.status_code == 400
         assert "No filename provided" in response.json()["detail"]
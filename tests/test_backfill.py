@@ -0,0 +1,142 @@
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.models.image import Image, ImageStatus
+from app.services.image_processing import renditions_fingerprint
+from app.worker.backfill import Backfill, Checkpoint, stale_sizes
+
+
+def current_renditions() -> Dict[str, Dict[str, Any]]:
+    return {
+        spec.label: {"path": f"thumbnails/x_{spec.label}.jpg", "key": spec.key}
+        for spec in settings.renditions
+    }
+
+
+class TestStaleSizes:
+    def test_up_to_date(self) -> None:
+        assert stale_sizes(current_renditions()) == []
+
+    def test_missing_and_changed(self) -> None:
+        renditions = current_renditions()
+        del renditions["100x100"]
+        renditions["300x300"]["key"] = "300x300:jpeg:q70"
+
+        assert stale_sizes(renditions) == ["100x100", "300x300"]
+
+    def test_no_metadata(self) -> None:
+        assert stale_sizes(None) == ["100x100", "300x300", "1200x1200"]
+
+
+class TestBackfill:
+    @pytest.fixture
+    async def images(self, test_engine) -> Any:
+        factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+        rows = [
+            Image(
+                original_filename="fresh.png",
+                original_path="original/a_compressed.jpg",
+                status=ImageStatus.DONE,
+                renditions=current_renditions(),
+            ),
+            Image(
+                original_filename="old.png",
+                original_path="original/b_compressed.jpg",
+                status=ImageStatus.DONE,
+                renditions={"100x100": {"key": "100x100:jpeg:q70"}},
+            ),
+            Image(
+                original_filename="legacy.png",
+                original_path="original/c_compressed.jpg",
+                status=ImageStatus.DONE,
+            ),
+            Image(
+                original_filename="pending.png",
+                original_path="original/d.png",
+                status=ImageStatus.PROCESSING,
+            ),
+        ]
+        async with factory() as db:
+            db.add_all(rows)
+            await db.commit()
+        yield factory, rows
+        async with factory() as db:
+            await db.execute(
+                delete(Image).where(Image.id.in_([row.id for row in rows]))
+            )
+            await db.commit()
+
+    async def test_enqueues_only_stale_images(
+        self, images: Any, tmp_path: Path
+    ) -> None:
+        factory, rows = images
+        published: List[Dict[str, Any]] = []
+
+        async def publish(message: Dict[str, Any]) -> None:
+            published.append(message)
+
+        backfill = Backfill(
+            publish,
+            tmp_path / "checkpoint.json",
+            session_factory=factory,
+            batch_size=2,
+            rate=0,
+        )
+        checkpoint = await backfill.run()
+
+        ours = {str(row.id) for row in rows}
+        by_name = {
+            m["original_filename"]: m for m in published if m["image_id"] in ours
+        }
+        assert set(by_name) == {"old.png", "legacy.png"}
+        assert "sizes" not in by_name["old.png"]
+        assert by_name["legacy.png"]["original_path"].endswith(
+            "original/c_compressed.jpg"
+        )
+        assert checkpoint.finished
+
+    async def test_resumes_from_checkpoint(self, images: Any, tmp_path: Path) -> None:
+        factory, rows = images
+        published: List[Dict[str, Any]] = []
+
+        async def flaky_publish(message: Dict[str, Any]) -> None:
+            if published:
+                raise ConnectionError("broker went away")
+            published.append(message)
+
+        async def publish(message: Dict[str, Any]) -> None:
+            published.append(message)
+
+        path = tmp_path / "checkpoint.json"
+        with pytest.raises(ConnectionError):
+            await Backfill(
+                flaky_publish, path, session_factory=factory, batch_size=1, rate=0
+            ).run()
+        checkpoint = Checkpoint.load(path, renditions_fingerprint())
+        assert checkpoint.last_id is not None and not checkpoint.finished
+
+        await Backfill(
+            publish, path, session_factory=factory, batch_size=1, rate=0
+        ).run()
+
+        ours = {str(row.id) for row in rows}
+        names = [m["original_filename"] for m in published if m["image_id"] in ours]
+        assert sorted(names) == ["legacy.png", "old.png"]
+
+        # A finished run for the same settings does nothing.
+        published.clear()
+        await Backfill(publish, path, session_factory=factory, rate=0).run()
+        assert published == []
+
+    def test_checkpoint_for_other_settings_is_ignored(self, tmp_path: Path) -> None:
+        path = tmp_path / "checkpoint.json"
+        Checkpoint("aaaa", last_id="x", scanned=10).save(path)
+
+        assert Checkpoint.load(path, "aaaa").last_id == "x"
+        assert Checkpoint.load(path, "bbbb").last_id is None
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+from PIL import Image
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+from benchmarks.results import BenchmarkResult, compare_results, percentile
+
+
+class TestCorpus:
+    def test_generate_corpus_modes(self, tmp_path: Path) -> None:
+        specs = [
+            CorpusSpec(64, 48, "JPEG", "RGB"),
+            CorpusSpec(64, 48, "PNG", "RGBA"),
+            CorpusSpec(64, 48, "PNG", "P"),
+        ]
+
+        corpus = generate_corpus(tmp_path, specs)
+
+        assert len(corpus) == 3
+        for item, spec in zip(corpus, specs):
+            with Image.open(item.path) as img:
+                assert img.size == (64, 48)
+                assert img.format == spec.format
+                assert img.mode == spec.mode
+
+    def test_generate_corpus_is_reproducible(self, tmp_path: Path) -> None:
+        specs = [CorpusSpec(32, 32, "PNG", "RGB")]
+
+        first = generate_corpus(tmp_path / "a", specs, seed=7)
+        second = generate_corpus(tmp_path / "b", specs, seed=7)
+
+        assert Path(first[0].path).read_bytes() == Path(second[0].path).read_bytes()
+
+
+class TestResults:
+    def test_percentile(self) -> None:
+        samples = list(range(1, 101))
+
+        assert percentile(samples, 50) == 50
+        assert percentile(samples, 99) == 99
+        assert percentile([], 99) == 0.0
+
+    def test_compare_results_flags_regressions(self) -> None:
+        def document(throughput: float, latency: float) -> dict:
+            results = [
+                BenchmarkResult("throughput", throughput, "ops/s"),
+                BenchmarkResult("latency", latency, "ms", higher_is_better=False),
+            ]
+            return {"results": {r.name: r.to_dict() for r in results}}
+
+        rows = compare_results(document(100, 10), document(80, 10.5), threshold=0.1)
+
+        by_name = {row["name"]: row for row in rows}
+        assert by_name["throughput"]["regression"]
+        assert not by_name["latency"]["regression"]
+
+
+class TestEngineBenchmark:
+    def test_reports_throughput_and_memory(self, tmp_path: Path) -> None:
+        from benchmarks.engines import run_engine_benchmarks
+
+        corpus = generate_corpus(tmp_path, [CorpusSpec(320, 240, "PNG", "RGB")])
+
+        results = run_engine_benchmarks(corpus, ["pillow"], iterations=1)
+
+        by_name = {result.name: result for result in results}
+        throughput = by_name["engines.pillow.process.png_rgb_320x240"]
+        memory = by_name["engines.pillow.peak_memory.png_rgb_320x240"]
+        assert throughput.value > 0
+        assert not memory.higher_is_better
+        assert throughput.extra["engine_used"] == "pillow"
+
+
+class TestMicroBenchmark:
+    def test_timed_iterations_do_the_work(self, tmp_path: Path) -> None:
+        from benchmarks.micro import run_micro_benchmarks
+
+        corpus = generate_corpus(tmp_path, [CorpusSpec(640, 480, "PNG", "RGB")])
+
+        results = run_micro_benchmarks(corpus, iterations=2, warmup=1)
+
+        # Reused outputs would only be stat'ed, which takes well under 1 ms.
+        for result in results:
+            assert result.extra["count"] == 2
+            assert result.extra["p50_ms"] > 5, result.name
@@ -0,0 +1,69 @@
+from typing import List, Tuple
+
+from app.worker.concurrency import ConcurrencyController, next_concurrency
+
+
+def step(
+    current: int, depth: int, cpu: float = 0.2, latency=None, baseline=None
+) -> int:
+    return next_concurrency(
+        current=current,
+        queue_depth=depth,
+        cpu_utilisation=cpu,
+        job_latency=latency,
+        baseline_latency=baseline,
+        minimum=1,
+        maximum=4,
+        target_cpu=0.85,
+        latency_tolerance=1.5,
+    )
+
+
+class FakeRabbitMQ:
+    def __init__(self, depth: int, consumers: int = 1) -> None:
+        self.depth = depth
+        self.consumers = consumers
+        self.prefetch: List[int] = []
+
+    async def get_queue_stats(self) -> Tuple[int, int]:
+        return self.depth, self.consumers
+
+    async def set_prefetch(self, prefetch_count: int) -> None:
+        self.prefetch.append(prefetch_count)
+
+
+class TestNextConcurrency:
+    def test_grows_with_backlog_and_spare_cpu(self) -> None:
+        assert step(2, depth=50) == 3
+
+    def test_respects_bounds(self) -> None:
+        assert step(4, depth=50) == 4
+        assert step(1, depth=0) == 1
+
+    def test_backs_off_when_cpu_saturated(self) -> None:
+        assert step(4, depth=50, cpu=0.95) == 3
+
+    def test_backs_off_when_latency_degrades(self) -> None:
+        assert step(4, depth=50, latency=2.0, baseline=1.0) == 3
+
+    def test_shrinks_when_queue_is_empty(self) -> None:
+        assert step(3, depth=0) == 2
+
+
+class TestConcurrencyController:
+    async def test_adjust_updates_prefetch_and_snapshot(self) -> None:
+        rabbitmq = FakeRabbitMQ(depth=20, consumers=2)
+        controller = ConcurrencyController(rabbitmq)  # type: ignore[arg-type]
+        controller._sample_cpu = lambda: 0.1  # type: ignore[method-assign]
+
+        for _ in range(4):
+            controller.job_started()
+            controller.job_finished(0.5)
+        await controller.adjust(elapsed=2.0)
+
+        snapshot = controller.snapshot()
+        assert rabbitmq.prefetch == [2]
+        assert snapshot.concurrency == 2
+        assert snapshot.queue_depth == 20
+        assert snapshot.throughput_per_second == 2.0
+        assert snapshot.estimated_drain_seconds == 5.0
@@ -0,0 +1,122 @@
+import pytest
+from pydantic import ValidationError
+
+from app.config import (
+    RenditionSpec,
+    Settings,
+    parse_renditions,
+    reload_settings,
+    settings,
+)
+
+
+class TestRenditionSpecs:
+    def test_parse_defaults_and_options(self) -> None:
+        specs = parse_renditions(
+            "300x300:quality=70,100x100,64x64:format=webp:q=60", "jpeg", 85
+        )
+
+        assert specs == (
+            RenditionSpec(64, 64, "webp", 60),
+            RenditionSpec(100, 100, "jpeg", 85),
+            RenditionSpec(300, 300, "jpeg", 70),
+        )
+        assert specs[0].key == "64x64:webp:q60"
+        assert specs[0].extension == "webp"
+
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "",
+            "100",
+            "100x100:format=gif",
+            "100x100:quality=0",
+            "100x100,100x100",
+            "0x10",
+            "10x10:size=3",
+            "10x10:mode=stretch",
+            "10x10:mode=fill:crop=faces",
+            "10x10:mode=pad:background=red",
+        ],
+    )
+    def test_invalid_sizes_are_rejected(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            parse_renditions(value, "jpeg", 85)
+
+    def test_mode_options(self) -> None:
+        fill, pad = parse_renditions(
+            "10x10:mode=fill:crop=entropy,20x20:mode=pad:bg=#000000", "jpeg", 85
+        )
+
+        assert fill.key == "10x10:jpeg:q85:fill-entropy"
+        assert pad.key == "20x20:jpeg:q85:pad-000000"
+        assert parse_renditions("10x10", "jpeg", 85)[0].key == "10x10:jpeg:q85"
+
+    def test_invalid_settings_fail_validation(self) -> None:
+        with pytest.raises(ValidationError):
+            Settings(thumbnail_sizes="big")
+
+
+class TestDerivedSettings:
+    def test_values_are_precomputed(self) -> None:
+        config = Settings(allowed_extensions="JPG, png", thumbnail_sizes="10x20,5x5")
+
+        assert config.allowed_extensions_set == frozenset({"jpg", "png"})
+        assert config.thumbnail_size_list == ((5, 5), (10, 20))
+        assert config.renditions is config.renditions
+
+    def test_assignment_recomputes(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "thumbnail_quality", 60)
+
+        assert {spec.quality for spec in settings.renditions} == {60}
+
+    def test_reload_reads_environment(self, monkeypatch) -> None:
+        original = settings.thumbnail_sizes
+        monkeypatch.setenv("THUMBNAIL_SIZES", "50x50:format=png")
+        try:
+            assert reload_settings()
+            assert settings.renditions == (
+                RenditionSpec(50, 50, "png", settings.thumbnail_quality),
+            )
+        finally:
+            monkeypatch.delenv("THUMBNAIL_SIZES")
+            settings.reload()
+        assert settings.thumbnail_sizes == original
+
+    def test_invalid_reload_keeps_current_values(self, monkeypatch) -> None:
+        before = settings.renditions
+        monkeypatch.setenv("THUMBNAIL_SIZES", "nonsense")
+
+        assert not reload_settings()
+        assert settings.renditions == before
+
+    def test_invalid_assignment_changes_nothing(self) -> None:
+        config = Settings(thumbnail_sizes="10x10")
+
+        with pytest.raises(ValueError):
+            config.thumbnail_sizes = "nonsense"
+
+        assert config.thumbnail_sizes == "10x10"
+        assert config.thumbnail_size_list == ((10, 10),)
+
+    def test_reload_keeps_startup_only_fields(self, monkeypatch) -> None:
+        config = Settings()
+        database_url = config.database_url
+        monkeypatch.setenv("DATABASE_URL", "sqlite+aiosqlite:///./other.db")
+        monkeypatch.setenv("MAX_FILE_SIZE", "1024")
+
+        config.reload()
+
+        assert config.database_url == database_url
+        assert config.max_file_size == 1024
+
+    def test_reload_rejects_new_dedicated_tenants(self, monkeypatch) -> None:
+        config = Settings(tenant_weights="acme=2")
+        monkeypatch.setenv("TENANT_WEIGHTS", "acme=5,globex=1")
+
+        with pytest.raises(ValueError):
+            config.reload()
+        monkeypatch.setenv("TENANT_WEIGHTS", "acme=5")
+        config.reload()
+
+        assert config.tenant_weight_map == {"acme": 5}
@@ -0,0 +1,121 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from pydantic import ValidationError
+
+from app.config import Settings, settings
+from app.services.engines import PillowEngine, get_engine
+from app.services.image_processing import ImageProcessingService
+
+HAS_VIPS = importlib.util.find_spec("pyvips") is not None
+
+
+def make_service(upload_dir: Path) -> ImageProcessingService:
+    service = ImageProcessingService()
+    service.upload_dir = upload_dir
+    service.original_dir = upload_dir / "original"
+    service.thumbnails_dir = upload_dir / "thumbnails"
+    return service
+
+
+def oriented_photo(path: Path) -> None:
+    # Stored landscape, displayed portrait (orientation 6: rotate 90° CW).
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new("RGB", (1600, 1200), "teal").save(path, "JPEG", exif=exif)
+
+
+class TestEngineSelection:
+    def test_unknown_engine_is_rejected(self) -> None:
+        with pytest.raises(ValidationError):
+            Settings(image_engine="magick")
+
+    @pytest.mark.skipif(HAS_VIPS, reason="pyvips is installed")
+    def test_vips_falls_back_to_pillow(self) -> None:
+        assert isinstance(get_engine("vips"), PillowEngine)
+
+    def test_unsupported_formats_use_pillow(self, tmp_path: Path, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "image_engine", "vips")
+        source = tmp_path / "image.bmp"
+        Image.new("RGB", (10, 10)).save(source, "BMP")
+
+        with Image.open(source) as img:
+            assert ImageProcessingService.engine_for(img).name == "pillow"
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        "pillow",
+        pytest.param(
+            "vips",
+            marks=pytest.mark.skipif(not HAS_VIPS, reason="pyvips is not installed"),
+        ),
+    ],
+)
+class TestEngines:
+    async def test_renditions_are_upright(
+        self, engine: str, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "image_engine", engine)
+        monkeypatch.setattr(
+            settings, "thumbnail_sizes", "300x300,100x100:mode=pad,120x60:mode=fill"
+        )
+        source = temp_upload_dir / "original" / "photo.jpg"
+        oriented_photo(source)
+
+        renditions, analysis = await make_service(
+            temp_upload_dir
+        ).create_renditions_with_analysis(str(source))
+
+        sizes = {
+            label: (info["width"], info["height"]) for label, info in renditions.items()
+        }
+        assert sizes == {
+            "300x300": (225, 300),
+            "100x100": (100, 100),
+            "120x60": (120, 60),
+        }
+        with Image.open(temp_upload_dir / renditions["300x300"]["path"]) as thumbnail:
+            assert thumbnail.size == (225, 300)
+        assert analysis.phash is not None
+
+    async def test_compress_bakes_in_orientation(
+        self, engine: str, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "image_engine", engine)
+        source = temp_upload_dir / "original" / "photo.jpg"
+        oriented_photo(source)
+
+        compressed = await make_service(temp_upload_dir).compress_image(str(source))
+
+        with Image.open(compressed) as img:
+            assert img.format == "JPEG"
+            assert img.size == (1200, 1600)
+            assert img.getexif().get(0x0112) in (None, 1)
+
+    async def test_alpha_is_kept_where_the_format_stores_it(
+        self, engine: str, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "image_engine", engine)
+        monkeypatch.setattr(
+            settings,
+            "thumbnail_sizes",
+            "64x64:format=png,48x48:format=webp,32x32:format=jpeg",
+        )
+        source = temp_upload_dir / "original" / "logo.png"
+        logo = Image.new("RGBA", (200, 200), (0, 0, 0, 0))
+        logo.paste((200, 30, 30, 255), (50, 50, 150, 150))
+        logo.save(source)
+
+        renditions = await make_service(temp_upload_dir).create_renditions(str(source))
+
+        modes = {}
+        for label, info in renditions.items():
+            with Image.open(temp_upload_dir / info["path"]) as thumbnail:
+                modes[label] = thumbnail.mode
+                if thumbnail.mode == "RGBA":
+                    assert thumbnail.getpixel((0, 0))[3] == 0
+        assert modes == {"64x64": "RGBA", "48x48": "RGBA", "32x32": "RGB"}
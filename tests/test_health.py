@@ -0,0 +1,105 @@
+import asyncio
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from app.services.health import HealthMonitor, rabbitmq_check, storage_check
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestHealthMonitor:
+    async def test_ready_only_when_every_check_passes(self) -> None:
+        calls: List[str] = []
+        failing = {"rabbitmq"}
+
+        def check(name: str):
+            async def run() -> None:
+                calls.append(name)
+                if name in failing:
+                    raise ConnectionError("down")
+
+            return run
+
+        monitor = HealthMonitor(
+            {name: check(name) for name in ("database", "rabbitmq")}, 5, 1, FakeClock()
+        )
+        assert not monitor.ready()
+        assert monitor.status("database") == "unknown"
+
+        await monitor.run_checks()
+        report = monitor.report()
+        assert not monitor.ready()
+        assert report["checks"]["rabbitmq"]["error"] == "down"
+        assert report["checks"]["database"]["status"] == "healthy"
+
+        failing.clear()
+        await monitor.run_checks()
+        assert monitor.ready()
+
+        # Probes read the cache and run no checks themselves.
+        calls.clear()
+        monitor.ready()
+        monitor.live()
+        monitor.report()
+        assert calls == []
+
+    async def test_results_go_stale(self) -> None:
+        async def ok() -> None:
+            pass
+
+        clock = FakeClock()
+        monitor = HealthMonitor({"database": ok}, 5, 1, clock)
+        await monitor.run_checks()
+        assert monitor.ready()
+
+        clock.now += monitor.stale_after + 1
+        assert not monitor.ready()
+
+    async def test_timeout_marks_check_unhealthy(self) -> None:
+        async def hang() -> None:
+            await asyncio.sleep(10)
+
+        monitor = HealthMonitor({"database": hang}, 5, 0.01)
+        await monitor.run_checks()
+
+        assert monitor.status("database") == "unhealthy"
+        assert "timed out" in monitor.results["database"].error
+
+    async def test_liveness_follows_the_loop(self) -> None:
+        async def ok() -> None:
+            pass
+
+        clock = FakeClock()
+        monitor = HealthMonitor({"database": ok}, 5, 1, clock)
+        await monitor.start()
+        try:
+            assert monitor.live()
+            clock.now += monitor.stale_after + 1
+            assert not monitor.live()
+        finally:
+            await monitor.stop()
+
+
+class TestChecks:
+    async def test_rabbitmq_check(self) -> None:
+        class Service:
+            connection = None
+
+        with pytest.raises(ConnectionError):
+            await rabbitmq_check(Service())()
+
+    async def test_storage_check(self, tmp_path: Path) -> None:
+        await storage_check(tmp_path / "uploads", 0)()
+        assert (tmp_path / "uploads").is_dir()
+
+        monitor = HealthMonitor({"storage": storage_check(tmp_path, 1 << 62)}, 5, 5)
+        await monitor.run_checks()
+        assert monitor.status("storage") == "unhealthy"
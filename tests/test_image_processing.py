@@ -1,6 +1,7 @@
 import pytest
 from pathlib import Path
 
+from app.config import settings
 from app.services.image_processing import ImageProcessingService
 
 
@@ -45,6 +46,68 @@ class TestImageProcessingService:
             full_path = service.upload_dir / path
             assert full_path.exists()
 
+    async def test_create_renditions_reuses_existing_files(
+        self,
+        service: ImageProcessingService,
+        sample_image_bytes: bytes
+    ) -> None:
+        original_path = await service.save_original_image(sample_image_bytes, "test.png")
+
+        first = await service.create_renditions(original_path)
+        mtimes = {size: (service.upload_dir / info["path"]).stat().st_mtime_ns for size, info in first.items()}
+
+        second = await service.create_renditions(original_path)
+
+        assert {size: info["path"] for size, info in second.items()} == {
+            size: info["path"] for size, info in first.items()
+        }
+        for size, info in second.items():
+            assert (service.upload_dir / info["path"]).stat().st_mtime_ns == mtimes[size]
+            assert info["key"].startswith(size)
+
+    async def test_create_renditions_fills_in_missing_size(
+        self,
+        service: ImageProcessingService,
+        sample_image_bytes: bytes
+    ) -> None:
+        original_path = await service.save_original_image(sample_image_bytes, "test.png")
+        first = await service.create_renditions(original_path)
+
+        (service.upload_dir / first["300x300"]["path"]).unlink()
+        second = await service.create_renditions(original_path)
+
+        assert (service.upload_dir / second["300x300"]["path"]).exists()
+
+    async def test_create_renditions_uses_spec_format(
+        self,
+        service: ImageProcessingService,
+        sample_image_bytes: bytes,
+        monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "thumbnail_sizes", "32x32:format=webp:quality=70")
+        original_path = await service.save_original_image(sample_image_bytes, "test.png")
+
+        renditions = await service.create_renditions(original_path)
+
+        assert list(renditions) == ["32x32"]
+        assert renditions["32x32"]["path"].endswith(".webp")
+        assert renditions["32x32"]["key"] == "32x32:webp:q70"
+        assert (service.upload_dir / renditions["32x32"]["path"]).read_bytes()[8:12] == b"WEBP"
+
+    async def test_compress_image_is_idempotent(
+        self,
+        service: ImageProcessingService,
+        sample_image_bytes: bytes
+    ) -> None:
+        original_path = await service.save_original_image(sample_image_bytes, "test.png")
+
+        first = await service.compress_image(original_path)
+        mtime = Path(first).stat().st_mtime_ns
+        second = await service.compress_image(original_path)
+
+        assert first == second
+        assert Path(second).stat().st_mtime_ns == mtime
+
     async def test_compress_image(
         self, 
         service: ImageProcessingService, 
@@ -0,0 +1,70 @@
+import logging
+import queue
+
+from app.utils.logging import JSONFormatter, NonBlockingQueueHandler, RateLimitFilter
+
+
+def make_record(
+    name: str, level: int = logging.INFO, msg: str = "hello %s", args=("world",)
+):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class TestRateLimitFilter:
+    def test_rate_limit_per_logger(self) -> None:
+        now = [0.0]
+        rate_filter = RateLimitFilter({"app.api": 2}, clock=lambda: now[0])
+
+        results = [rate_filter.filter(make_record("app.api.routes")) for _ in range(5)]
+        assert results == [True, True, False, False, False]
+
+        now[0] = 1.0
+        assert rate_filter.filter(make_record("app.api.routes"))
+        assert rate_filter.filter(make_record("app.worker"))
+        assert rate_filter.dropped == 3
+
+    def test_sampling_keeps_fraction(self) -> None:
+        rate_filter = RateLimitFilter(sample_rates={"app.services": 0.25})
+
+        kept = sum(
+            rate_filter.filter(make_record("app.services.rabbitmq")) for _ in range(100)
+        )
+
+        assert kept == 25
+
+    def test_warnings_are_never_dropped(self) -> None:
+        rate_filter = RateLimitFilter({"app": 0}, {"app": 0})
+
+        assert rate_filter.filter(make_record("app.worker", logging.WARNING))
+        assert not rate_filter.filter(make_record("app.worker", logging.INFO))
+
+
+class TestNonBlockingQueueHandler:
+    def test_prepare_renders_message_and_exception(self) -> None:
+        handler = NonBlockingQueueHandler(queue.Queue())
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            import sys
+
+            record = make_record("app")
+            record.exc_info = sys.exc_info()
+
+        prepared = handler.prepare(record)
+        payload = JSONFormatter().format(prepared)
+
+        assert prepared.args is None
+        assert (
+            '"message": "hello world"' in payload
+            or '"message":"hello world"' in payload
+        )
+        assert "ValueError: boom" in payload
+
+    def test_full_queue_drops_instead_of_blocking(self) -> None:
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+
+        handler.handle(make_record("app"))
+        handler.handle(make_record("app"))
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
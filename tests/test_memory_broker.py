@@ -0,0 +1,208 @@
+import asyncio
+import io
+import json
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+from pydantic import ValidationError
+
+from app.config import Settings, settings
+from app.models.image import Image as ImageRow
+from app.models.image import ImageStatus
+from app.services.memory_broker import InMemoryBroker
+from app.services.rabbitmq import (
+    ENQUEUED_AT_HEADER,
+    LEGACY_ROUTING_KEY,
+    QUEUE_NAME,
+    create_broker,
+)
+from app.worker.embedded import EmbeddedWorker
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestInMemoryBroker:
+    async def test_publish_and_consume(self, memory_broker: InMemoryBroker) -> None:
+        received = []
+
+        async def consume(message) -> None:
+            async with message.process():
+                received.append(
+                    (message.routing_key, json.loads(message.body), message.headers)
+                )
+
+        await memory_broker.publish_message(QUEUE_NAME, {"n": 1})
+        assert (await memory_broker.get_lane_stats())[QUEUE_NAME] == (1, 0)
+
+        await memory_broker.consume_messages(consume)
+        await settle()
+
+        ((routing_key, body, headers),) = received
+        assert (routing_key, body) == (QUEUE_NAME, {"n": 1})
+        assert ENQUEUED_AT_HEADER in headers
+        assert await memory_broker.get_queue_stats() == (0, 1)
+
+    async def test_prefetch_limits_unacked(self, memory_broker: InMemoryBroker) -> None:
+        held = []
+        await memory_broker.set_prefetch(2)
+        await memory_broker.consume_messages(
+            lambda message: asyncio.sleep(0, held.append(message))
+        )
+
+        for n in range(3):
+            await memory_broker.publish_message(QUEUE_NAME, {"n": n})
+        await settle()
+        assert len(held) == 2
+
+        await held[0].ack()
+        await settle()
+        assert [json.loads(m.body)["n"] for m in held] == [0, 1, 2]
+
+    async def test_rejected_message_is_redelivered_first(
+        self, memory_broker: InMemoryBroker
+    ) -> None:
+        seen = []
+
+        async def consume(message) -> None:
+            seen.append((json.loads(message.body)["n"], message.redelivered))
+            async with message.process(requeue=True):
+                if not message.redelivered:
+                    raise RuntimeError("boom")
+
+        await memory_broker.set_prefetch(1)
+        await memory_broker.publish_message(QUEUE_NAME, {"n": 0})
+        await memory_broker.publish_message(QUEUE_NAME, {"n": 1})
+        await memory_broker.consume_messages(consume)
+        await settle()
+
+        assert seen[:3] == [(0, False), (0, True), (1, False)]
+
+    async def test_routing(self, memory_broker: InMemoryBroker) -> None:
+        await memory_broker.publish_message(LEGACY_ROUTING_KEY, {})
+        await memory_broker.publish_message("nowhere", {})
+
+        assert (await memory_broker.get_queue_stats())[0] == 1
+
+    async def test_stop_consuming(self, memory_broker: InMemoryBroker) -> None:
+        received = []
+        await memory_broker.consume_messages(
+            lambda message: asyncio.sleep(0, received.append(message))
+        )
+        await memory_broker.stop_consuming()
+
+        await memory_broker.publish_message(QUEUE_NAME, {})
+        await settle()
+
+        assert received == []
+        assert (await memory_broker.get_lane_stats())[QUEUE_NAME] == (1, 0)
+
+
+class TestBrokerSettings:
+    def test_memory_broker_needs_embedded_worker(self) -> None:
+        with pytest.raises(ValidationError):
+            Settings(broker="memory")
+        with pytest.raises(ValidationError):
+            Settings(broker="kafka")
+
+    def test_memory_broker_needs_one_api_process(self) -> None:
+        for workers in (0, 4):
+            with pytest.raises(ValidationError):
+                Settings(broker="memory", embedded_worker=True, api_workers=workers)
+        assert (
+            Settings(broker="memory", embedded_worker=True, api_workers=1).broker
+            == "memory"
+        )
+
+    def test_create_broker(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "embedded_worker", True)
+        monkeypatch.setattr(settings, "broker", "memory")
+
+        assert isinstance(create_broker(), InMemoryBroker)
+
+
+class TestEmbeddedWorker:
+    async def test_upload_is_processed_in_process(
+        self,
+        test_client: AsyncClient,
+        test_engine,
+        memory_broker: InMemoryBroker,
+        temp_upload_dir: Path,
+        monkeypatch,
+    ) -> None:
+        from app.services.image_processing import image_processing_service
+
+        monkeypatch.setattr("app.models.database._engine", test_engine)
+        monkeypatch.setattr(settings, "thumbnail_sizes", "32x32")
+        monkeypatch.setattr(image_processing_service, "upload_dir", temp_upload_dir)
+        monkeypatch.setattr(
+            image_processing_service, "original_dir", temp_upload_dir / "original"
+        )
+        monkeypatch.setattr(
+            image_processing_service, "thumbnails_dir", temp_upload_dir / "thumbnails"
+        )
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 48), "red").save(buffer, "PNG")
+        worker = EmbeddedWorker(memory_broker)
+        await worker.start()
+
+        try:
+            upload = await test_client.post(
+                "/api/v1/images",
+                files={"file": ("red.png", buffer.getvalue(), "image/png")},
+            )
+            task_id = upload.json()["task_id"]
+            for _ in range(200):
+                data = (await test_client.get(f"/api/v1/images/{task_id}")).json()
+                if data["status"] != "PROCESSING":
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await worker.stop(5)
+
+        assert data["status"] == "DONE"
+        assert set(data["thumbnails"]) == {"32x32"}
+        assert (
+            temp_upload_dir / data["thumbnails"]["32x32"].removeprefix("/uploads/")
+        ).exists()
+
+    async def test_recovers_unfinished_images(
+        self,
+        test_db,
+        test_engine,
+        memory_broker: InMemoryBroker,
+        temp_upload_dir: Path,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr("app.models.database._engine", test_engine)
+        monkeypatch.setattr(settings, "upload_dir", str(temp_upload_dir))
+        original = temp_upload_dir / "original" / "kept.png"
+        Image.new("RGB", (8, 8)).save(original)
+        kept = ImageRow(
+            original_filename="kept.png",
+            original_path=str(original),
+            status=ImageStatus.PROCESSING,
+        )
+        lost = ImageRow(
+            original_filename="lost.png",
+            original_path="original/lost.png",
+            status=ImageStatus.NEW,
+        )
+        test_db.add_all([kept, lost])
+        await test_db.commit()
+
+        await EmbeddedWorker(memory_broker).recover()
+
+        queued = [
+            json.loads(m.body)["image_id"]
+            for q in memory_broker.memory_queues.values()
+            for m in q.ready
+        ]
+        await test_db.refresh(lost)
+        assert str(kept.id) in queued
+        assert str(lost.id) not in queued
+        assert lost.status == ImageStatus.ERROR
@@ -0,0 +1,200 @@
+import io
+from pathlib import Path
+from struct import pack
+
+import pytest
+from PIL import Image, ImageCms
+from pydantic import ValidationError
+
+from app.config import Settings, settings
+from app.services.image_processing import ImageProcessingService
+from app.services.metadata import ORIENTATION_TAG, ImageMetadata
+
+
+def exif_bytes(orientation: int, thumbnail: bytes = b"") -> bytes:
+    """Minimal little-endian EXIF: orientation in IFD0, optional IFD1 preview."""
+    ifd1_offset = 26 if thumbnail else 0
+    ifd0 = (
+        pack("<H", 1)
+        + pack("<HHII", ORIENTATION_TAG, 3, 1, orientation)
+        + pack("<I", ifd1_offset)
+    )
+    ifd1 = b""
+    if thumbnail:
+        data_offset = 26 + 2 + 2 * 12 + 4
+        ifd1 = (
+            pack("<H", 2)
+            + pack("<HHII", 0x0201, 4, 1, data_offset)
+            + pack("<HHII", 0x0202, 4, 1, len(thumbnail))
+            + pack("<I", 0)
+        )
+    return b"Exif\x00\x00" + b"II*\x00" + pack("<I", 8) + ifd0 + ifd1 + thumbnail
+
+
+def jpeg(image: Image.Image, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", **options)
+    return buffer.getvalue()
+
+
+def portrait_shot() -> Image.Image:
+    """Stored landscape, red on the left: upright (orientation 6) red is on top."""
+    image = Image.new("RGB", (800, 600), "blue")
+    image.paste((255, 0, 0), (0, 0, 400, 600))
+    return image
+
+
+@pytest.fixture
+def service(temp_upload_dir: Path) -> ImageProcessingService:
+    service = ImageProcessingService()
+    service.upload_dir = temp_upload_dir
+    service.original_dir = temp_upload_dir / "original"
+    service.thumbnails_dir = temp_upload_dir / "thumbnails"
+    return service
+
+
+@pytest.fixture
+def source(temp_upload_dir: Path) -> Path:
+    path = temp_upload_dir / "original" / "shot.jpg"
+    path.write_bytes(jpeg(portrait_shot(), exif=exif_bytes(6)))
+    return path
+
+
+class TestOrientation:
+    def test_read_orientation(self, source: Path) -> None:
+        with Image.open(source) as img:
+            meta = ImageMetadata.read(img)
+
+        assert meta.transpose == Image.Transpose.ROTATE_270
+
+    async def test_renditions_are_upright(
+        self,
+        service: ImageProcessingService,
+        source: Path,
+        temp_upload_dir: Path,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(settings, "thumbnail_sizes", "60x60:mode=fill,100x100")
+
+        renditions = await service.create_renditions(str(source))
+
+        assert (renditions["100x100"]["width"], renditions["100x100"]["height"]) == (
+            75,
+            100,
+        )
+        with Image.open(temp_upload_dir / renditions["100x100"]["path"]) as img:
+            assert img.size == (75, 100)
+            red, green, blue = img.getpixel((37, 10))
+            assert red > 200 and blue < 60
+        with Image.open(temp_upload_dir / renditions["60x60"]["path"]) as img:
+            assert img.size == (60, 60)
+
+    async def test_compressed_copy_is_upright(
+        self, service: ImageProcessingService, source: Path
+    ) -> None:
+        compressed = await service.compress_image(str(source))
+
+        with Image.open(compressed) as img:
+            assert img.size == (600, 800)
+            assert img.getexif().get(ORIENTATION_TAG, 1) == 1
+
+
+class TestMetadataPolicy:
+    @pytest.fixture
+    def tagged_source(self, temp_upload_dir: Path) -> Path:
+        path = temp_upload_dir / "original" / "tagged.jpg"
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        path.write_bytes(jpeg(portrait_shot(), exif=exif_bytes(6), icc_profile=icc))
+        return path
+
+    async def rendition(
+        self, service: ImageProcessingService, path: Path, temp_upload_dir: Path
+    ) -> Image.Image:
+        renditions = await service.create_renditions(str(path))
+        with Image.open(temp_upload_dir / renditions["100x100"]["path"]) as img:
+            img.load()
+            return img
+
+    @pytest.fixture(autouse=True)
+    def one_size(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "thumbnail_sizes", "100x100")
+
+    async def test_strip(
+        self,
+        service: ImageProcessingService,
+        tagged_source: Path,
+        temp_upload_dir: Path,
+    ) -> None:
+        img = await self.rendition(service, tagged_source, temp_upload_dir)
+
+        assert "exif" not in img.info
+        assert "icc_profile" not in img.info
+
+    async def test_icc(
+        self,
+        service: ImageProcessingService,
+        tagged_source: Path,
+        temp_upload_dir: Path,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(settings, "metadata_policy", "icc")
+
+        img = await self.rendition(service, tagged_source, temp_upload_dir)
+
+        assert "exif" not in img.info
+        assert img.info.get("icc_profile")
+
+    async def test_keep_resets_orientation(
+        self,
+        service: ImageProcessingService,
+        tagged_source: Path,
+        temp_upload_dir: Path,
+        monkeypatch,
+    ) -> None:
+        monkeypatch.setattr(settings, "metadata_policy", "keep")
+
+        img = await self.rendition(service, tagged_source, temp_upload_dir)
+
+        assert img.size == (75, 100)
+        assert img.getexif()[ORIENTATION_TAG] == 1
+        assert img.info.get("icc_profile")
+
+    def test_unknown_policy_rejected(self) -> None:
+        with pytest.raises(ValidationError):
+            Settings(metadata_policy="some")
+
+
+class TestExifThumbnail:
+    async def test_small_sizes_use_embedded_preview(
+        self, service: ImageProcessingService, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "thumbnail_sizes", "100x100")
+        monkeypatch.setattr(settings, "use_exif_thumbnail", True)
+        # The preview is green where the full image is red/blue, so the
+        # rendition shows which one it was made from.
+        preview = jpeg(Image.new("RGB", (160, 120), "green"))
+        path = temp_upload_dir / "original" / "camera.jpg"
+        path.write_bytes(jpeg(portrait_shot(), exif=exif_bytes(6, preview)))
+
+        renditions = await service.create_renditions(str(path))
+
+        with Image.open(temp_upload_dir / renditions["100x100"]["path"]) as img:
+            assert img.size == (75, 100)
+            red, green, blue = img.getpixel((37, 50))
+            assert green > 100 and red < 60
+
+    async def test_preview_too_small_is_not_used(
+        self, service: ImageProcessingService, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "thumbnail_sizes", "300x300")
+        monkeypatch.setattr(settings, "use_exif_thumbnail", True)
+        preview = jpeg(Image.new("RGB", (160, 120), "green"))
+        path = temp_upload_dir / "original" / "camera.jpg"
+        path.write_bytes(jpeg(portrait_shot(), exif=exif_bytes(6, preview)))
+
+        renditions = await service.create_renditions(str(path))
+
+        with Image.open(temp_upload_dir / renditions["300x300"]["path"]) as img:
+            assert img.size == (225, 300)
+            red, green, blue = img.getpixel((100, 20))
+            assert red > 200 and green < 60
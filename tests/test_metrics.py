@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from app.utils.metrics import Counter, Gauge, Histogram, MetricsRegistry
+from app.worker.status_server import StatusServer
+
+
+class TestMetrics:
+    def test_counter_and_gauge_render(self) -> None:
+        registry = MetricsRegistry()
+        jobs = Counter("jobs", "Jobs", ["status"], registry=registry)
+        pool = Gauge("pool", "Pool", ["state"], registry=registry)
+
+        jobs.inc(status="done")
+        jobs.inc(2, status="done")
+        pool.set_function(lambda: 4, state="checked_out")
+
+        output = registry.render()
+
+        assert "# TYPE jobs counter" in output
+        assert 'jobs_total{status="done"} 3' in output
+        assert 'pool{state="checked_out"} 4' in output
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        registry = MetricsRegistry()
+        latency = Histogram(
+            "latency", "Latency", ["stage"], buckets=(0.1, 1.0), registry=registry
+        )
+
+        latency.observe(0.05, stage="decode")
+        latency.observe(0.5, stage="decode")
+        latency.observe(5.0, stage="decode")
+
+        output = registry.render()
+
+        assert 'latency_bucket{stage="decode",le="0.1"} 1' in output
+        assert 'latency_bucket{stage="decode",le="1"} 2' in output
+        assert 'latency_bucket{stage="decode",le="+Inf"} 3' in output
+        assert 'latency_count{stage="decode"} 3' in output
+        assert latency.count(stage="decode") == 3
+
+    def test_label_mismatch_raises(self) -> None:
+        registry = MetricsRegistry()
+        jobs = Counter("jobs", "Jobs", ["status"], registry=registry)
+
+        with pytest.raises(ValueError, match="expects labels"):
+            jobs.inc(stage="decode")
+
+
+class TestMultiprocessMetrics:
+    @staticmethod
+    def process_registry(jobs: int, depth: int, latency: float) -> MetricsRegistry:
+        registry = MetricsRegistry()
+        Counter("jobs", "Jobs", ["status"], registry=registry).inc(jobs, status="done")
+        Gauge("depth", "Depth", aggregate="max", registry=registry).set(depth)
+        Gauge("in_flight", "In flight", registry=registry).set(1)
+        histogram = Histogram("latency", "Latency", buckets=(1.0,), registry=registry)
+        histogram.observe(latency)
+        return registry
+
+    def test_snapshots_of_all_processes_are_merged(self, tmp_path: Path) -> None:
+        this = self.process_registry(jobs=2, depth=7, latency=0.5)
+        other = self.process_registry(jobs=3, depth=5, latency=2.0)
+        (tmp_path / "1.json").write_text(json.dumps(other.snapshot()))
+        stopped = tmp_path / "2.json"
+        stopped.write_text(json.dumps(other.snapshot()))
+        os.utime(stopped, (0, 0))
+
+        output = this.render_merged(tmp_path, max_age=60)
+
+        assert 'jobs_total{status="done"} 5' in output
+        assert "depth 7" in output
+        assert "in_flight 2" in output
+        assert 'latency_bucket{le="1"} 1' in output
+        assert 'latency_bucket{le="+Inf"} 2' in output
+        assert "latency_count 2" in output
+        assert (tmp_path / f"{os.getpid()}.json").exists()
+
+        this.remove_snapshot(tmp_path)
+        assert not (tmp_path / f"{os.getpid()}.json").exists()
+
+
+class TestStatusServer:
+    async def test_serves_registered_route(self) -> None:
+        async def handler():
+            return 200, "text/plain", "ok\n"
+
+        server = StatusServer("127.0.0.1", 0)
+        server.add_route("/metrics", handler)
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+
+        async def get(path: str) -> bytes:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response
+
+        try:
+            ok = await get("/metrics")
+            missing = await get("/nope")
+        finally:
+            await server.stop()
+
+        assert ok.startswith(b"HTTP/1.1 200 OK")
+        assert ok.endswith(b"ok\n")
+        assert missing.startswith(b"HTTP/1.1 404")
@@ -0,0 +1,251 @@
+import gzip
+import json
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models.ids import uuid7, uuid7_time
+from app.models.image import Image, ImagePartitionHint
+from app.models.partitioning import HINT_WINDOW, image_filter, image_lookup
+from app.worker.partitions import (
+    MaintenanceReport,
+    PartitionMaintainer,
+    Partitions,
+    add_months,
+    expired_partitions,
+    months_to_create,
+    partition_month,
+    write_archive,
+)
+
+
+class FakeResult:
+    rowcount = 1
+
+    def __init__(self, value: Any = None) -> None:
+        self.value = value
+
+    def scalar_one(self) -> Any:
+        return self.value
+
+
+class FakeSession:
+    """Records the SQL it is given; stands in for PostgreSQL-only statements."""
+
+    def __init__(self, log: List[str], exists: bool = False) -> None:
+        self.log = log
+        self.exists = exists
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+    async def execute(
+        self, statement: Any, params: Optional[Dict[str, Any]] = None
+    ) -> FakeResult:
+        sql = " ".join(str(statement).split())
+        self.log.append(sql)
+        if "EXISTS" in sql:
+            return FakeResult(self.exists)
+        return FakeResult("images_p202610")
+
+    async def connection(
+        self, execution_options: Optional[Dict[str, Any]] = None
+    ) -> "FakeSession":
+        if execution_options:
+            self.log.append(f"isolation {execution_options['isolation_level']}")
+        return self
+
+    async def stream(self, statement: Any) -> AsyncIterator[Any]:
+        self.log.append("export")
+
+        async def rows() -> AsyncIterator[Any]:
+            yield type("Row", (), {"_mapping": {"id": 1}})()
+
+        return rows()
+
+    async def commit(self) -> None:
+        self.log.append("commit")
+
+
+class TestUUID7:
+    def test_version_and_time(self) -> None:
+        now = datetime(2026, 10, 19, 12, 30, 15, 123000)
+        value = uuid7(now=(now - datetime(1970, 1, 1)).total_seconds())
+
+        assert value.version == 7
+        assert value.variant == uuid.RFC_4122
+        assert uuid7_time(value) == now
+
+    def test_time_ordered(self) -> None:
+        values = [uuid7(now=1_700_000_000 + step) for step in range(5)]
+
+        assert sorted(values) == values
+        assert sorted(str(value) for value in values) == [
+            str(value) for value in values
+        ]
+
+    def test_other_versions_have_no_time(self) -> None:
+        assert uuid7_time(uuid.uuid4()) is None
+
+    def test_new_images_get_uuid7(self) -> None:
+        assert Image.__table__.c.id.default.arg.__name__ == "uuid7"
+
+
+class TestImageLookup:
+    @pytest.fixture
+    async def factory(self, test_engine) -> Any:
+        return sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def test_uuid7_id_gives_range(self, factory: Any) -> None:
+        image_id = uuid7()
+
+        async with factory() as db:
+            where, params = await image_lookup(db, image_id)
+
+        assert "created_at >= :created_from" in where
+        assert params["created_to"] - params["created_from"] == 2 * HINT_WINDOW
+
+    async def test_legacy_id_uses_hint(self, factory: Any) -> None:
+        legacy, unknown = uuid.uuid4(), uuid.uuid4()
+        created = datetime(2024, 3, 5, 10, 0, 0)
+        async with factory() as db:
+            db.add(ImagePartitionHint(id=legacy, created_at=created))
+            await db.commit()
+        try:
+            async with factory() as db:
+                _, params = await image_lookup(db, legacy)
+                where, _ = await image_lookup(db, unknown)
+        finally:
+            async with factory() as db:
+                await db.execute(
+                    delete(ImagePartitionHint).where(ImagePartitionHint.id == legacy)
+                )
+                await db.commit()
+
+        assert params["created_from"] == created
+        assert params["created_to"] == created + timedelta(seconds=1)
+        assert where == "id = :image_id"
+
+    async def test_filter_is_pruned_like_lookup(self, factory: Any) -> None:
+        async with factory() as db:
+            pruned = await image_filter(db, uuid7())
+            plain = await image_filter(db, uuid.uuid4())
+
+        assert "created_at >=" in str(pruned)
+        assert "created_at" not in str(plain)
+
+
+class TestPartitionMaintenance:
+    def test_month_arithmetic(self) -> None:
+        assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+        assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+        assert partition_month("images_p202602") == date(2026, 2, 1)
+        assert partition_month("images_default") is None
+
+    def test_months_to_create(self) -> None:
+        assert months_to_create(date(2026, 12, 19), 2) == [
+            date(2026, 12, 1),
+            date(2027, 1, 1),
+            date(2027, 2, 1),
+        ]
+
+    def test_expired_partitions(self) -> None:
+        names = [
+            "images_p202410",
+            "images_default",
+            "images_p202409",
+            "images_p202408",
+            "images_p202409x",
+        ]
+
+        # October 2024 ended less than 24 months before October 2026.
+        assert expired_partitions(names, date(2026, 10, 19), 24) == [
+            "images_p202408",
+            "images_p202409",
+        ]
+        assert expired_partitions(names, date(2026, 10, 19), 0) == []
+
+    async def test_write_archive(self, tmp_path: Path) -> None:
+        image_id = uuid.uuid4()
+
+        async def rows() -> AsyncIterator[Dict[str, Any]]:
+            yield {
+                "id": image_id,
+                "created_at": datetime(2024, 9, 1),
+                "thumbnails": {"1x1": "a.jpg"},
+            }
+            yield {
+                "id": uuid.uuid4(),
+                "created_at": datetime(2024, 9, 2),
+                "thumbnails": None,
+            }
+
+        path = tmp_path / "archive" / "images_p202409.jsonl.gz"
+        count = await write_archive(path, rows())
+
+        with gzip.open(path, "rt") as archive:
+            lines = [json.loads(line) for line in archive]
+        assert count == 2
+        assert lines[0] == {
+            "id": str(image_id),
+            "created_at": "2024-09-01T00:00:00",
+            "thumbnails": {"1x1": "a.jpg"},
+        }
+        assert list(path.parent.iterdir()) == [path]
+
+    async def test_archive_detaches_before_exporting(self, tmp_path: Path) -> None:
+        log: List[str] = []
+        maintainer = PartitionMaintainer(lambda: FakeSession(log), archive_dir=tmp_path)
+        report = MaintenanceReport()
+
+        await maintainer.archive("images_p202409", report, concurrently=True)
+
+        assert (
+            log.index("isolation AUTOCOMMIT")
+            < log.index(
+                'ALTER TABLE images DETACH PARTITION "images_p202409" CONCURRENTLY'
+            )
+            < log.index("export")
+            < log.index('DROP TABLE "images_p202409"')
+        )
+        assert report.archived == {"images_p202409": 1}
+
+        log.clear()
+        await maintainer.archive("images_p202409", report, "detached")
+        assert not any("DETACH" in sql for sql in log) and "export" in log
+
+    async def test_rows_in_default_partition_are_moved(self, monkeypatch) -> None:
+        log: List[str] = []
+        maintainer = PartitionMaintainer(
+            lambda: FakeSession(log, exists=True), months_ahead=0
+        )
+
+        async def partitions() -> Partitions:
+            return Partitions(["images_default"], [], [])
+
+        monkeypatch.setattr(maintainer, "partitions", partitions)
+        report = MaintenanceReport()
+        await maintainer.ensure(date(2026, 10, 19), report)
+
+        statements = [
+            sql
+            for sql in log
+            if sql.startswith(("ALTER", "SELECT create", "INSERT", "DELETE"))
+        ]
+        assert statements == [
+            'ALTER TABLE images DETACH PARTITION "images_default"',
+            "SELECT create_images_partition(:month)",
+            'INSERT INTO images SELECT * FROM "images_default" WHERE created_at >= :start AND created_at < :end',
+            'DELETE FROM "images_default" WHERE created_at >= :start AND created_at < :end',
+            'ALTER TABLE images ATTACH PARTITION "images_default" DEFAULT',
+        ]
+        assert log[-1] == "commit" and report.created == ["images_p202610"]
@@ -0,0 +1,53 @@
+import base64
+import io
+from pathlib import Path
+
+from PIL import Image
+
+from app.config import settings
+from app.services.image_processing import ImageProcessingService
+from app.services.placeholders import DATA_URI_PREFIX, placeholder
+
+
+def decode(uri: str) -> Image.Image:
+    assert uri.startswith(DATA_URI_PREFIX)
+    return Image.open(io.BytesIO(base64.b64decode(uri[len(DATA_URI_PREFIX) :])))
+
+
+class TestPlaceholder:
+    def test_small_webp(self) -> None:
+        image = Image.linear_gradient("L").resize((400, 300)).convert("RGB")
+
+        uri = placeholder(image, 16, 40)
+
+        preview = decode(uri)
+        assert preview.format == "WEBP"
+        assert preview.size == (16, 12)
+        assert len(uri) < 400
+
+    def test_keeps_alpha_and_never_upscales(self) -> None:
+        image = Image.new("LA", (8, 4), (128, 0))
+
+        preview = decode(placeholder(image, 16, 40))
+
+        assert preview.size == (8, 4)
+        assert preview.mode == "RGBA"
+
+    def test_disabled(self) -> None:
+        assert placeholder(Image.new("RGB", (10, 10)), 0, 40) is None
+
+
+class TestRenditionPlaceholder:
+    async def test_from_rendering_and_reuse(self, temp_upload_dir: Path) -> None:
+        service = ImageProcessingService()
+        service.upload_dir = temp_upload_dir
+        service.original_dir = temp_upload_dir / "original"
+        service.thumbnails_dir = temp_upload_dir / "thumbnails"
+        source = temp_upload_dir / "original" / "photo.jpg"
+        Image.new("RGB", (1600, 1200), "teal").save(source, "JPEG")
+
+        _, rendered = await service.create_renditions_with_analysis(str(source))
+        _, reused = await service.create_renditions_with_analysis(str(source))
+
+        assert decode(rendered.placeholder).size == (settings.placeholder_size, 12)
+        assert decode(reused.placeholder).size == decode(rendered.placeholder).size
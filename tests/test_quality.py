@@ -0,0 +1,172 @@
+import io
+from pathlib import Path
+from typing import List
+
+import pytest
+from PIL import Image
+
+from app.config import QualityTarget, Settings, parse_renditions, settings
+from app.services.image_processing import ImageProcessingService
+from app.services.quality import (
+    TOLERANCE,
+    centre_sample,
+    choose_quality,
+    encode_adaptive,
+    search_session,
+    ssim,
+)
+
+
+def jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def detailed(size=(320, 240)) -> Image.Image:
+    return Image.merge(
+        "RGB",
+        [
+            Image.effect_mandelbrot(size, (-2, -1.2, 1, 1.2), 100),
+            Image.linear_gradient("L").resize(size),
+            Image.effect_noise(size, 30),
+        ],
+    )
+
+
+class TestSsim:
+    def test_identical_and_ordered_by_quality(self) -> None:
+        image = detailed()
+        scores = [
+            ssim(image, Image.open(io.BytesIO(jpeg(image, q)))) for q in (20, 60, 95)
+        ]
+
+        assert ssim(image, image) == pytest.approx(1.0)
+        assert scores == sorted(scores)
+        assert scores[0] < 0.95
+
+    def test_centre_sample(self) -> None:
+        image = Image.new("RGB", (3000, 500))
+
+        sample = centre_sample(image, 1024)
+
+        assert sample.size == (1024, 500)
+        assert centre_sample(sample, 1024) is sample
+
+
+class TestSearch:
+    def encoder(self, calls: List[int]):
+        def encode(quality: int) -> bytes:
+            calls.append(quality)
+            return bytes(quality)
+
+        return encode
+
+    def test_lowest_quality_meeting_ssim(self, monkeypatch) -> None:
+        # Pretend quality q scores q / 100.
+        monkeypatch.setattr(
+            "app.services.quality._passes",
+            lambda target, ref, data: len(data) / 100 >= target.value,
+        )
+        calls: List[int] = []
+
+        with search_session(10):
+            quality, data = choose_quality(
+                Image.new("L", (8, 8)),
+                self.encoder(calls),
+                QualityTarget("ssim", 0.7, 40, 95),
+                85,
+            )
+
+        assert 70 <= quality <= 70 + 2
+        assert data == bytes(quality)
+        assert calls[0] == 85
+        assert len(calls) <= 7
+
+    def test_size_budget_and_seed_from_previous(self) -> None:
+        image = detailed()
+        target = QualityTarget("size", 2.0, 30, 95)
+
+        with search_session(10) as session:
+            quality, data = choose_quality(
+                image, lambda q: jpeg(image, q), target, 85, "jpeg"
+            )
+            calls: List[int] = []
+            choose_quality(image, self.encoder(calls), target, 85, "jpeg")
+
+        assert len(data) * 8 <= 2.0 * image.width * image.height
+        assert len(jpeg(image, quality + 3)) * 8 > 2.0 * image.width * image.height
+        assert session.chosen["jpeg"] >= 95 - TOLERANCE
+        assert calls[0] == quality
+
+    def test_out_of_time_uses_configured_quality(self) -> None:
+        image = detailed()
+
+        with search_session(0):
+            data, quality = encode_adaptive(
+                image, jpeg, 85, QualityTarget("ssim", 0.99, 40, 95)
+            )
+
+        assert quality == 85
+        assert data == jpeg(image, 85)
+
+    def test_fixed_mode_encodes_once(self) -> None:
+        calls: List[int] = []
+
+        data, quality = encode_adaptive(
+            detailed(), lambda image, q: calls.append(q) or b"x", 70, None
+        )
+
+        assert (data, quality, calls) == (b"x", 70, [70])
+
+
+class TestQualitySettings:
+    def test_target_in_rendition_keys(self) -> None:
+        config = Settings(
+            quality_mode="ssim",
+            quality_target_ssim=0.9,
+            thumbnail_sizes="10x10,20x20:format=png",
+        )
+        jpeg_spec, png_spec = config.renditions
+
+        assert jpeg_spec.key == "10x10:jpeg:q85:ssim0.9-q40-95"
+        assert png_spec.target is None
+        assert parse_renditions("10x10", "jpeg", 85)[0].key == "10x10:jpeg:q85"
+        assert Settings().quality_target is None
+
+    @pytest.mark.parametrize(
+        "fields",
+        [
+            {"quality_mode": "best"},
+            {"quality_min": 90, "quality_max": 80},
+            {"quality_mode": "ssim", "quality_target_ssim": 1.5},
+            {"quality_mode": "size", "quality_target_bpp": 0},
+        ],
+    )
+    def test_invalid(self, fields) -> None:
+        with pytest.raises(ValueError):
+            Settings(**fields)
+
+
+class TestAdaptiveRenditions:
+    async def test_simple_image_gets_lower_quality(
+        self, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(settings, "thumbnail_sizes", "200x200")
+        monkeypatch.setattr(settings, "quality_mode", "ssim")
+        service = ImageProcessingService()
+        service.upload_dir = temp_upload_dir
+        service.original_dir = temp_upload_dir / "original"
+        service.thumbnails_dir = temp_upload_dir / "thumbnails"
+        flat = temp_upload_dir / "original" / "flat.png"
+        busy = temp_upload_dir / "original" / "busy.png"
+        Image.linear_gradient("L").resize((400, 400)).convert("RGB").save(flat)
+        detailed((400, 400)).save(busy)
+
+        with search_session(10):
+            simple = await service.create_renditions(str(flat))
+        with search_session(10):
+            complex_ = await service.create_renditions(str(busy))
+
+        assert simple["200x200"]["quality"] < complex_["200x200"]["quality"]
+        assert simple["200x200"]["key"].endswith(settings.renditions[0].target.key)
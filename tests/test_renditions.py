@@ -0,0 +1,90 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.config import RenditionSpec, settings
+from app.services.image_processing import ImageProcessingService
+from app.services.renditions import crop_box, intermediate_size, render
+
+
+def spec(width: int, height: int, **options: str) -> RenditionSpec:
+    return RenditionSpec(width, height, **options)
+
+
+class TestGeometry:
+    def test_intermediate_sizes(self) -> None:
+        assert intermediate_size((1600, 900), spec(100, 100)) == (100, 56)
+        assert intermediate_size((1600, 900), spec(100, 100, mode="fill")) == (178, 100)
+        assert intermediate_size((1600, 900), spec(100, 100, mode="pad")) == (100, 56)
+        # fit never upscales, fill does
+        assert intermediate_size((50, 40), spec(100, 100)) == (50, 40)
+        assert intermediate_size((50, 40), spec(100, 100, mode="fill")) == (125, 100)
+
+    @pytest.mark.parametrize("mode", ["fill", "pad"])
+    def test_exact_size_modes(self, mode: str) -> None:
+        image = Image.new("RGB", (1600, 900), "red")
+
+        _, rendition = render(image, image.size, spec(100, 100, mode=mode))
+
+        assert rendition.size == (100, 100)
+
+    def test_pad_uses_background(self) -> None:
+        image = Image.new("RGB", (1600, 900), "red")
+
+        _, rendition = render(
+            image, image.size, spec(100, 100, mode="pad", background="0000ff")
+        )
+
+        assert rendition.getpixel((50, 5)) == (0, 0, 255)
+        assert rendition.getpixel((50, 50)) == (255, 0, 0)
+
+    def test_entropy_crop_keeps_detail(self) -> None:
+        image = Image.new("RGB", (300, 100), "white")
+        draw = ImageDraw.Draw(image)
+        for x in range(220, 300, 4):
+            draw.line([(x, 0), (x, 100)], fill="black", width=2)
+
+        left, top, right, bottom = crop_box(
+            image, spec(100, 100, mode="fill", crop="entropy")
+        )
+
+        assert (right - left, bottom - top) == (100, 100)
+        assert left >= 180
+        assert crop_box(image, spec(100, 100, mode="fill"))[0] == 100
+
+
+class TestRenditionModes:
+    @pytest.fixture
+    def service(self, temp_upload_dir: Path) -> ImageProcessingService:
+        service = ImageProcessingService()
+        service.upload_dir = temp_upload_dir
+        service.original_dir = temp_upload_dir / "original"
+        service.thumbnails_dir = temp_upload_dir / "thumbnails"
+        return service
+
+    async def test_modes_per_size(
+        self, service: ImageProcessingService, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr(
+            settings,
+            "thumbnail_sizes",
+            "64x64:mode=fill:crop=entropy,120x120:mode=pad,400x400",
+        )
+        source = temp_upload_dir / "original" / "wide.jpg"
+        Image.new("RGB", (1600, 900), "green").save(source, "JPEG")
+
+        renditions = await service.create_renditions(str(source))
+
+        assert renditions["64x64"]["mode"] == "fill"
+        assert renditions["64x64"]["key"].endswith(":fill-entropy")
+        sizes = {}
+        for label, info in renditions.items():
+            with Image.open(temp_upload_dir / info["path"]) as img:
+                sizes[label] = img.size
+            assert (info["width"], info["height"]) == sizes[label]
+        assert sizes == {
+            "64x64": (64, 64),
+            "120x120": (120, 120),
+            "400x400": (400, 225),
+        }
@@ -0,0 +1,352 @@
+import asyncio
+from collections import Counter
+from typing import Iterable, List
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import Settings, parse_tenant_weights, settings
+from app.services.memory import decode_bytes, inspect_decode_bytes
+from app.services.tenancy import (
+    DEFAULT_TENANT,
+    LARGE_QUEUE,
+    lane_for,
+    lane_weights,
+    normalise_tenant,
+    record_lanes,
+    request_tenant,
+    retire_lanes,
+    tenant_queue,
+)
+from app.worker.scheduling import FairScheduler, SmoothWeightedRoundRobin
+
+
+class FakeMessage:
+    def __init__(self, routing_key: str, name: str = "", cost: int = 0) -> None:
+        self.routing_key = routing_key
+        self.name = name
+        self.cost = cost
+        self.requeued = False
+
+    async def reject(self, requeue: bool = False) -> None:
+        self.requeued = requeue
+
+
+class TestTenants:
+    def test_parse_weights(self) -> None:
+        assert parse_tenant_weights(" acme=4, bulk=1,") == (("acme", 4), ("bulk", 1))
+
+    @pytest.mark.parametrize("value", ["acme", "acme=0", "acme=x", "../x=1", "a b=2"])
+    def test_invalid_weights_are_rejected(self, value: str) -> None:
+        with pytest.raises(ValueError):
+            parse_tenant_weights(value)
+        with pytest.raises(ValidationError):
+            Settings(tenant_weights=value)
+
+    def test_normalise(self) -> None:
+        assert normalise_tenant(None) == DEFAULT_TENANT
+        assert normalise_tenant(" acme ") == "acme"
+        with pytest.raises(ValueError):
+            normalise_tenant("acme/../other")
+
+    def test_tenant_header_needs_the_proxy_secret(self, monkeypatch) -> None:
+        named = {"X-Tenant-ID": "acme"}
+        monkeypatch.setattr(settings, "tenant_secret", "")
+        assert request_tenant({**named, "X-Tenant-Secret": ""}) == DEFAULT_TENANT
+
+        monkeypatch.setattr(settings, "tenant_secret", "s3cret")
+        assert request_tenant(named) == DEFAULT_TENANT
+        assert request_tenant({**named, "X-Tenant-Secret": "guess"}) == DEFAULT_TENANT
+        assert request_tenant({**named, "X-Tenant-Secret": "s3cret"}) == "acme"
+        assert request_tenant({"X-Tenant-Secret": "s3cret"}) == DEFAULT_TENANT
+        with pytest.raises(ValueError):
+            request_tenant({"X-Tenant-ID": "a/b", "X-Tenant-Secret": "s3cret"})
+
+    def test_lanes(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "queue_shards", 4)
+        monkeypatch.setattr(settings, "tenant_weights", "vip=5")
+
+        shared = {lane_for(f"tenant-{i}").queue for i in range(50)}
+
+        assert shared <= {"images", "images.1", "images.2", "images.3"}
+        assert len(shared) > 1
+        assert lane_for("tenant-7") == lane_for("tenant-7")
+        assert lane_for("vip").queue == tenant_queue("vip")
+        assert lane_weights() == {
+            "images": 1,
+            "images.1": 1,
+            "images.2": 1,
+            "images.3": 1,
+            "images.tenant.vip": 5,
+            "images.large": 1,
+        }
+
+    def test_large_images_get_their_own_lane(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "large_image_min_bytes", 1000)
+
+        assert lane_for("vip", 1000).queue == LARGE_QUEUE
+        assert lane_for("vip", 999) == lane_for("vip")
+        assert lane_for("vip", None) == lane_for("vip")
+
+        monkeypatch.setattr(settings, "large_image_min_bytes", 0)
+        assert lane_for("vip", 10**12) == lane_for("vip")
+        assert LARGE_QUEUE not in lane_weights()
+
+
+class FakeBroker:
+    def __init__(self, empty: Iterable[str] = ()) -> None:
+        self.empty = set(empty)
+        self.adopted: List[str] = []
+
+    async def adopt_queues(self, names: Iterable[str]) -> List[str]:
+        names = list(names)
+        self.adopted += [name for name in names if name not in self.empty]
+        return [name for name in names if name in self.empty]
+
+
+class TestLaneLayout:
+    async def test_retired_lanes_are_consumed_until_empty(
+        self, test_engine, monkeypatch
+    ) -> None:
+        sessions = async_sessionmaker(
+            test_engine, class_=AsyncSession, expire_on_commit=False
+        )
+        monkeypatch.setattr(settings, "large_image_min_bytes", 0)
+        monkeypatch.setattr(settings, "queue_shards", 3)
+        assert await record_lanes(sessions) == []
+
+        monkeypatch.setattr(settings, "queue_shards", 1)
+        broker = FakeBroker()
+        await retire_lanes(broker, sessions)
+        assert broker.adopted == ["images.1", "images.2"]
+
+        broker = FakeBroker(empty=["images.1"])
+        await retire_lanes(broker, sessions)
+        assert broker.adopted == ["images.2"]
+        assert await record_lanes(sessions) == ["images.2"]
+
+
+class TestWeightedRoundRobin:
+    def test_proportional_and_interleaved(self) -> None:
+        policy = SmoothWeightedRoundRobin({"a": 3, "b": 1})
+
+        picks = [policy.pick(["a", "b"]) for _ in range(8)]
+
+        assert Counter(picks) == {"a": 6, "b": 2}
+        assert "a" in picks[:2] and "b" in picks[:4]
+
+    def test_idle_lanes_are_skipped(self) -> None:
+        policy = SmoothWeightedRoundRobin({"a": 1, "b": 1})
+
+        assert [policy.pick(["a"]) for _ in range(3)] == ["a", "a", "a"]
+        assert policy.pick(["a", "b"]) in ("a", "b")
+
+
+class TestFairScheduler:
+    async def test_bulk_lane_does_not_starve_others(self) -> None:
+        order: List[str] = []
+
+        async def handler(message: FakeMessage) -> None:
+            order.append(message.routing_key)
+            await asyncio.sleep(0)
+
+        scheduler = FairScheduler(
+            handler, lambda: {"images": 1, "images.1": 1}, lambda: 1
+        )
+        for i in range(20):
+            await scheduler.submit(FakeMessage("images", f"bulk-{i}"))
+        await scheduler.submit(FakeMessage("images.1", "interactive"))
+        scheduler.start()
+
+        for _ in range(200):
+            if len(order) == 21:
+                break
+            await asyncio.sleep(0)
+        await scheduler.stop()
+
+        assert len(order) == 21
+        assert order.index("images.1") <= 1
+
+    async def test_weights_are_read_at_dispatch(self) -> None:
+        order: List[str] = []
+        weights = {"images": 1, "images.1": 1}
+
+        async def handler(message: FakeMessage) -> None:
+            order.append(message.routing_key)
+
+        scheduler = FairScheduler(handler, lambda: weights, lambda: 1)
+        # A reload after the scheduler was built.
+        weights = {"images": 3, "images.1": 1}
+        for i in range(4):
+            await scheduler.submit(FakeMessage("images", f"a-{i}"))
+            await scheduler.submit(FakeMessage("images.1", f"b-{i}"))
+        scheduler.start()
+
+        for _ in range(200):
+            if len(order) == 4:
+                break
+            await asyncio.sleep(0)
+        await scheduler.stop()
+
+        assert order[:4].count("images") == 3
+
+    async def test_slots_limit_running_jobs(self) -> None:
+        running = peak = 0
+        release = asyncio.Event()
+
+        async def handler(message: FakeMessage) -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+        scheduler = FairScheduler(handler, lambda: {"images": 1}, lambda: 2)
+        scheduler.start()
+        for _ in range(5):
+            await scheduler.submit(FakeMessage("images"))
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert peak == 2
+        assert scheduler.buffered == {"images": 3}
+
+        release.set()
+        for _ in range(50):
+            await asyncio.sleep(0)
+        assert scheduler.buffered == {"images": 0}
+        await scheduler.stop()
+
+    async def test_stop_requeues_buffered(self) -> None:
+        async def handler(message: FakeMessage) -> None:
+            raise AssertionError("not started")
+
+        scheduler = FairScheduler(
+            handler, lambda: {"images": 1, "images.1": 1}, lambda: 1
+        )
+        messages = [
+            FakeMessage("images"),
+            FakeMessage("image_processing"),
+            FakeMessage("images.1"),
+        ]
+        for message in messages:
+            await scheduler.submit(message)
+
+        assert scheduler.buffered == {"images": 2, "images.1": 1}
+        assert await scheduler.stop() == 3
+        assert all(message.requeued for message in messages)
+
+
+async def message_cost(message: FakeMessage) -> int:
+    return message.cost
+
+
+class TestMemoryBudget:
+    async def run(
+        self, messages: List[FakeMessage], budget: int, slots: int = 4
+    ) -> List[List[str]]:
+        """Start ``messages`` and return the names running together at each step."""
+        running: List[str] = []
+        steps: List[List[str]] = []
+        release = asyncio.Event()
+
+        async def handler(message: FakeMessage) -> None:
+            running.append(message.name)
+            await release.wait()
+            running.remove(message.name)
+
+        scheduler = FairScheduler(
+            handler,
+            lambda: {"images": 1},
+            lambda: slots,
+            budget=lambda: budget,
+            cost=message_cost,
+        )
+        for message in messages:
+            await scheduler.submit(message)
+        scheduler.start()
+        for _ in range(len(messages)):
+            for _ in range(10):
+                await asyncio.sleep(0)
+            steps.append(sorted(running))
+            # Finish one step's jobs, then let the next ones start.
+            release.set()
+            await asyncio.sleep(0)
+            release.clear()
+        await scheduler.stop()
+        return [step for step in steps if step]
+
+    async def test_jobs_wait_for_budget_in_order(self) -> None:
+        messages = [
+            FakeMessage("images", "a", 60),
+            FakeMessage("images", "b", 30),
+            FakeMessage("images", "c", 50),
+            FakeMessage("images", "d", 10),
+        ]
+
+        steps = await self.run(messages, budget=100)
+
+        # c does not fit next to a and b, and d is not started ahead of it.
+        assert steps == [["a", "b"], ["c", "d"]]
+
+    async def test_oversized_job_runs_alone(self) -> None:
+        messages = [
+            FakeMessage("images", "small", 10),
+            FakeMessage("images", "huge", 500),
+            FakeMessage("images", "after", 10),
+        ]
+
+        steps = await self.run(messages, budget=100)
+
+        assert steps == [["small"], ["huge"], ["after"]]
+
+    async def test_no_budget(self) -> None:
+        messages = [FakeMessage("images", name, 500) for name in "abc"]
+
+        assert await self.run(messages, budget=0) == [["a", "b", "c"]]
+
+
+class TestMemoryEstimate:
+    def test_from_header(self, tmp_path) -> None:
+        from PIL import Image
+
+        path = tmp_path / "flat.png"
+        Image.new("RGB", (2000, 1000)).save(path)
+
+        assert (
+            inspect_decode_bytes(str(path))
+            == decode_bytes(2000, 1000, "RGB")
+            == 2000 * 1000 * 4 * 2
+        )
+        assert decode_bytes(10, 10, "L") < decode_bytes(10, 10, "I")
+        assert inspect_decode_bytes(str(tmp_path / "missing.png")) is None
+
+    async def test_worker_prefers_message_estimate(self, tmp_path) -> None:
+        import json
+
+        from PIL import Image
+
+        from app.worker.processor import ImageProcessor
+
+        path = tmp_path / "a.png"
+        Image.new("L", (100, 100)).save(path)
+
+        class Delivery:
+            def __init__(self, data: dict) -> None:
+                self.body = json.dumps(data).encode()
+
+        assert (
+            await ImageProcessor.memory_estimate(Delivery({"original_path": str(path)}))
+            == 100 * 100 * 2
+        )
+        assert (
+            await ImageProcessor.memory_estimate(
+                Delivery({"original_path": str(path), "decode_bytes": 5})
+            )
+            == 5
+        )
+        assert (
+            await ImageProcessor.memory_estimate(Delivery({"original_path": "/nope"}))
+            == 0
+        )
@@ -0,0 +1,44 @@
+import os
+
+from app.api import server
+from app.config import settings
+
+
+class TestServerConfig:
+    def test_explicit_worker_count(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "api_workers", 3)
+        monkeypatch.setattr(settings, "api_reload", False)
+
+        assert server.build_config()["workers"] == 3
+
+    def test_zero_workers_uses_available_cpus(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "api_workers", 0)
+
+        assert server.resolve_worker_count() >= 1
+
+    def test_reload_forces_single_process(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "api_workers", 4)
+        monkeypatch.setattr(settings, "api_reload", True)
+
+        config = server.build_config()
+
+        assert config["workers"] == 1
+        assert config["reload"] is True
+
+    def test_missing_implementation_falls_back(self, monkeypatch) -> None:
+        monkeypatch.setattr(server, "_available", lambda module: False)
+
+        assert server.resolve_implementation("auto", "uvloop", "asyncio") == "asyncio"
+        assert server.resolve_implementation("uvloop", "uvloop", "asyncio") == "asyncio"
+        assert server.resolve_implementation("h11", "httptools", "h11") == "h11"
+
+    def test_several_workers_share_a_metrics_dir(self, monkeypatch) -> None:
+        monkeypatch.setattr(settings, "api_workers", 3)
+        monkeypatch.setattr(settings, "api_reload", False)
+        monkeypatch.setattr(settings, "metrics_dir", "")
+        monkeypatch.setenv("METRICS_DIR", "")
+        monkeypatch.setattr(server.uvicorn, "run", lambda *args, **kwargs: None)
+
+        server.run()
+
+        assert os.path.isdir(os.environ["METRICS_DIR"])
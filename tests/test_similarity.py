@@ -0,0 +1,154 @@
+import io
+from pathlib import Path
+from typing import Any
+
+import pytest
+from PIL import Image, ImageDraw
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models.image import Image as ImageRow
+from app.models.image import ImageStatus
+from app.services.image_processing import ImageProcessingService
+from app.services.similarity import (
+    MAX_SEARCH_DISTANCE,
+    band_neighbours,
+    bands,
+    dhash,
+    find_similar,
+    from_signed,
+    hamming,
+    hash_columns,
+    to_signed,
+)
+
+
+def photo(size=(640, 480)) -> Image.Image:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.ellipse((width * 0.1, height * 0.2, width * 0.5, height * 0.9), fill="navy")
+    draw.rectangle(
+        (width * 0.6, height * 0.1, width * 0.9, height * 0.5), fill="orange"
+    )
+    draw.line((0, height, width, 0), fill="black", width=max(1, width // 40))
+    return image
+
+
+def reencode(image: Image.Image, quality: int) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+class TestHash:
+    def test_survives_resize_and_reencode(self) -> None:
+        original = dhash(photo())
+
+        assert hamming(original, dhash(photo().resize((160, 120)))) <= 4
+        assert hamming(original, dhash(reencode(photo(), 30))) <= 4
+
+    def test_different_images_are_far_apart(self) -> None:
+        assert (
+            hamming(
+                dhash(photo()),
+                dhash(photo().transpose(Image.Transpose.FLIP_LEFT_RIGHT)),
+            )
+            > 12
+        )
+
+    def test_column_encoding(self) -> None:
+        value = 0xFEDCBA9876543210
+
+        assert from_signed(to_signed(value)) == value
+        assert to_signed(value) < 0
+        assert bands(value) == (0x3210, 0x7654, 0xBA98, 0xFEDC)
+        assert hash_columns(value)["phash_band3"] == 0xFEDC
+        assert hash_columns(None)["phash"] is None
+
+    def test_band_neighbours(self) -> None:
+        assert band_neighbours(5, 0) == [5]
+        neighbours = band_neighbours(5, 2)
+        assert len(neighbours) == 1 + 16 + 120
+        assert all(hamming(5, value) <= 2 for value in neighbours)
+
+
+class TestFindSimilar:
+    @pytest.fixture
+    async def images(self, test_engine) -> Any:
+        factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+        base = 0x0F0F_F0F0_3C3C_A5A5
+        hashes = {
+            "same": base,
+            "near": base ^ 0b1011,  # distance 3, all in band 0
+            "spread": base ^ (1 | 1 << 16 | 1 << 32 | 1 << 48 | 1 << 49),  # distance 5
+            "far": base ^ 0xFFFF_FFFF,
+        }
+        rows = {
+            name: ImageRow(
+                original_filename=f"{name}.jpg",
+                original_path=f"original/{name}.jpg",
+                status=ImageStatus.DONE,
+                **hash_columns(value),
+            )
+            for name, value in hashes.items()
+        }
+        rows["pending"] = ImageRow(
+            original_filename="pending.jpg",
+            original_path="original/p.jpg",
+            status=ImageStatus.PROCESSING,
+            **hash_columns(base),
+        )
+        async with factory() as db:
+            db.add_all(rows.values())
+            await db.commit()
+        yield factory, base, rows
+        async with factory() as db:
+            await db.execute(
+                delete(ImageRow).where(
+                    ImageRow.id.in_([row.id for row in rows.values()])
+                )
+            )
+            await db.commit()
+
+    async def test_finds_within_distance(self, images: Any) -> None:
+        factory, base, rows = images
+
+        async with factory() as db:
+            matches = await find_similar(db, base, 6, 10, exclude=rows["same"].id)
+
+        assert [(row.id, distance) for row, distance in matches] == [
+            (rows["near"].id, 3),
+            (rows["spread"].id, 5),
+        ]
+
+    async def test_respects_limit_and_distance(self, images: Any) -> None:
+        factory, base, rows = images
+
+        async with factory() as db:
+            assert [row.id for row, _ in await find_similar(db, base, 4, 1)] == [
+                rows["same"].id
+            ]
+            with pytest.raises(ValueError):
+                await find_similar(db, base, MAX_SEARCH_DISTANCE + 1, 10)
+
+
+class TestRenditionHash:
+    async def test_hash_matches_with_and_without_reuse(
+        self, temp_upload_dir: Path
+    ) -> None:
+        service = ImageProcessingService()
+        service.upload_dir = temp_upload_dir
+        service.original_dir = temp_upload_dir / "original"
+        service.thumbnails_dir = temp_upload_dir / "thumbnails"
+        source = temp_upload_dir / "original" / "photo.jpg"
+        photo((1600, 1200)).save(source, "JPEG")
+
+        _, rendered = await service.create_renditions_with_analysis(str(source))
+        _, reused = await service.create_renditions_with_analysis(str(source))
+
+        assert rendered.phash is not None
+        assert hamming(rendered.phash, reused.phash) <= 4
+        assert hamming(rendered.phash, dhash(photo())) <= 4
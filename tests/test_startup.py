@@ -0,0 +1,28 @@
+import pytest
+
+from benchmarks.startup import (
+    ENTRY_POINTS,
+    STARTUP_BUDGET_SECONDS,
+    measure_import,
+    profile_import,
+)
+
+
+class TestStartup:
+    @pytest.mark.parametrize("module", ENTRY_POINTS)
+    def test_entry_point_defers_heavy_imports(self, module: str) -> None:
+        profile = profile_import(module)
+
+        assert profile.loaded_deferred == [], (
+            f"{module} imports {profile.loaded_deferred} at start-up; "
+            f"slowest imports: {profile.slowest}"
+        )
+
+    @pytest.mark.parametrize("module", ENTRY_POINTS)
+    def test_entry_point_within_budget(self, module: str) -> None:
+        seconds = measure_import(module, repeat=3)
+
+        assert seconds < STARTUP_BUDGET_SECONDS[module], (
+            f"importing {module} took {seconds:.3f}s, budget {STARTUP_BUDGET_SECONDS[module]}s; "
+            f"run `python -m benchmarks startup` for the slowest imports"
+        )
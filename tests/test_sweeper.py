@@ -0,0 +1,237 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models.image import Image, ImageStatus
+from app.services.tenancy import lane_for
+from app.worker.sweeper import Sweeper, file_stem, iter_batches
+
+
+def touch(path: Path, size: int = 10, age: float = 7200) -> Path:
+    path.write_bytes(b"x" * size)
+    past = time.time() - age
+    os.utime(path, (past, past))
+    return path
+
+
+class TestScanning:
+    def test_file_stem(self) -> None:
+        image_id = str(uuid.uuid4())
+
+        assert file_stem(f"{image_id}.png") == image_id
+        assert file_stem(f"{image_id}_100x100_ab12cd34.jpg") == image_id
+        assert file_stem(f".{image_id}.jpg.1a2b3c4d.tmp") is None
+
+    def test_batches(self, temp_upload_dir: Path) -> None:
+        for index in range(5):
+            touch(temp_upload_dir / "original" / f"{uuid.uuid4()}.jpg")
+        touch(temp_upload_dir / "thumbnails" / f"{uuid.uuid4()}_1x1_00000000.jpg")
+
+        batches = list(
+            iter_batches(
+                [temp_upload_dir / "original", temp_upload_dir / "thumbnails"], 2
+            )
+        )
+
+        assert [len(batch) for batch in batches] == [2, 2, 2]
+
+
+class TestSweeper:
+    @pytest.fixture
+    async def tree(self, test_engine, temp_upload_dir: Path) -> Any:
+        factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+        original, thumbnails = (
+            temp_upload_dir / "original",
+            temp_upload_dir / "thumbnails",
+        )
+        old = datetime.utcnow() - timedelta(days=30)
+
+        done, failed, stuck, lost, legacy = (uuid.uuid4() for _ in range(5))
+        legacy_stem = uuid.uuid4()
+        rows = [
+            Image(
+                id=done,
+                original_filename="done.jpg",
+                status=ImageStatus.DONE,
+                original_path=f"original/{done}_compressed.jpg",
+                thumbnails={"100x100": f"thumbnails/{done}_100x100_aaaaaaaa.jpg"},
+            ),
+            Image(
+                id=failed,
+                original_filename="failed.jpg",
+                status=ImageStatus.ERROR,
+                original_path=str(original / f"{failed}.jpg"),
+                updated_at=old,
+            ),
+            Image(
+                id=stuck,
+                original_filename="stuck.jpg",
+                status=ImageStatus.PROCESSING,
+                original_path=str(original / f"{stuck}.jpg"),
+                updated_at=old,
+            ),
+            Image(
+                id=lost,
+                original_filename="lost.jpg",
+                status=ImageStatus.PROCESSING,
+                original_path=str(original / f"{lost}.jpg"),
+                updated_at=old,
+            ),
+            Image(
+                id=legacy,
+                original_filename="legacy.jpg",
+                status=ImageStatus.DONE,
+                original_path=f"original/{legacy_stem}_compressed.jpg",
+            ),
+        ]
+        files = {
+            "kept_original": touch(original / f"{done}_compressed.jpg"),
+            "kept_thumbnail": touch(thumbnails / f"{done}_100x100_aaaaaaaa.jpg"),
+            "stale_thumbnail": touch(
+                thumbnails / f"{done}_100x100_bbbbbbbb.jpg", size=100
+            ),
+            "leftover_upload": touch(original / f"{done}.jpg", size=1000),
+            "failed_original": touch(original / f"{failed}.jpg"),
+            "failed_partial": touch(thumbnails / f"{failed}_100x100_aaaaaaaa.jpg"),
+            "stuck_original": touch(original / f"{stuck}.jpg"),
+            "stuck_partial": touch(thumbnails / f"{stuck}_100x100_aaaaaaaa.jpg"),
+            "legacy_original": touch(original / f"{legacy_stem}_compressed.jpg"),
+            "orphan": touch(original / f"{uuid.uuid4()}.png", size=5000),
+            "young_orphan": touch(original / f"{uuid.uuid4()}.png", age=10),
+            "temporary": touch(
+                thumbnails / f".{uuid.uuid4()}_1x1_00000000.jpg.1a2b3c4d.tmp"
+            ),
+            "unknown": touch(original / "README"),
+        }
+        async with factory() as db:
+            db.add_all(rows)
+            await db.commit()
+        yield factory, temp_upload_dir, rows, files
+        async with factory() as db:
+            await db.execute(
+                delete(Image).where(Image.id.in_([row.id for row in rows]))
+            )
+            await db.commit()
+
+    async def test_sweep(self, tree: Any) -> None:
+        factory, upload_dir, rows, files = tree
+        published: List[Dict[str, Any]] = []
+
+        async def publish(message: Dict[str, Any]) -> None:
+            published.append(message)
+
+        report = await Sweeper(
+            publish, session_factory=factory, upload_dir=upload_dir, rate=0
+        ).run()
+
+        deleted = {name for name, path in files.items() if not path.exists()}
+        assert deleted == {
+            "stale_thumbnail",
+            "leftover_upload",
+            "failed_original",
+            "failed_partial",
+            "orphan",
+            "temporary",
+        }
+        assert report.deleted_files == 6
+        assert report.reclaimed_bytes == 100 + 1000 + 10 + 10 + 5000 + 10
+        assert report.deleted_by_reason == {
+            "unreferenced": 2,
+            "failed": 2,
+            "orphaned": 1,
+            "temporary": 1,
+        }
+
+        _, _, stuck, lost, _ = rows
+        assert [m["image_id"] for m in published] == [str(stuck.id)]
+        assert report.requeued == 1 and report.failed_rows == 1
+        async with factory() as db:
+            statuses = dict(
+                (
+                    await db.execute(
+                        select(Image.id, Image.status).where(
+                            Image.id.in_([stuck.id, lost.id])
+                        )
+                    )
+                ).all()
+            )
+        assert statuses == {
+            stuck.id: ImageStatus.PROCESSING,
+            lost.id: ImageStatus.ERROR,
+        }
+
+        # The retried job restarted its timeout, so it is not published again.
+        published.clear()
+        await Sweeper(
+            publish, session_factory=factory, upload_dir=upload_dir, rate=0
+        ).run()
+        assert published == []
+
+    async def test_dry_run_changes_nothing(self, tree: Any) -> None:
+        factory, upload_dir, rows, files = tree
+        published: List[Dict[str, Any]] = []
+
+        async def publish(message: Dict[str, Any]) -> None:
+            published.append(message)
+
+        report = await Sweeper(
+            publish,
+            session_factory=factory,
+            upload_dir=upload_dir,
+            rate=0,
+            dry_run=True,
+        ).run()
+
+        assert report.deleted_files == 6 and report.requeued == 1
+        assert all(path.exists() for path in files.values())
+        assert published == []
+
+    async def test_stuck_rows_wait_for_their_lane_to_drain(self, tree: Any) -> None:
+        factory, upload_dir, rows, files = tree
+        published: List[Dict[str, Any]] = []
+        backlog = {lane_for(None).queue: (5, 1)}
+
+        async def publish(message: Dict[str, Any]) -> None:
+            published.append(message)
+
+        async def lane_stats() -> Dict[str, Any]:
+            return backlog
+
+        sweeper = Sweeper(
+            publish, lane_stats, session_factory=factory, upload_dir=upload_dir, rate=0
+        )
+        report = await sweeper.run()
+
+        assert published == [] and report.deferred == 1
+
+        backlog = {lane_for(None).queue: (0, 1)}
+        report = await sweeper.run()
+        assert [m["image_id"] for m in published] == [
+            str(rows[2].id)
+        ] and report.requeued == 1
+
+    async def test_legacy_stems_are_scanned_once(self, tree: Any, monkeypatch) -> None:
+        factory, upload_dir, rows, files = tree
+        sweeper = Sweeper(session_factory=factory, upload_dir=upload_dir, rate=0)
+        scans = []
+        scan = sweeper._scan_legacy_stems
+
+        async def counted() -> Dict[str, Any]:
+            scans.append(1)
+            return await scan()
+
+        monkeypatch.setattr(sweeper, "_scan_legacy_stems", counted)
+
+        await sweeper.run()
+        await sweeper.run()
+
+        assert len(scans) == 1
+        assert files["legacy_original"].exists()
@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from app.utils.tracing import (
+    FileSpanExporter,
+    InMemorySpanExporter,
+    SpanContext,
+    Tracer,
+    extract,
+    inject,
+)
+
+
+class TestTracing:
+    @pytest.fixture
+    def exporter(self) -> InMemorySpanExporter:
+        return InMemorySpanExporter()
+
+    @pytest.fixture
+    def tracer(self, exporter: InMemorySpanExporter) -> Tracer:
+        return Tracer(service="test", exporter=exporter)
+
+    def test_traceparent_roundtrip(self) -> None:
+        context = SpanContext("0af7651916cd43dd8448eb211c80319c", "b7ad6b7169203331")
+
+        parsed = SpanContext.from_traceparent(context.to_traceparent())
+
+        assert parsed == context
+        assert SpanContext.from_traceparent("garbage") is None
+
+    def test_child_spans_share_trace(
+        self, tracer: Tracer, exporter: InMemorySpanExporter
+    ) -> None:
+        with tracer.start_as_current_span("parent") as parent:
+            with tracer.start_as_current_span("child") as child:
+                pass
+
+        assert child.context.trace_id == parent.context.trace_id
+        assert child.parent_id == parent.context.span_id
+        assert [span.name for span in exporter.spans] == ["child", "parent"]
+
+    def test_context_propagates_through_headers(
+        self, tracer: Tracer, exporter: InMemorySpanExporter
+    ) -> None:
+        headers: dict = {}
+        with tracer.start_as_current_span("publish") as publish:
+            inject(headers)
+
+        with tracer.start_as_current_span(
+            "consume", parent=extract(headers)
+        ) as consume:
+            pass
+
+        assert consume.context.trace_id == publish.context.trace_id
+        assert consume.parent_id == publish.context.span_id
+
+    def test_exception_marks_span_as_error(
+        self, tracer: Tracer, exporter: InMemorySpanExporter
+    ) -> None:
+        with pytest.raises(ValueError):
+            with tracer.start_as_current_span("failing"):
+                raise ValueError("boom")
+
+        assert exporter.spans[0].status == "ERROR"
+        assert exporter.spans[0].attributes["exception.message"] == "boom"
+
+    def test_file_exporter_writes_json_lines(self, tmp_path: Path) -> None:
+        path = tmp_path / "spans.jsonl"
+        tracer = Tracer(service="test", exporter=FileSpanExporter(str(path)))
+
+        with tracer.start_as_current_span("first"):
+            pass
+        with tracer.start_as_current_span("second"):
+            pass
+        tracer.shutdown()
+
+        spans = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [span["name"] for span in spans] == ["first", "second"]
+        assert all(span["service"] == "test" for span in spans)
+
+    def test_file_exporter_writes_off_the_caller_thread(self, tmp_path: Path) -> None:
+        path = tmp_path / "spans.jsonl"
+        exporter = FileSpanExporter(str(path), max_delay=60.0)
+        tracer = Tracer(service="test", exporter=exporter)
+
+        with tracer.start_as_current_span("queued"):
+            pass
+        assert not path.exists()
+
+        tracer.shutdown()
+        assert not exporter._thread.is_alive()
+        assert [json.loads(line)["name"] for line in path.read_text().splitlines()] == [
+            "queued"
+        ]
@@ -0,0 +1,193 @@
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import pytest
+from PIL import Image as PILImage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.models.image import Image, ImageStatus
+from app.worker.processor import ImageProcessor
+
+
+class TestProcessorDrain:
+    async def test_drain_waits_for_fast_jobs_and_cancels_slow_ones(self) -> None:
+        processor = ImageProcessor()
+        finished = []
+
+        async def job(seconds: float) -> None:
+            await asyncio.sleep(seconds)
+            finished.append(seconds)
+
+        fast = asyncio.create_task(job(0.01))
+        slow = asyncio.create_task(job(10))
+        processor._active.update({fast, slow})
+
+        cancelled = await processor.drain(timeout=0.2)
+
+        assert cancelled == 1
+        assert finished == [0.01]
+        assert slow.cancelled()
+
+    async def test_drain_without_jobs_returns_immediately(self) -> None:
+        assert await ImageProcessor().drain(timeout=5) == 0
+
+
+class TestProcessorTimestamps:
+    async def test_updated_at_follows_the_job(
+        self, test_engine, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        from app.services.image_processing import image_processing_service
+
+        monkeypatch.setattr("app.models.database._engine", test_engine)
+        monkeypatch.setattr(settings, "upload_dir", str(temp_upload_dir))
+        monkeypatch.setattr(settings, "thumbnail_sizes", "16x16")
+        monkeypatch.setattr(settings, "worker_heartbeat_interval", 0.01)
+        monkeypatch.setattr(image_processing_service, "upload_dir", temp_upload_dir)
+        monkeypatch.setattr(
+            image_processing_service, "thumbnails_dir", temp_upload_dir / "thumbnails"
+        )
+        factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+        original = temp_upload_dir / "original" / "job.png"
+        PILImage.new("RGB", (32, 32), "blue").save(original)
+        old = datetime.utcnow() - timedelta(hours=1)
+        row = Image(
+            original_filename="job.png",
+            original_path=str(original),
+            status=ImageStatus.NEW,
+            updated_at=old,
+        )
+        async with factory() as db:
+            db.add(row)
+            await db.commit()
+
+        async def stamp() -> Tuple[ImageStatus, datetime]:
+            async with factory() as db:
+                return (
+                    await db.execute(
+                        select(Image.status, Image.updated_at).where(Image.id == row.id)
+                    )
+                ).one()
+
+        seen: List[Tuple[ImageStatus, datetime]] = []
+        render = image_processing_service.create_renditions_with_analysis
+
+        async def slow_render(path: str, specs: Any) -> Any:
+            seen.append(await stamp())
+            await asyncio.sleep(0.1)
+            seen.append(await stamp())
+            return await render(path, specs)
+
+        monkeypatch.setattr(
+            image_processing_service, "create_renditions_with_analysis", slow_render
+        )
+
+        assert await ImageProcessor()._process_image(row.id, str(original), "job.png")
+
+        (started_status, started), (_, heartbeat) = seen
+        done_status, done = await stamp()
+        assert started_status == ImageStatus.PROCESSING and started > old
+        assert heartbeat > started
+        assert done_status == ImageStatus.DONE and done >= heartbeat
+
+    async def test_key_and_renditions_use_one_settings_snapshot(
+        self, test_engine, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        from app.services.image_processing import (
+            image_processing_service,
+            renditions_fingerprint,
+        )
+
+        monkeypatch.setattr("app.models.database._engine", test_engine)
+        monkeypatch.setattr(settings, "upload_dir", str(temp_upload_dir))
+        monkeypatch.setattr(settings, "thumbnail_sizes", "16x16")
+        monkeypatch.setattr(image_processing_service, "upload_dir", temp_upload_dir)
+        monkeypatch.setattr(
+            image_processing_service, "thumbnails_dir", temp_upload_dir / "thumbnails"
+        )
+        original = temp_upload_dir / "original" / "snap.png"
+        PILImage.new("RGB", (32, 32), "green").save(original)
+        row = Image(
+            original_filename="snap.png",
+            original_path=str(original),
+            status=ImageStatus.NEW,
+        )
+        factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as db:
+            db.add(row)
+            await db.commit()
+        specs = settings.renditions
+        render = image_processing_service.create_renditions_with_analysis
+
+        async def reload_mid_job(path: str, job_specs: Any) -> Any:
+            # A reload lands while the job renders.
+            settings.thumbnail_sizes = "24x24"
+            return await render(path, job_specs)
+
+        monkeypatch.setattr(
+            image_processing_service, "create_renditions_with_analysis", reload_mid_job
+        )
+
+        assert await ImageProcessor()._process_image(row.id, str(original), "snap.png")
+
+        async with factory() as db:
+            key, thumbnails = (
+                await db.execute(
+                    select(Image.idempotency_key, Image.thumbnails).where(
+                        Image.id == row.id
+                    )
+                )
+            ).one()
+        assert key == f"{row.id}:{renditions_fingerprint(specs)}"
+        assert set(thumbnails) == {"16x16"}
+
+    async def test_failed_job_is_marked_through_pruned_lookup(
+        self, test_engine, temp_upload_dir: Path, monkeypatch
+    ) -> None:
+        monkeypatch.setattr("app.models.database._engine", test_engine)
+        monkeypatch.setattr(settings, "upload_dir", str(temp_upload_dir))
+        factory = sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+        old = datetime.utcnow() - timedelta(hours=1)
+        row = Image(
+            original_filename="gone.png",
+            original_path="original/gone.png",
+            status=ImageStatus.NEW,
+            updated_at=old,
+        )
+        async with factory() as db:
+            db.add(row)
+            await db.commit()
+
+        statements: List[str] = []
+        execute = AsyncSession.execute
+
+        async def record(
+            self: AsyncSession, statement: Any, *args: Any, **kwargs: Any
+        ) -> Any:
+            statements.append(str(statement))
+            return await execute(self, statement, *args, **kwargs)
+
+        monkeypatch.setattr(AsyncSession, "execute", record)
+
+        with pytest.raises(FileNotFoundError):
+            await ImageProcessor()._process_image(
+                row.id, str(temp_upload_dir / "original" / "gone.png"), "gone.png"
+            )
+
+        async with factory() as db:
+            status, message, updated = (
+                await db.execute(
+                    select(Image.status, Image.error_message, Image.updated_at).where(
+                        Image.id == row.id
+                    )
+                )
+            ).one()
+        error_update = next(
+            sql for sql in statements if "error_message = :error_message" in sql
+        )
+        assert "created_at >= :created_from" in error_update
+        assert status == ImageStatus.ERROR and "gone.png" in message and updated > old